@@ -0,0 +1,172 @@
+# Este archivo es parte de digitalizadora-films
+#
+# Este software está licenciado bajo la Licencia Pública General GNU v3.0 o superior.
+# Una copia de la licencia se incluye en el archivo `LICENSE` de este directorio.
+# También está disponible en línea en: <https://www.gnu.org/licenses/gpl-3.0.html>.
+
+'''
+Benchmarks de la alineación de la perforación. No necesita cámara ni impresora.
+
+Uso:
+    python3 benchmark_alineacion.py [--repeticiones N] [--cuadros N] [--escala-paso F] [--max-p99 N]
+
+Con --max-p99 termina con código 1 si algún escenario necesita más intentos (p99)
+para alinear, así un cambio en la detección se puede validar con números.
+'''
+
+import argparse
+import sys
+import timeit
+
+import cv2
+import numpy as np
+
+from perforacion import AnalizadorPerforacion
+from simulacion import ESCENARIOS, FORMATOS_SIMULADOS, AlineacionSimulada
+
+# Tamaño de la vista previa (alto, ancho), zona de análisis (xi, xf, yi, yf) y umbrales
+# con los mismos valores que usa CamApp para cada formato
+FORMATOS = FORMATOS_SIMULADOS
+
+
+def alinear_perforacion_original(image_rgb, zona, umbral_grey):
+    '''Conteo de píxeles blancos tal como lo hacía alinear_perforacion (imagen completa a gris)'''
+    xi, xf, yi, yf = zona
+    gray = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2GRAY)
+    zona_1 = gray[yi:yf, xi:xf]
+    _, thresh = cv2.threshold(zona_1, umbral_grey, 255, cv2.THRESH_BINARY)
+    return cv2.countNonZero(thresh)
+
+
+def preview_de_prueba(alto, ancho, zona, semilla=0):
+    '''Vista previa con ruido y una perforación blanca cubriendo media zona'''
+    generador = np.random.default_rng(semilla)
+    imagen = generador.integers(0, 200, size=(alto, ancho, 3), dtype=np.uint8)
+    xi, xf, yi, yf = zona
+    imagen[yi + (yf - yi) // 2:yf, xi:xf] = 255
+    return imagen
+
+
+def benchmark_analisis(repeticiones):
+    '''Compara el análisis ROI primero contra la función original en cada formato'''
+    print("Análisis de la zona de perforación (µs por vista previa)")
+    print(f"{'formato':<8}{'preview':>12}{'original':>12}{'roi':>12}{'mejora':>10}")
+    for formato, datos in FORMATOS.items():
+        alto, ancho = datos["preview"]
+        imagen = preview_de_prueba(alto, ancho, datos["zona"])
+        analizador = AnalizadorPerforacion(datos["zona"], datos["umbral_grey"], datos["umbral_px_blancos"])
+
+        esperado = alinear_perforacion_original(imagen, datos["zona"], datos["umbral_grey"])
+        obtenido = analizador.contar_blancos(imagen)
+        if esperado != obtenido:
+            raise AssertionError(f"{formato}: el conteo no coincide ({obtenido} != {esperado})")
+
+        t_original = timeit.timeit(
+            lambda: alinear_perforacion_original(imagen, datos["zona"], datos["umbral_grey"]),
+            number=repeticiones
+        ) / repeticiones
+        t_roi = timeit.timeit(lambda: analizador.contar_blancos(imagen), number=repeticiones) / repeticiones
+
+        print(f"{formato:<8}{f'{ancho}x{alto}':>12}{t_original * 1e6:>12.1f}{t_roi * 1e6:>12.1f}"
+              f"{t_original / t_roi:>9.1f}x")
+
+
+def benchmark_intentos(cuadros, semillas=3):
+    '''
+    Intentos por frame: ajuste de a un punto, avance predictivo, avance en bloque
+    aprendido y avance del cuadro completo medido en la imagen (35mm)
+    '''
+    variantes = {
+        "1 punto": {},
+        "predictivo": {"predictivo": True},
+        "+ patrón": {"predictivo": True, "adaptativo": True},
+        "+ cuadro": {"predictivo": True, "adaptativo": True, "multiperforacion": True},
+    }
+    print(f"Intentos por frame sobre film simulado ({cuadros} frames x {semillas} rollos, promedio / máximo)")
+    print(f"{'formato':<8}" + "".join(f"{nombre:>16}" for nombre in variantes))
+    for formato in FORMATOS:
+        fila = f"{formato:<8}"
+        for opciones in variantes.values():
+            intentos = []
+            for semilla in range(semillas):
+                intentos += AlineacionSimulada(formato, semilla=semilla, **opciones).rollo(cuadros)
+            fila += f"{f'{np.mean(intentos):.1f} / {max(intentos)}':>16}"
+        print(fila)
+
+
+def benchmark_canalizacion(cuadros, semillas=3):
+    '''Frames por minuto con la captura en serie y canalizada (modelo de tiempos de simulacion)'''
+    print(f"Captura en serie contra canalizada ({cuadros} frames x {semillas} rollos, frames/min)")
+    print(f"{'formato':<8}{'serie':>10}{'canalizada':>12}{'ganancia':>10}")
+    for formato in FORMATOS:
+        frames_min = {}
+        for canalizado in (False, True):
+            segundos = 0.0
+            for semilla in range(semillas):
+                simulacion = AlineacionSimulada(
+                    formato, predictivo=True, adaptativo=True, multiperforacion=True,
+                    canalizado=canalizado, semilla=semilla
+                )
+                simulacion.rollo(cuadros)
+                segundos += simulacion.segundos
+            frames_min[canalizado] = 60.0 * cuadros * semillas / segundos
+        print(f"{formato:<8}{frames_min[False]:>10.1f}{frames_min[True]:>12.1f}"
+              f"{(frames_min[True] / frames_min[False] - 1) * 100:>9.0f}%")
+
+
+def benchmark_escenarios(cuadros, semillas=3, escala_paso=1.0):
+    '''
+    La captura completa (predictor, avance aprendido, cuadro completo y canalización)
+    en cada escenario de film.
+    Devuelve el peor p99 de intentos por frame.
+    '''
+    print(f"Alineación por escenario ({cuadros} frames x {semillas} rollos, paso x{escala_paso:g})")
+    print(f"{'formato':<8}{'escenario':<10}{'frames/min':>12}{'intentos':>10}{'p99':>7}"
+          f"{'fallidos':>10}{'CPU µs/decisión':>18}")
+    peor_p99 = 0.0
+    for formato, datos in FORMATOS.items():
+        for escenario, opciones in ESCENARIOS.items():
+            intentos, tiempos, segundos, fallidos, frames = [], [], 0.0, 0, 0
+            for semilla in range(semillas):
+                simulacion = AlineacionSimulada(
+                    formato, predictivo=True, adaptativo=True, multiperforacion=True, canalizado=True,
+                    semilla=semilla,
+                    paso_px=datos["paso_px"] * escala_paso, **opciones
+                )
+                for _ in range(cuadros):
+                    usados, alineado = simulacion.capturar_frame()
+                    intentos.append(usados)
+                    fallidos += not alineado
+                    frames += alineado
+                tiempos += simulacion.tiempos_decision
+                segundos += simulacion.segundos
+            p99 = float(np.percentile(intentos, 99))
+            peor_p99 = max(peor_p99, p99)
+            print(f"{formato:<8}{escenario:<10}{60.0 * frames / segundos:>12.1f}{np.mean(intentos):>10.1f}"
+                  f"{p99:>7.0f}{fallidos:>10}{np.mean(tiempos) * 1e6:>18.0f}")
+    return peor_p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de alineación de perforación")
+    parser.add_argument("--repeticiones", type=int, default=2000)
+    parser.add_argument("--cuadros", type=int, default=30)
+    parser.add_argument("--escala-paso", type=float, default=1.0, help="multiplica el paso entre perforaciones")
+    parser.add_argument("--max-p99", type=float, default=None, help="máximo p99 de intentos aceptado")
+    args = parser.parse_args()
+
+    benchmark_analisis(args.repeticiones)
+    print()
+    benchmark_intentos(args.cuadros)
+    print()
+    benchmark_canalizacion(args.cuadros)
+    print()
+    peor_p99 = benchmark_escenarios(args.cuadros, escala_paso=args.escala_paso)
+
+    if args.max_p99 is not None and peor_p99 > args.max_p99:
+        print(f"p99 de intentos {peor_p99:.0f} supera el máximo {args.max_p99:g}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
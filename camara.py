@@ -0,0 +1,267 @@
+# Este archivo es parte de digitalizadora-films
+#
+# Este software está licenciado bajo la Licencia Pública General GNU v3.0 o superior.
+# Una copia de la licencia se incluye en el archivo `LICENSE` de este directorio.
+# También está disponible en línea en: <https://www.gnu.org/licenses/gpl-3.0.html>.
+
+'''
+Índice de los archivos de la tarjeta de la cámara y sesión con la cámara.
+
+Listar carpetas por USB es lento. El índice recorre la tarjeta una sola vez y después
+se mantiene con los eventos de archivo nuevo de la cámara y con los borrados que hace
+el programa, así ubicar un archivo por nombre no lista ninguna carpeta.
+
+SesionCamara reconecta la cámara del número de serie configurado sin volver a
+detectar todas las cámaras cada vez: recuerda en qué puerto estaba y su modelo.
+'''
+
+import os
+import threading
+import time
+
+try:
+    import gphoto2 as gp
+except ImportError: # el índice no necesita gphoto2
+    gp = None
+
+
+class IndiceArchivos:
+    '''
+    nombre (en minúsculas) -> (carpeta, nombre) de los archivos de la cámara.
+    Cuenta las carpetas listadas para comparar con el recorrido en cada búsqueda.
+    '''
+    def __init__(self, logger=None):
+        self.logger = logger
+        self._archivos = {}
+        self._lock = threading.Lock()
+        self.construido = False
+        self.listados = 0
+        self.consultas = 0
+        self.aciertos = 0
+        self.construcciones = 0
+
+    def construir(self, camera, raiz="/"):
+        '''Recorre la tarjeta una vez y reemplaza el contenido del índice'''
+        archivos = {}
+        pendientes = [raiz]
+        while pendientes:
+            carpeta = pendientes.pop()
+            try:
+                lista = camera.folder_list_files(carpeta)
+                self.listados += 1
+                for i in range(lista.count()):
+                    nombre = lista.get_name(i)
+                    archivos[nombre.lower()] = (carpeta, nombre)
+                carpetas = camera.folder_list_folders(carpeta)
+                self.listados += 1
+                for i in range(carpetas.count()):
+                    pendientes.append(os.path.join(carpeta, carpetas.get_name(i)))
+            except Exception as e: # pylint: disable=W0718
+                # Carpetas inaccesibles: se ignoran como en el recorrido anterior
+                if self.logger:
+                    self.logger.debug("No se pudo listar %s: %s", carpeta, e)
+        with self._lock:
+            self._archivos = archivos
+            self.construido = True
+            self.construcciones += 1
+        if self.logger:
+            self.logger.info("Índice de la cámara: %d archivos, %d listados", len(archivos), self.listados)
+
+    def invalidar(self):
+        '''La tarjeta pudo cambiar sin avisar (reconexión, otro programa): reconstruir al usarlo'''
+        with self._lock:
+            self.construido = False
+
+    def agregar(self, carpeta, nombre):
+        '''Archivo nuevo avisado por la cámara (GP_EVENT_FILE_ADDED)'''
+        with self._lock:
+            self._archivos[nombre.lower()] = (carpeta, nombre)
+
+    def quitar(self, carpeta, nombre):
+        '''Archivo borrado de la cámara por el programa'''
+        with self._lock:
+            if self._archivos.get(nombre.lower()) == (carpeta, nombre):
+                del self._archivos[nombre.lower()]
+
+    def ubicar(self, nombre):
+        '''(carpeta, nombre) del archivo, o (None, None) si no está en la cámara'''
+        with self._lock:
+            self.consultas += 1
+            encontrado = self._archivos.get(nombre.lower())
+            if encontrado:
+                self.aciertos += 1
+                return encontrado
+        return None, None
+
+    def archivos(self, extension=None):
+        '''(carpeta, nombre) de los archivos, ordenados, opcionalmente de una extensión'''
+        with self._lock:
+            encontrados = list(self._archivos.values())
+        if extension:
+            encontrados = [(c, n) for c, n in encontrados if n.lower().endswith(extension)]
+        return sorted(encontrados)
+
+    def ultimo(self, extension):
+        '''El archivo más reciente de una extensión (el mayor número de la cámara)'''
+        encontrados = self.archivos(extension)
+        return encontrados[-1] if encontrados else (None, None)
+
+    def reportar(self):
+        '''Consultas atendidas contra carpetas listadas (antes, cada consulta listaba al menos una)'''
+        if self.logger:
+            self.logger.info(
+                "Índice de la cámara: %d consultas (%d encontradas), %d carpetas listadas en %d recorridos",
+                self.consultas, self.aciertos, self.listados, self.construcciones
+            )
+
+
+class SesionCamara:
+    '''
+    Conexión con la cámara de un número de serie. conectar() prueba, en orden:
+
+        vigente   la cámara ya abierta sigue respondiendo (lee solo el número de serie)
+        puerto    abre de nuevo la cámara en el puerto y con el modelo recordados
+        detección autodetect() y prueba cada cámara hasta encontrar el número de serie
+
+    Las lecturas de configuración son de un solo parámetro (get_single_config) en
+    lugar del árbol completo, y el destino de las fotos se escribe solo si cambió.
+    Cada intento se registra con su duración.
+    '''
+    def __init__(self, serial, destino="Memory card", logger=None):
+        self.serial = serial
+        self.destino = destino
+        self.logger = logger
+        self.camara = None
+        self._destino_verificado = False
+        self._puertos = None # PortInfoList cargada en la última detección
+        # número de serie -> (ruta del puerto, abilities del modelo)
+        self._conocidas = {}
+        self.conexiones = {"vigente": 0, "puerto": 0, "deteccion": 0}
+
+    def conectar(self):
+        '''La cámara del número de serie abierta y configurada, o None si no está conectada'''
+        for modo, intento in (("vigente", self._vigente), ("puerto", self._por_puerto),
+                              ("deteccion", self._por_deteccion)):
+            inicio = time.monotonic()
+            try:
+                camara = intento()
+            except gp.GPhoto2Error as e:
+                camara = None
+                if self.logger:
+                    self.logger.warning("Cámara (%s): %s", modo, e)
+            if self.logger:
+                self.logger.info("Cámara (%s): %s en %.0f ms", modo,
+                                 "conectada" if camara else "sin éxito", (time.monotonic() - inicio) * 1000)
+            if camara is not None:
+                self.camara = camara
+                self.conexiones[modo] += 1
+                self.configurar_destino()
+                return camara
+        self.camara = None
+        return None
+
+    def liberar(self):
+        '''Cierra la cámara para que la use otro programa (Entangle); se reabre con conectar()'''
+        if self.camara is not None:
+            try:
+                self.camara.exit()
+            finally:
+                self.camara = None
+
+    def leer(self, nombre, camara=None):
+        '''Valor de un parámetro de configuración sin traer el árbol completo'''
+        return self._widget(camara or self.camara, nombre).get_value()
+
+    def configurar_destino(self):
+        '''Las fotos se guardan en la tarjeta; solo se escribe si el valor es otro'''
+        if self._destino_verificado:
+            return
+        try:
+            widget = self._widget(self.camara, "capturetarget")
+            actual = widget.get_value()
+            if actual != self.destino:
+                widget.set_value(self.destino)
+                self.camara.set_single_config("capturetarget", widget)
+                if self.logger:
+                    self.logger.info("Destino de captura: %s (antes %s)", self.destino, actual)
+            self._destino_verificado = True
+        except gp.GPhoto2Error as e:
+            if self.logger:
+                self.logger.warning("Error configurando 'capturetarget': %s", e)
+
+    def _widget(self, camara, nombre):
+        try:
+            return camara.get_single_config(nombre)
+        except gp.GPhoto2Error as e:
+            if e.code != gp.GP_ERROR_NOT_SUPPORTED:
+                raise
+        # libgphoto2 viejo o driver sin lectura individual: se busca en el árbol
+        return camara.get_config().get_child_by_name(nombre)
+
+    def _vigente(self):
+        if self.camara is None or self.leer("serialnumber") != self.serial:
+            return None
+        return self.camara
+
+    def _por_puerto(self):
+        conocida = self._conocidas.get(self.serial)
+        if conocida is None or self._puertos is None:
+            return None
+        ruta, abilities = conocida
+        camara = self._abrir(ruta, abilities)
+        try:
+            serial = self.leer("serialnumber", camara)
+        except Exception:
+            # Sin liberar el puerto el próximo intento falla con "device busy"
+            camara.exit()
+            raise
+        if serial != self.serial:
+            # Otra cámara ocupa ese puerto: hay que detectar de nuevo
+            camara.exit()
+            return None
+        return camara
+
+    def _por_deteccion(self):
+        self._puertos = gp.PortInfoList()
+        self._puertos.load()
+        autodetectadas = gp.Camera.autodetect()
+        detectadas = sorted(
+            (autodetectadas.get_name(i), autodetectadas.get_value(i)) for i in range(autodetectadas.count())
+        )
+        if self.logger:
+            self.logger.debug("Cámaras autodetectadas: %s", detectadas)
+        encontrada = None
+        for nombre, ruta in detectadas:
+            camara = None
+            try:
+                camara = self._abrir(ruta)
+                serial = self.leer("serialnumber", camara)
+            except gp.GPhoto2Error as e:
+                if camara is not None:
+                    camara.exit()
+                if self.logger:
+                    self.logger.error("Error al inicializar cámara %s: %s", nombre, e)
+                continue
+            self._conocidas[serial] = (ruta, camara.get_abilities())
+            if serial == self.serial and encontrada is None:
+                encontrada = camara
+            else:
+                if self.logger:
+                    self.logger.warning("No se asignó la cámara con serial %s.", serial)
+                camara.exit()
+        return encontrada
+
+    def _abrir(self, ruta, abilities=None):
+        if self.camara is not None:
+            try:
+                self.camara.exit()
+            except gp.GPhoto2Error:
+                pass
+            self.camara = None
+        camara = gp.Camera()
+        if abilities is not None:
+            camara.set_abilities(abilities) # sin buscar el modelo en la lista de drivers
+        camara.set_port_info(self._puertos[self._puertos.lookup_path(ruta)])
+        camara.init()
+        self._destino_verificado = False
+        return camara
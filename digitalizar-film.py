@@ -7,6 +7,8 @@
 from __future__ import print_function
 
 from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import Future
 import os
 import subprocess
 import io
@@ -17,9 +19,11 @@ from datetime import datetime
 import logging
 import shutil
 import threading
+import queue
 import platform
 import glob
 import json
+import zlib
 import psutil
 
 try:
@@ -111,7 +115,7 @@ try:
     from kivy.properties import StringProperty
     from kivy.uix.image import Image
     from kivy.clock import Clock, mainthread
-    from kivy.graphics import Color, Rectangle
+    from kivy.graphics import Color, Rectangle, Line, InstructionGroup
     from kivy.graphics.texture import Texture # pylint: disable=E0611
     from kivy.uix.button import Button
     from kivy.uix.gridlayout import GridLayout
@@ -166,6 +170,15 @@ except Exception as e:
     import tkinter as tk
     from tkinter import filedialog, messagebox
 
+from perforacion import (
+    AlineadorPerforacion, AnalizadorPerforacion, ControladorAvance, PredictorAvance, ProgramadorLimpieza,
+    VerificadorFrescura
+)
+from camara import IndiceArchivos, SesionCamara
+from escritura import SUFIJO_TEMPORAL, DiarioRaw, EscritorAtomico, buscar_temporales
+from grabacion import EscritorDepuracion, GrabadorSesion
+from impresora import TransporteAgrupado, TransporteAvancePapel, crear_transporte
+
 def instalar_entangle():
     '''Verifica si entangle está instalado, si no, lo instala'''
     if shutil.which("entangle") is not None:
@@ -192,6 +205,18 @@ logging.getLogger("PIL").setLevel(logging.DEBUG)
 # time between captures
 INTERVAL = 0.05 # 0.1
 
+# Previsualización en vivo
+INTERVALO_PREVISUALIZACION = 1.0 / 24.0
+ESCALA_PREVISUALIZACION = 2 # el JPEG de la vista previa se decodifica a 1/ESCALA (DCT)
+# La foto capturada se muestra decodificada a la menor escala DCT que cubra este tamaño
+TAMANIO_CAPTURA_INTERFAZ = (1440, 960)
+
+# Avances de la impresora que llegan dentro de esta ventana (segundos) se envían juntos
+VENTANA_AGRUPADO_MOVIMIENTOS = 0.015
+
+# Segundos máximos que se espera el JPG de un disparo
+TIEMPO_MAXIMO_DISPARO = 8.0
+
 # result
 OUT_FILE = 'time_lapse.mp4'
 TIEMPO_ESPERA = 1.0
@@ -200,6 +225,13 @@ FECHA_ACTUAL = datetime.now().strftime("%d%m%Y")
 # Ruta al archivo de configuración
 CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
 
+# Sesiones de alineación grabadas (ver grabacion.py)
+DIRECTORIO_SESIONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sesiones')
+# Imágenes anotadas de la alineación cuando la depuración está activa
+DIRECTORIO_DEPURACION = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'depuracion')
+# CR3 pendientes de descarga y el frame al que pertenecen (sobrevive a un corte)
+ARCHIVO_DIARIO_RAW = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'descargas-raw.jsonl')
+
 # Cargar configuración desde el archivo
 try:
     with open(CONFIG_PATH, 'r') as f:
@@ -209,31 +241,64 @@ try:
         CARPETA_DESTINO = config.get("CARPETA_DESTINO", "")
         DIRECTORIO_GUARDADO = config.get("DIRECTORIO", "")
         CODIGO_REFERENCIA = config.get("CODIGO_REFERENCIA", "")
+        # Segundos que se espera a que la vista previa refleje un movimiento del film
+        ASENTAMIENTO_MINIMO = config.get("ASENTAMIENTO_MINIMO", 0.05)
+        ASENTAMIENTO_MAXIMO = config.get("ASENTAMIENTO_MAXIMO", 0.25)
+        # Avance en bloque aprendido en el último rollo de cada formato
+        PATRON_IMPRESORA_16MM = config.get("PATRON_IMPRESORA_16mm", [10])
+        PATRON_IMPRESORA_35MM = config.get("PATRON_IMPRESORA_35mm", [22])
+        # Cómo mueve el film la impresora: "raster" (imagen en blanco) o "avance_papel" (ESC J n)
+        TRANSPORTE_IMPRESORA = config.get("TRANSPORTE_IMPRESORA", "raster")
+        # Unidades de ESC J por punto de raster (solo para "avance_papel")
+        TRANSPORTE_UNIDADES_POR_PUNTO = config.get("TRANSPORTE_UNIDADES_POR_PUNTO", 1)
 except Exception as e:
     print(f"⚠️ No se pudo cargar el archivo de configuración: {e}")
     PREFIJO_ARCHIVO = "UY-UDELAR-AGU-AIH"
     CAMARA = ""
     DIRECTORIO_GUARDADO = ""
     CODIGO_REFERENCIA = ""
+    ASENTAMIENTO_MINIMO = 0.05
+    ASENTAMIENTO_MAXIMO = 0.25
+    PATRON_IMPRESORA_16MM = [10]
+    PATRON_IMPRESORA_35MM = [22]
+    TRANSPORTE_IMPRESORA = "raster"
+    TRANSPORTE_UNIDADES_POR_PUNTO = 1
+
+# config.json se escribe desde la interfaz y desde los hilos de la captura
+_lock_configuracion = threading.Lock()
 
-def guardar_configuracion(clave, valor):
-    """Guarda una configuración específica en el archivo config.json"""
+def guardar_configuracion(clave, valor, logger=None):
+    """
+    Guarda una configuración específica en el archivo config.json.
+    Se escribe un archivo temporal y se renombra: un corte nunca deja el config truncado.
+    """
     try:
-        # Leer la configuración actual
-        with open(CONFIG_PATH, 'r') as f:
-            config = json.load(f)
-        
-        # Actualizar el valor
-        config[clave] = valor
-        
-        # Guardar la configuración actualizada
-        with open(CONFIG_PATH, 'w') as f:
-            json.dump(config, f, indent=2)
-        
-        print(f"✅ Configuración guardada: {clave} = {valor}")
-        
+        with _lock_configuracion:
+            # Leer la configuración actual
+            with open(CONFIG_PATH, 'r') as f:
+                config = json.load(f)
+
+            # Actualizar el valor
+            config[clave] = valor
+
+            # Guardar la configuración actualizada
+            temporal = CONFIG_PATH + SUFIJO_TEMPORAL
+            with open(temporal, 'w') as f:
+                json.dump(config, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, CONFIG_PATH)
+
+        if logger:
+            logger.info("Configuración guardada: %s = %s", clave, valor)
+        else:
+            print(f"✅ Configuración guardada: {clave} = {valor}")
+
     except Exception as e:
-        print(f"⚠️ Error al guardar configuración: {e}")
+        if logger:
+            logger.error("Error al guardar configuración: %s", e)
+        else:
+            print(f"⚠️ Error al guardar configuración: {e}")
 
 COLOR_BOTONES = (0.175, 0.319, 0.513, 0.997) # (1, 0, 0, 0.5)
 
@@ -522,6 +587,963 @@ class MenuButton(ButtonBehavior, BoxLayout):
             # Para otros labels, comportamiento original
             instance.text_size = size
 
+class CuadroPrevisualizacion:
+    '''Buffer RGBA preasignado donde se decodifica un cuadro de la vista previa'''
+    def __init__(self):
+        self.buffer = None # (alto, ancho, 4) RGBA, se reutiliza en cada cuadro
+        self.plano = None # vista 1D del buffer para blit_buffer
+        self.tamanio = None
+        self.secuencia = 0
+        self.instante = 0.0
+        self._destino = None # imagen PIL que comparte memoria con el buffer
+
+    def preparar(self, tamanio):
+        '''Reserva el buffer para un tamaño de vista previa (solo si cambió)'''
+        if tamanio == self.tamanio:
+            return
+        ancho, alto = tamanio
+        self.buffer = np.empty((alto, ancho, 4), dtype=np.uint8)
+        self.plano = self.buffer.reshape(-1)
+        # frombuffer con RGBA comparte la memoria del array; se marca escribible
+        # para que paste() decodifique directamente sobre el buffer
+        self._destino = Imge.frombuffer('RGBA', tamanio, self.buffer, 'raw', 'RGBA', 0, 1)
+        self._destino.readonly = 0
+        self.tamanio = tamanio
+
+    def volcar(self, imagen):
+        '''Copia la imagen decodificada sobre el buffer del cuadro'''
+        self.preparar(imagen.size)
+        self._destino.paste(imagen)
+
+class BufferCuadros:
+    '''
+    Buffer circular de cuadros decodificados con descarte del más viejo.
+    El productor escribe siempre sobre una ranura que el consumidor no está usando
+    y el consumidor solo toma el cuadro más nuevo.
+    '''
+    def __init__(self, capacidad=3):
+        self._ranuras = [CuadroPrevisualizacion() for _ in range(max(capacidad, 2))]
+        self._lock = threading.Lock()
+        self._publicados = [] # índices de ranuras publicadas, del más viejo al más nuevo
+        self._en_uso = None # ranura que está mostrando el consumidor
+        self._secuencia = 0
+        self.descartados = 0
+
+    def ranura_libre(self):
+        '''Devuelve una ranura para escribir, descartando el cuadro más viejo si hace falta'''
+        with self._lock:
+            for indice, _ in enumerate(self._ranuras):
+                if indice != self._en_uso and indice not in self._publicados:
+                    return indice, self._ranuras[indice]
+            # Buffer lleno: se pisa el cuadro publicado más viejo
+            indice = self._publicados.pop(0)
+            self.descartados += 1
+            return indice, self._ranuras[indice]
+
+    def publicar(self, indice):
+        '''Marca la ranura como el cuadro más nuevo disponible'''
+        with self._lock:
+            self._secuencia += 1
+            self._ranuras[indice].secuencia = self._secuencia
+            self._ranuras[indice].instante = time.monotonic()
+            self._publicados.append(indice)
+
+    def ultimo(self):
+        '''Toma el cuadro más nuevo; los anteriores se descartan. None si no hay nada nuevo'''
+        with self._lock:
+            if not self._publicados:
+                return None
+            indice = self._publicados.pop()
+            self.descartados += len(self._publicados)
+            self._publicados.clear()
+            self._en_uso = indice
+            return self._ranuras[indice]
+
+    def vaciar(self):
+        '''Descarta los cuadros publicados (al pausar la previsualización)'''
+        with self._lock:
+            self._publicados.clear()
+
+class MotorPrevisualizacion:
+    '''
+    Decodifica la vista previa a escala reducida (escalado DCT de JPEG) dentro de un
+    buffer preasignado y la vuelca en una única textura que vive toda la sesión.
+    '''
+    def __init__(self, escala=ESCALA_PREVISUALIZACION, intervalo=INTERVALO_PREVISUALIZACION,
+                 logger=None, periodo_reporte=5.0):
+        self.escala = escala
+        self.intervalo = intervalo
+        self.logger = logger or logging.getLogger(__name__)
+        self.periodo_reporte = periodo_reporte
+
+        self.texture = None
+        self._tamanio = None
+
+        # Medición de fps contra el calendario de 1/24 s
+        self.fps = 0.0
+        self._cuadros = 0
+        self._atrasados = 0
+        self._inicio_ventana = time.monotonic()
+        self._ultimo_cuadro = None
+
+    def _preparar_textura(self, tamanio):
+        '''Crea la textura de la sesión para un tamaño de vista previa'''
+        # La textura se invierte una sola vez en lugar de rotar cada cuadro
+        self.texture = Texture.create(size=tamanio, colorfmt='rgba')
+        self.texture.flip_vertical()
+        self._tamanio = tamanio
+        self.logger.info("Textura de previsualización creada: %sx%s", *tamanio)
+
+    def decodificar(self, datos, cuadro):
+        '''Decodifica el JPEG a 1/escala directamente en el buffer del cuadro'''
+        imagen = Imge.open(BytesIO(datos))
+        ancho, alto = imagen.size
+        if self.escala > 1:
+            imagen.draft('RGB', (ancho // self.escala, alto // self.escala))
+        imagen.load()
+        cuadro.volcar(imagen)
+        return cuadro
+
+    def mostrar_cuadro(self, cuadro):
+        '''Vuelca un cuadro ya decodificado en la textura de la sesión'''
+        if cuadro.tamanio != self._tamanio:
+            self._preparar_textura(cuadro.tamanio)
+        self.texture.blit_buffer(cuadro.plano, colorfmt='rgba', bufferfmt='ubyte')
+        self._registrar_cuadro()
+        return self.texture
+
+    def _registrar_cuadro(self):
+        '''Acumula los fps logrados y los cuadros que no llegaron a su turno'''
+        ahora = time.monotonic()
+        if self._ultimo_cuadro is not None and ahora - self._ultimo_cuadro > 1.5 * self.intervalo:
+            self._atrasados += 1
+        self._ultimo_cuadro = ahora
+        self._cuadros += 1
+
+        transcurrido = ahora - self._inicio_ventana
+        if transcurrido >= self.periodo_reporte:
+            self.fps = self._cuadros / transcurrido
+            self.logger.info(
+                "Previsualización: %.1f fps (objetivo %.1f), %s cuadros fuera de horario",
+                self.fps, 1.0 / self.intervalo, self._atrasados
+            )
+            self._cuadros = 0
+            self._atrasados = 0
+            self._inicio_ventana = ahora
+
+    def reiniciar_medicion(self):
+        '''Descarta la medición en curso (por ejemplo, al reanudar la previsualización)'''
+        self._cuadros = 0
+        self._atrasados = 0
+        self._inicio_ventana = time.monotonic()
+        self._ultimo_cuadro = None
+
+class CuadriculaAlineacion:
+    '''
+    Cuadrícula de alineación y rectángulo de la perforación dibujados con instrucciones
+    de Kivy sobre la imagen de la vista previa. Las coordenadas están en píxeles de la
+    vista previa completa, con el eje y contado desde abajo, y se escalan con la textura.
+    '''
+    def __init__(self, imagen, motor, color_lineas=(1, 0, 0, 1), color_rectangulo=(0, 0, 1, 1)):
+        self.imagen = imagen
+        self.motor = motor
+        self.visible = True
+        self.lineas_x = ()
+        self.rectangulo = None
+
+        self._color_lineas = Color(*color_lineas)
+        self._color_rectangulo = Color(*color_rectangulo)
+        self._alfa_lineas = color_lineas[3]
+        self._alfa_rectangulo = color_rectangulo[3]
+        self._lineas = [Line(points=[], width=1) for _ in range(3)]
+        self._rectangulo = Line(rectangle=(0, 0, 0, 0), width=2)
+
+        grupo = InstructionGroup()
+        grupo.add(self._color_lineas)
+        for linea in self._lineas:
+            grupo.add(linea)
+        grupo.add(self._color_rectangulo)
+        grupo.add(self._rectangulo)
+        self.imagen.canvas.after.add(grupo)
+
+        # Solo se recalcula cuando cambia el tamaño, la posición o la textura
+        self.imagen.bind( # pylint: disable=E1101
+            pos=self._actualizar,
+            norm_image_size=self._actualizar,
+            texture=self._actualizar
+        )
+        self._actualizar()
+
+    def configurar(self, lineas_x, rectangulo):
+        '''Define la geometría: posiciones x de las líneas y (x1, y1, x2, y2) del rectángulo'''
+        self.lineas_x = tuple(lineas_x)
+        self.rectangulo = rectangulo
+        self._actualizar()
+
+    def mostrar(self, visible):
+        '''Muestra u oculta la cuadrícula sin tocar la textura'''
+        self.visible = visible
+        self._actualizar()
+
+    def _ocultar(self):
+        self._color_lineas.a = 0
+        self._color_rectangulo.a = 0
+
+    def _actualizar(self, *args): # pylint: disable=unused-argument
+        texture = self.imagen.texture
+        # Solo sobre la vista previa: las capturas tienen otra resolución
+        if (not self.visible or self.rectangulo is None or texture is None
+                or texture is not self.motor.texture):
+            self._ocultar()
+            return
+
+        # Área que ocupa la textura dentro del widget (fit_mode 'contain')
+        ancho_img, alto_img = self.imagen.norm_image_size
+        x0 = self.imagen.center_x - ancho_img / 2.0
+        y0 = self.imagen.center_y - alto_img / 2.0
+        escala_x = ancho_img / (texture.width * self.motor.escala)
+        escala_y = alto_img / (texture.height * self.motor.escala)
+
+        for linea, x in zip(self._lineas, self.lineas_x):
+            linea.points = [x0 + x * escala_x, y0, x0 + x * escala_x, y0 + alto_img]
+
+        x1, y1, x2, y2 = self.rectangulo
+        self._rectangulo.rectangle = (
+            x0 + min(x1, x2) * escala_x,
+            y0 + min(y1, y2) * escala_y,
+            abs(x2 - x1) * escala_x,
+            abs(y2 - y1) * escala_y
+        )
+
+        self._color_lineas.a = self._alfa_lineas
+        self._color_rectangulo.a = self._alfa_rectangulo
+
+class ProductorPrevisualizacion(threading.Thread):
+    '''
+    Hilo que trae las vistas previas de gphoto2 y las decodifica en el buffer circular,
+    para que los atascos de USB no congelen la interfaz.
+    Usa la cámara solo mientras tiene el lock de la cámara y se detiene mientras
+    la aplicación está digitalizando.
+    '''
+    def __init__(self, app, motor, cuadros, lock_camara, intervalo=INTERVALO_PREVISUALIZACION):
+        super().__init__(name="productor-previsualizacion", daemon=True)
+        self.app = app
+        self.motor = motor
+        self.cuadros = cuadros
+        self.lock_camara = lock_camara
+        self.intervalo = intervalo
+
+        self._activo = threading.Event()
+        self._detener = threading.Event()
+
+    def pausar(self):
+        '''Detiene la producción y espera a que termine la vista previa en curso'''
+        self._activo.clear()
+        # Tomar el lock garantiza que el hilo no está usando la cámara
+        with self.lock_camara:
+            pass
+        self.cuadros.vaciar()
+
+    def reanudar(self):
+        '''Reanuda la producción de vistas previas'''
+        self._activo.set()
+
+    def detener(self):
+        '''Termina el hilo'''
+        self._detener.set()
+        self._activo.set()
+
+    def _puede_producir(self):
+        return (self._activo.is_set() and not self._detener.is_set()
+                and not self.app.digitalizando and self.app.camera)
+
+    def run(self):
+        proxima = time.monotonic()
+        while not self._detener.is_set():
+            if not self._activo.wait(0.2):
+                continue
+            if not self._puede_producir():
+                time.sleep(self.intervalo)
+                continue
+
+            # Respetar el calendario de la previsualización
+            espera = proxima - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            proxima = max(proxima + self.intervalo, time.monotonic())
+
+            with self.lock_camara:
+                # Volver a verificar ya con el lock: la captura pudo haber empezado
+                if not self._puede_producir():
+                    continue
+                captura = self.app.capture_preview_from_camara(self.app.camera)
+                datos = captura.get_data_and_size() if captura else None
+
+            if not datos:
+                self.app.logger.error("No se pudo capturar la vista previa.")
+                time.sleep(self.intervalo)
+                continue
+
+            try:
+                indice, cuadro = self.cuadros.ranura_libre()
+                self.motor.decodificar(datos, cuadro)
+                self.cuadros.publicar(indice)
+            except Exception as e: # pylint: disable=W0718
+                self.app.logger.error("Error al decodificar la vista previa: %s", e)
+
+class Disparo:
+    '''
+    Archivos de un disparo: futuros que se resuelven con (carpeta, nombre) del JPG y del CR3.
+    tallo es el nombre sin extensión que comparten los dos archivos (IMG_0001).
+    '''
+    def __init__(self):
+        self.jpg = Future()
+        self.raw = Future()
+        self.tallo = None
+        self.disparado = False
+        self.instante = time.monotonic()
+
+    def futuro(self, tipo):
+        return self.jpg if tipo == "jpg" else self.raw
+
+    def terminado(self):
+        return self.jpg.done() and self.raw.done()
+
+
+class BombaEventos(threading.Thread):
+    '''
+    Único lugar que llama a wait_for_event. Reparte los GP_EVENT_FILE_ADDED de JPG y
+    CR3 a los disparos por nombre: el archivo que devuelve capture() fija el tallo del
+    disparo y el otro archivo se le asigna cuando llega con el mismo tallo.
+    Quien tiene el lock de la cámara (la captura) bombea en su propio hilo mientras
+    espera, así vuelve apenas la cámara avisa. El hilo bombea solo cuando quedan
+    futuros pendientes y la cámara está libre (por ejemplo, el CR3 que llega tarde).
+    '''
+    EXTENSIONES = {".jpg": "jpg", ".jpeg": "jpg", ".cr3": "raw"}
+
+    def __init__(self, app, lock_camara, intervalo_ms=50, maximo_pendientes=16):
+        super().__init__(name="bomba-eventos", daemon=True)
+        self.app = app
+        self.lock_camara = lock_camara
+        self.intervalo_ms = intervalo_ms
+
+        self._disparos = deque(maxlen=maximo_pendientes)
+        self._mutex = threading.Lock()
+        self._hay_pendientes = threading.Event()
+        self._detener = threading.Event()
+        self._suspendida = False
+        self.sin_disparo = 0 # archivos que llegaron sin un disparo que los espere
+
+    def nuevo_disparo(self):
+        '''Descarta los eventos viejos y registra un disparo. Llamar antes de capture()'''
+        self.vaciar()
+        disparo = Disparo()
+        with self._mutex:
+            if len(self._disparos) == self._disparos.maxlen:
+                self._cancelar(self._disparos[0]) # el más viejo se pierde al agregar
+            self._disparos.append(disparo)
+        self._hay_pendientes.set()
+        return disparo
+
+    def confirmar_captura(self, disparo, carpeta, nombre):
+        '''
+        Archivo que devolvió capture() (o que se encontró recorriendo la tarjeta).
+        Con RAW+JPEG la cámara avisa uno solo de los dos archivos con un evento.
+        '''
+        if nombre:
+            self.app.indice_camara.agregar(carpeta, nombre)
+        with self._mutex:
+            disparo.disparado = True
+            if not nombre:
+                return
+            tallo, extension = os.path.splitext(nombre)
+            disparo.tallo = tallo.lower()
+            tipo = self.EXTENSIONES.get(extension.lower())
+            if tipo is not None:
+                self._resolver(disparo, tipo, carpeta, nombre)
+
+    def cancelar(self, disparo):
+        '''El disparo falló: sus archivos ya no se esperan'''
+        with self._mutex:
+            self._cancelar(disparo)
+
+    def _cancelar(self, disparo):
+        disparo.jpg.cancel()
+        disparo.raw.cancel()
+        if disparo in self._disparos:
+            self._disparos.remove(disparo)
+        if not self._disparos:
+            self._hay_pendientes.clear()
+
+    def _resolver(self, disparo, tipo, carpeta, nombre):
+        futuro = disparo.futuro(tipo)
+        if not futuro.done() and futuro.set_running_or_notify_cancel():
+            futuro.set_result((carpeta, nombre))
+        if disparo.terminado() and disparo in self._disparos:
+            self._disparos.remove(disparo)
+        if not self._disparos:
+            self._hay_pendientes.clear()
+
+    def esperar(self, futuro, timeout):
+        '''Bombea eventos hasta que el futuro se resuelva; devuelve el resultado o None'''
+        limite = time.monotonic() + timeout
+        while not futuro.done():
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                futuro.cancel()
+                return None
+            self.bombear(min(int(restante * 1000) + 1, 500))
+        return None if futuro.cancelled() else futuro.result()
+
+    def vaciar(self):
+        '''Procesa los eventos que ya estaban en cola; los archivos nuevos van a sus disparos'''
+        while self.bombear(10) not in (gp.GP_EVENT_TIMEOUT, None):
+            pass
+
+    def suspender(self):
+        '''Deja de usar la cámara (se cede a Entangle); espera el wait_for_event en curso'''
+        self._suspendida = True
+        with self.lock_camara:
+            pass
+
+    def reanudar(self):
+        self._suspendida = False
+
+    def bombear(self, timeout_ms):
+        '''Un wait_for_event con el lock de la cámara; devuelve el tipo de evento'''
+        camara = self.app.camera
+        if not camara or self._suspendida:
+            return None
+        with self.lock_camara:
+            try:
+                tipo, datos = camara.wait_for_event(timeout_ms)
+            except gp.GPhoto2Error as e:
+                self.app.logger.error("Error esperando eventos de la cámara: %s", e)
+                return None
+        if tipo == gp.GP_EVENT_FILE_ADDED:
+            self._despachar(datos.folder, datos.name)
+        return tipo
+
+    def _despachar(self, carpeta, nombre):
+        self.app.indice_camara.agregar(carpeta, nombre)
+        tallo, extension = os.path.splitext(nombre)
+        tallo = tallo.lower()
+        tipo = self.EXTENSIONES.get(extension.lower())
+        if tipo is None:
+            return
+        with self._mutex:
+            disparo = next((d for d in self._disparos if d.tallo == tallo), None)
+            if disparo is None:
+                # capture() no devolvió un nombre: el disparo más viejo ya hecho sin tallo
+                disparo = next(
+                    (d for d in self._disparos
+                     if d.disparado and d.tallo is None and not d.futuro(tipo).done()), None
+                )
+                if disparo is not None:
+                    disparo.tallo = tallo
+            if disparo is None:
+                self.sin_disparo += 1
+                self.app.logger.debug("Archivo nuevo sin disparo esperando: %s/%s", carpeta, nombre)
+                return
+            self._resolver(disparo, tipo, carpeta, nombre)
+
+    def detener(self):
+        self._detener.set()
+        self._hay_pendientes.set()
+
+    def run(self):
+        while not self._detener.is_set():
+            if not self._hay_pendientes.wait(0.2) or not self.app.camera or self._suspendida:
+                continue
+            # No competir con la captura ni con la vista previa por la cámara
+            if not self.lock_camara.acquire(blocking=False):
+                time.sleep(self.intervalo_ms / 1000.0)
+                continue
+            try:
+                self.bombear(self.intervalo_ms)
+            finally:
+                self.lock_camara.release()
+            time.sleep(0.005)
+
+
+class CanalizacionCaptura:
+    '''
+    Trabajo posterior a la captura en un grupo fijo de hilos: guardar el JPG,
+    prepararlo para la interfaz y mostrarlo, y tareas de mantenimiento de la cámara.
+    Mientras tanto capture_frame ya avanzó el film (durante la transferencia) y sigue
+    con la alineación del cuadro siguiente.
+    Cada trabajo tiene un tipo: los que no se pueden perder bloquean a la captura si la
+    cola está llena; los descartables se descartan. Mide las etapas de cada cuadro
+    para compararlo con la captura en serie.
+    '''
+    def __init__(self, app, hilos=2, capacidad=4, periodo_reporte=25):
+        self.app = app
+        self.periodo_reporte = periodo_reporte
+        self._cola = queue.Queue(maxsize=capacidad)
+        self._hilos = [
+            threading.Thread(target=self._trabajar, name=f"canalizacion-captura-{n}", daemon=True)
+            for n in range(hilos)
+        ]
+        # tipo -> (función, descartable)
+        self._tipos = {}
+        # tipo -> contadores y tiempos acumulados
+        self.metricas = {}
+        self._lock_metricas = threading.Lock()
+        self._escrituras = deque(maxlen=periodo_reporte)
+        self._cuadros = deque(maxlen=periodo_reporte)
+        self._ultimo_disparo = None
+        self._contador = 0
+        self._profundidad = deque(maxlen=periodo_reporte * 4)
+
+        # Si el disco no da abasto la captura espera: las fotos no se descartan
+        self.registrar_tipo("guardar", app.guardar_y_mostrar_captura)
+        self.registrar_tipo("residuos", app.verificar_residuos, descartable=True)
+        # Patrones aprendidos: config.json no se escribe en el hilo de la captura
+        self.registrar_tipo("configuracion", lambda clave, valor: guardar_configuracion(clave, valor, app.logger))
+
+    def registrar_tipo(self, tipo, funcion, descartable=False):
+        self._tipos[tipo] = (funcion, descartable)
+        self.metricas[tipo] = {
+            "enviados": 0, "completados": 0, "descartados": 0, "errores": 0,
+            "espera": 0.0, "duracion": 0.0,
+        }
+
+    def start(self):
+        for hilo in self._hilos:
+            hilo.start()
+
+    def enviar(self, tipo, *args):
+        '''Encola un trabajo del tipo dado. Devuelve False si se descartó por cola llena'''
+        _, descartable = self._tipos[tipo]
+        trabajo = (tipo, args, time.monotonic())
+        self._profundidad.append(self._cola.qsize())
+        try:
+            self._cola.put(trabajo, block=not descartable)
+        except queue.Full:
+            self._sumar(tipo, "descartados", 1)
+            return False
+        self._sumar(tipo, "enviados", 1)
+        return True
+
+    def encolar(self, frame, ruta, datos):
+        '''datos: bytes del JPG (copiados, el CameraFile se libera en la captura)'''
+        self.enviar("guardar", frame, ruta, datos)
+
+    def esperar(self):
+        '''Bloquea hasta que se terminaron todos los trabajos encolados'''
+        self._cola.join()
+
+    def detener(self):
+        vivos = [hilo for hilo in self._hilos if hilo.is_alive()]
+        for _ in vivos:
+            self._cola.put(None)
+        for hilo in vivos:
+            hilo.join(timeout=10.0)
+        if vivos:
+            self.app.escritor_frames.confirmar()
+            self._reportar_trabajos()
+
+    def _sumar(self, tipo, clave, valor):
+        with self._lock_metricas:
+            self.metricas[tipo][clave] += valor
+
+    def _trabajar(self):
+        while True:
+            trabajo = self._cola.get()
+            try:
+                if trabajo is None:
+                    break
+                tipo, args, encolado = trabajo
+                funcion, _ = self._tipos[tipo]
+                inicio = time.monotonic()
+                self._sumar(tipo, "espera", inicio - encolado)
+                try:
+                    funcion(*args)
+                except Exception as e: # pylint: disable=W0718
+                    self._sumar(tipo, "errores", 1)
+                    self.app.logger.error("Error en el trabajo %s posterior a la captura: %s", tipo, e)
+                    continue
+                duracion = time.monotonic() - inicio
+                self._sumar(tipo, "duracion", duracion)
+                self._sumar(tipo, "completados", 1)
+                if tipo == "guardar":
+                    self._escrituras.append(duracion)
+                    # Sin más fotos en espera se confirma el lote (fsync y renombre)
+                    if self._cola.empty():
+                        self.app.escritor_frames.confirmar()
+            finally:
+                self._cola.task_done()
+
+    def registrar_cuadro(self, instante_disparo, avance, transferencia):
+        '''
+        Tiempos del cuadro en el hilo de captura. avance: comando de la impresora más
+        el asentamiento mínimo, que ahora transcurren mientras se transfiere el JPG.
+        '''
+        if self._ultimo_disparo is not None:
+            periodo = instante_disparo - self._ultimo_disparo
+            self._cuadros.append((periodo, min(avance, transferencia)))
+        self._ultimo_disparo = instante_disparo
+        self._contador += 1
+        if self._contador % self.periodo_reporte == 0 and self._cuadros:
+            self._reportar()
+
+    def reiniciar_medicion(self):
+        '''Después de una pausa el intervalo entre disparos no es representativo'''
+        self._ultimo_disparo = None
+
+    def _reportar(self):
+        periodo = sum(p for p, _ in self._cuadros) / len(self._cuadros)
+        solapado = sum(s for _, s in self._cuadros) / len(self._cuadros)
+        escritura = sum(self._escrituras) / len(self._escrituras) if self._escrituras else 0.0
+        serie = periodo + solapado + escritura
+        self.app.logger.warning(
+            "Captura canalizada: %.1f frames/min (en serie ~%.1f frames/min, %+.0f%%); "
+            "escritura %.0f ms, avance solapado %.0f ms",
+            60.0 / periodo, 60.0 / serie, (serie / periodo - 1.0) * 100.0,
+            escritura * 1000, solapado * 1000
+        )
+        if self._contador % (self.periodo_reporte * 4) == 0:
+            self._reportar_trabajos()
+
+    def _reportar_trabajos(self):
+        with self._lock_metricas:
+            for tipo, datos in self.metricas.items():
+                if not datos["enviados"] and not datos["descartados"]:
+                    continue
+                hechos = max(datos["completados"], 1)
+                self.app.logger.info(
+                    "Trabajos %s: %d enviados, %d completados, %d descartados, %d con error; "
+                    "espera %.0f ms, duración %.0f ms",
+                    tipo, datos["enviados"], datos["completados"], datos["descartados"], datos["errores"],
+                    datos["espera"] / hechos * 1000, datos["duracion"] / hechos * 1000
+                )
+        if self._profundidad:
+            self.app.logger.info(
+                "Cola posterior a la captura: profundidad media %.1f, máxima %d (capacidad %d)",
+                sum(self._profundidad) / len(self._profundidad), max(self._profundidad), self._cola.maxsize
+            )
+        escritura = self.app.escritor_frames.estadisticas()
+        if escritura["archivos"]:
+            self.app.logger.info(
+                "Escritura de frames: %d archivos (%.0f MB), escritura %.0f ms, "
+                "confirmación %.0f ms por lote de %.1f, %d pendientes",
+                escritura["archivos"], escritura["megabytes"], escritura["escritura"] * 1000,
+                escritura["confirmacion"] * 1000, escritura["archivos_por_lote"], escritura["pendientes"]
+            )
+
+
+class DrenajeRaw(threading.Thread):
+    '''
+    Descarga y borra de la cámara los CR3 pendientes mientras se digitaliza, de a
+    bloques (file_read con desplazamiento), para que no se acumulen en la tarjeta.
+    Durante la captura solo lee en los huecos que deja la alineación (el asentamiento
+    del film después de cada movimiento), con el tiempo que la captura le presta, así
+    nunca la demora. Con la captura detenida lee en su propio hilo cuando la cámara
+    está libre.
+    '''
+    def __init__(self, app, lock_camara, bloque=512 * 1024, pausa=0.05, espera_error=5.0, espera_evento=10.0):
+        super().__init__(name="drenaje-raw", daemon=True)
+        self.app = app
+        self.lock_camara = lock_camara
+        self.bloque = bloque
+        self.pausa = pausa
+        self.espera_error = espera_error
+        # Segundos que se espera el evento de un CR3 antes de buscarlo en el índice
+        self.espera_evento = espera_evento
+        self._sin_evento = {} # futuro del CR3 -> instante en que se lo vio pendiente
+        self._buffer = bytearray(bloque)
+        # Un solo bloque a la vez, sea desde la captura o desde el hilo
+        self._lock_trabajo = threading.Lock()
+        self._detener = threading.Event()
+        # Suspensiones en curso (descarga manual, Entangle, reconexión de la cámara)
+        self._suspendido = 0
+        self._lock_suspension = threading.Lock()
+        self._espera_hasta = 0.0
+        # Archivo en curso: entrada de descargar_raw, carpeta, nombre, tamaño, desplazamiento, destino
+        self._actual = None
+        self._segundos_por_bloque = 0.02
+        self.bytes_en_huecos = 0
+        self.bytes_en_reposo = 0
+        self.descargados = 0
+
+    def aprovechar(self, segundos):
+        '''
+        Lee bloques durante como mucho segundos (desde la captura, que ya tiene el lock
+        de la cámara). Devuelve el tiempo usado.
+        '''
+        inicio = time.monotonic()
+        if self._suspendido or not self._lock_trabajo.acquire(blocking=False):
+            return 0.0
+        try:
+            while time.monotonic() - inicio + self._segundos_por_bloque <= segundos:
+                leidos = self._leer_bloque(buscar=False)
+                if not leidos:
+                    break
+                self.bytes_en_huecos += leidos
+        finally:
+            self._lock_trabajo.release()
+        return time.monotonic() - inicio
+
+    def suspender(self):
+        '''
+        Deja de usar la cámara: espera el bloque en curso y descarta el archivo parcial.
+        Cada suspender() se corresponde con un reanudar().
+        '''
+        with self._lock_suspension:
+            self._suspendido += 1
+        with self._lock_trabajo:
+            self._descartar_actual()
+
+    def reanudar(self):
+        with self._lock_suspension:
+            self._suspendido = max(self._suspendido - 1, 0)
+
+    def detener(self):
+        self._detener.set()
+        if self.is_alive():
+            self.join(timeout=5.0)
+        with self._lock_trabajo:
+            self._descartar_actual()
+        if self.descargados:
+            self.app.logger.info(
+                "Drenaje de RAW: %d archivos, %.0f MB en huecos de la captura, %.0f MB en reposo",
+                self.descargados, self.bytes_en_huecos / 1e6, self.bytes_en_reposo / 1e6
+            )
+            self.app.indice_camara.reportar()
+
+    def run(self):
+        while not self._detener.is_set():
+            if (self._suspendido or self.app.digitalizando or self.app.trabajador_captura.corriendo
+                    or not self.app.descargar_raw or not self.app.camera):
+                time.sleep(0.2)
+                continue
+            if self.lock_camara.acquire(blocking=False):
+                try:
+                    with self._lock_trabajo:
+                        self.bytes_en_reposo += self._leer_bloque(buscar=True)
+                finally:
+                    self.lock_camara.release()
+            # Dejar la cámara libre para la previsualización entre bloques
+            time.sleep(self.pausa)
+
+    def _leer_bloque(self, buscar):
+        '''
+        Lee un bloque del CR3 en curso (o abre el próximo). buscar: si el evento del CR3
+        no llegó, permite recorrer las carpetas de la cámara (lento, solo en reposo).
+        Devuelve los bytes leídos.
+        '''
+        if time.monotonic() < self._espera_hasta:
+            return 0
+        try:
+            if self._actual is None and not self._abrir_siguiente(buscar):
+                return 0
+            entrada, folder, nombre, tamanio, desplazamiento, destino = self._actual
+            inicio = time.monotonic()
+            cantidad = min(self.bloque, tamanio - desplazamiento)
+            vista = memoryview(self._buffer)[:cantidad]
+            leidos = self.app.camera.file_read(folder, nombre, gp.GP_FILE_TYPE_NORMAL, desplazamiento, vista)
+            destino.write(vista[:leidos])
+            self._segundos_por_bloque = 0.8 * self._segundos_por_bloque + 0.2 * (time.monotonic() - inicio)
+            desplazamiento += leidos
+            self._actual = (entrada, folder, nombre, tamanio, desplazamiento, destino)
+            if desplazamiento >= tamanio or not leidos:
+                self._completar()
+            return leidos
+        except (gp.GPhoto2Error, OSError) as e:
+            self.app.logger.error("Error drenando RAW de la cámara: %s", e)
+            self._descartar_actual()
+            self._espera_hasta = time.monotonic() + self.espera_error
+            return 0
+
+    def _abrir_siguiente(self, buscar):
+        '''
+        Abre el primer CR3 que se pueda descargar. Los que todavía esperan su evento se
+        saltean; pasado espera_evento se buscan en el índice de la cámara.
+        '''
+        ahora = time.monotonic()
+        entradas = list(self.app.descargar_raw)
+        futuros = {entrada[2] for entrada in entradas if len(entrada) > 2}
+        self._sin_evento = {f: t for f, t in self._sin_evento.items() if f in futuros}
+        for entrada in entradas:
+            futuro = entrada[2] if len(entrada) > 2 else None
+            if futuro is not None and futuro.done() and not futuro.cancelled():
+                if self._abrir(entrada, buscar):
+                    return True
+                continue
+            if futuro is not None and not futuro.done():
+                # El CR3 todavía se está escribiendo en la tarjeta o su evento no llegó
+                desde = self._sin_evento.setdefault(futuro, ahora)
+                if ahora - desde < self.espera_evento:
+                    continue
+            # Sin evento: se busca en el índice; si hay que recorrer la tarjeta, solo en reposo
+            if (buscar or self.app.indice_camara.construido) and self._abrir(entrada, buscar):
+                return True
+        return False
+
+    def _abrir(self, entrada, buscar):
+        folder, nombre = self.app.ubicar_raw(entrada, recorrer=buscar)
+        if not nombre and not buscar:
+            # Puede faltar solo en el índice: se confirma recorriendo la tarjeta en reposo
+            return False
+        if not nombre:
+            self.app.logger.info(f"No se encontró RAW {entrada[0]} en la cámara.")
+            self.app.diario_raw.registrar(entrada[0], entrada[1], DiarioRaw.PERDIDO)
+            self._quitar(entrada)
+            return False
+        tamanio = self.app.camera.file_get_info(folder, nombre).file.size
+        ruta = os.path.join(self.app.directorio_app, entrada[1].replace('.jpg', '.cr3'))
+        destino = open(ruta + SUFIJO_TEMPORAL, 'wb')
+        self._actual = (entrada, folder, nombre, tamanio, 0, destino)
+        return True
+
+    def _completar(self):
+        entrada, folder, nombre, _, _, destino = self._actual
+        self._actual = None
+        destino.flush()
+        os.fsync(destino.fileno())
+        destino.close()
+        ruta = destino.name[:-len(SUFIJO_TEMPORAL)]
+        os.replace(destino.name, ruta)
+        self.app.camera.file_delete(folder, nombre)
+        self.app.indice_camara.quitar(folder, nombre)
+        self.app.diario_raw.registrar(entrada[0], entrada[1], DiarioRaw.DESCARGADO)
+        self.descargados += 1
+        self._quitar(entrada)
+        self.app.logger.info(f"RAW drenado: {ruta} (eliminado de la cámara {folder}/{nombre})")
+
+    def _quitar(self, entrada):
+        try:
+            self.app.descargar_raw.remove(entrada)
+        except ValueError:
+            pass
+        Clock.schedule_once(lambda dt: self.app.actualizar_color_boton_descargar_raw(), 0)
+
+    def _descartar_actual(self):
+        if self._actual is None:
+            return
+        destino = self._actual[5]
+        self._actual = None
+        try:
+            destino.close()
+            os.unlink(destino.name)
+        except OSError:
+            pass
+
+
+class TrabajadorCaptura(threading.Thread):
+    '''
+    Corre el lazo de captura (alineación, disparo y avance) fuera del hilo de Kivy,
+    así la ventana no se congela mientras se alinea un frame.
+    La interfaz manda comandos (iniciar, pausar, reanudar, un paso) y recibe eventos
+    ("pausada", "limpiar_impresora", "frame") que procesa en su propio hilo.
+    '''
+    INICIAR = "iniciar"
+    PAUSAR = "pausar"
+    REANUDAR = "reanudar"
+    PASO = "paso"
+    DETENER = "detener"
+
+    def __init__(self, app, intervalo=INTERVAL):
+        super().__init__(name="trabajador-captura", daemon=True)
+        self.app = app
+        self.intervalo = intervalo
+        self.eventos = queue.Queue()
+        self._comandos = queue.Queue()
+        self._corriendo = False
+        # Libre cuando no hay ningún frame en curso
+        self._en_reposo = threading.Event()
+        self._en_reposo.set()
+        # Funciones a llamar (en este hilo) cuando se detiene después de una pausa
+        self._al_pausar = []
+        self._lock_al_pausar = threading.Lock()
+
+    @property
+    def corriendo(self):
+        return not self._en_reposo.is_set()
+
+    def enviar(self, comando):
+        if comando in (self.INICIAR, self.REANUDAR, self.PASO):
+            self._en_reposo.clear()
+        self._comandos.put(comando)
+
+    def pausar(self, al_pausar=None):
+        '''
+        Pide la pausa sin esperar: al_pausar() se llama desde este hilo cuando termina el
+        frame en curso (no desde el de Kivy, así la interfaz no se congela).
+        '''
+        if al_pausar is not None:
+            with self._lock_al_pausar:
+                self._al_pausar.append(al_pausar)
+        self.enviar(self.PAUSAR)
+
+    def _avisar_pausa(self):
+        with self._lock_al_pausar:
+            funciones, self._al_pausar = self._al_pausar, []
+        for funcion in funciones:
+            try:
+                funcion()
+            except Exception as e: # pylint: disable=W0718
+                self.app.logger.error("Error al completar la pausa de la captura: %s", e)
+
+    def emitir(self, tipo, dato=None):
+        self.eventos.put((tipo, dato))
+
+    def detener(self):
+        if self.is_alive():
+            self.enviar(self.DETENER)
+            self.join(timeout=15.0)
+
+    def run(self):
+        while True:
+            try:
+                comando = self._comandos.get(block=not self._corriendo)
+            except queue.Empty:
+                comando = None
+            if comando == self.DETENER:
+                break
+            if comando in (self.INICIAR, self.REANUDAR):
+                self._corriendo = True
+            elif comando == self.PAUSAR:
+                self._corriendo = False
+            elif comando == self.PASO:
+                self._ciclo(forzar=True)
+            # Procesar todos los comandos pendientes antes del próximo frame
+            if comando is not None and not self._comandos.empty():
+                continue
+            if self._corriendo:
+                self._corriendo = self._ciclo()
+            if not self._corriendo and self._comandos.empty():
+                self._en_reposo.set()
+                self._avisar_pausa()
+        self._en_reposo.set()
+        self._avisar_pausa()
+
+    def _ciclo(self, forzar=False):
+        '''Un frame. Devuelve False si la digitalización tiene que detenerse'''
+        app = self.app
+        if not forzar and (app.pausar_digitalizacion or app.limpiar_impresora):
+            app.logger.info("Digitalización pausada, no se capturará el frame.")
+            if app.pausar_digitalizacion:
+                self.emitir("pausada")
+            return False
+
+        inicio = time.monotonic()
+        frame = app.count
+        try:
+            with app.lock_camara:
+                app.capture_frame(0, forzar=forzar)
+        except Exception as e: # pylint: disable=W0718
+            app.logger.error("Error en el trabajador de captura: %s", e)
+            return False
+
+        if app.count != frame:
+            self.emitir("frame", app.count)
+        restante = self.intervalo - (time.monotonic() - inicio)
+        if restante > 0:
+            time.sleep(restante)
+        return True
+
+
 class CamApp(App):
     '''CammApp'''
     directorio_app = directorio
@@ -573,7 +1595,6 @@ class CamApp(App):
         self.digitalizando = False
         self.limpiar_impresora = True
         self.mostrar_cuadricula = True
-        self.primer_foto = True
         
         # NUEVO: Flag para controlar operaciones asíncronas
         self._digitalizacion_activa = False
@@ -591,17 +1612,18 @@ class CamApp(App):
         # Variables para timer y manejo de estado
         self.timer = None
         
-        # Caché para optimizar búsqueda de imágenes en cámara
-        self.last_found_folder = "/"
-        
         # Variable para almacenar imagen verificada para mostrar en UI
         self._imagen_actual_verificada = None
+        self.ultimo_frame_mostrado = -1
+        self.lock_frame_mostrado = threading.Lock()
 
         self.printer_pattern = ''
         #self.printer_pattern_16mm = [62, 54, 54, 52] # si no avanza lo suficiente alterno 62 y 63
         #self.printer_pattern_16mm = [55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 55, 54]
-        self.printer_pattern_16mm = [10]
-        self.printer_pattern_35mm = [22]
+        self.printer_pattern_16mm = PATRON_IMPRESORA_16MM
+        self.printer_pattern_35mm = PATRON_IMPRESORA_35MM
+        # Aprende el avance en bloque de cada formato a partir de las correcciones
+        self.controladores = {}
 
         # Zona de analisis de perforación
         self.zona_x_inicio = ''
@@ -628,13 +1650,22 @@ class CamApp(App):
         self.zona_yf = 0
         self.umbral_grey = 0
 
-        self.cantidad_perforaciones = 0
         self.formato_digitalizar = ''
         
         # self.umbral_px_blancos = 5000
         self.umbral_px_blancos_16mm = 2400
         self.umbral_px_blancos_35mm = 1850
         self.umbral_px_blancos = ''
+
+        # Análisis de la zona de perforación (se configura al elegir el formato)
+        self.analizador = AnalizadorPerforacion()
+
+        # Predictor del avance, uno por formato para no mezclar calibraciones
+        self.predictores = {}
+
+        # Limpieza de la impresora según la deriva de la alineación, una por formato
+        self.programadores_limpieza = {}
+        self.programador_limpieza = ProgramadorLimpieza()
         
         self.mostrar_debug = False
 
@@ -650,6 +1681,8 @@ class CamApp(App):
         self.tecla_salir = 'q'
         self.tecla_mostrar_cuadricula = 'l'
         self.tecla_descargar_raw = 'd'
+        self.tecla_grabar_sesion = 'g'
+        self.tecla_un_frame = 'f'
 
         self.icono_play = 'Utils/Iconos/play.png'
         self.icono_adelantar = 'Utils/Iconos/ff.png'
@@ -657,6 +1690,65 @@ class CamApp(App):
 
         self.configurar_logger_en_directorio()
 
+        # Descarta las vistas previas anteriores al último movimiento del film
+        self.frescura = VerificadorFrescura(ASENTAMIENTO_MINIMO, ASENTAMIENTO_MAXIMO, logger=self.logger)
+
+        # Grabación de sesiones de alineación para reproducirlas sin cámara (tecla g)
+        self.grabador = GrabadorSesion(DIRECTORIO_SESIONES, logger=self.logger)
+        self.depuracion = EscritorDepuracion(DIRECTORIO_DEPURACION, logger=self.logger)
+
+        # Lazo de alineación de la perforación (el mismo que usan la simulación y la reproducción)
+        self.alineador = AlineadorPerforacion(self.analizador, self.mover_x_px, PredictorAvance(), logger=self.logger)
+        self.alineador.configurar(1, ControladorAvance(self.printer_pattern_16mm))
+        self.alineador.al_decidir = self.decision_alineacion
+        self.alineador.al_aprender_patron = self.guardar_patron_impresora
+
+        # Avances del film con comandos precalculados escritos directo en la impresora
+        opciones_transporte = {}
+        if TRANSPORTE_IMPRESORA == TransporteAvancePapel.nombre:
+            opciones_transporte["unidades_por_punto"] = TRANSPORTE_UNIDADES_POR_PUNTO
+        try:
+            transporte = crear_transporte(TRANSPORTE_IMPRESORA, logger=self.logger, **opciones_transporte)
+        except ValueError as e:
+            self.logger.error("%s; se usa raster", e)
+            transporte = crear_transporte("raster", logger=self.logger)
+        self.transporte = TransporteAgrupado(transporte, VENTANA_AGRUPADO_MOVIMIENTOS, logger=self.logger)
+
+        # Archivos de la tarjeta de la cámara (se mantiene con los eventos de la cámara)
+        self.indice_camara = IndiceArchivos(logger=self.logger)
+        # Puerto y modelo de la cámara recordados para reconectar sin detectar todo
+        self.sesion_camara = SesionCamara(CAMARA, logger=self.logger)
+        # Qué CR3 de la cámara va con cada frame, en disco hasta que se descarga
+        self.diario_raw = DiarioRaw(ARCHIVO_DIARIO_RAW, logger=self.logger)
+        try:
+            self.diario_raw.abrir()
+        except OSError as e:
+            self.logger.error("No se pudo abrir el diario de RAW: %s", e)
+
+        # Los JPG se escriben con nombre temporal y se renombran cuando están en disco
+        # El diario de RAW llega al disco junto con cada lote de JPG
+        self.escritor_frames = EscritorAtomico(logger=self.logger, al_confirmar=self.diario_raw.sincronizar)
+
+        # Motor de previsualización (textura única durante la sesión)
+        self.motor_preview = MotorPrevisualizacion(logger=self.logger)
+
+        # La cámara se comparte entre el hilo de previsualización y la captura
+        self.lock_camara = threading.RLock()
+        self.cuadros_preview = BufferCuadros(capacidad=3)
+        self.bomba_eventos = BombaEventos(self, self.lock_camara)
+        self.canalizacion = CanalizacionCaptura(self)
+        # El lazo de captura corre en su propio hilo; la interfaz solo manda comandos
+        self.trabajador_captura = TrabajadorCaptura(self)
+        # Los CR3 se descargan durante la digitalización en vez de al final del rollo
+        self.drenaje_raw = DrenajeRaw(self, self.lock_camara)
+        # La cámara está cerrada para que la use Entangle
+        self._camara_cedida = False
+        # La impresora la usan el trabajador y las teclas de ajuste manual
+        self.lock_impresora = threading.RLock()
+        self.productor_preview = ProductorPrevisualizacion(
+            self, self.motor_preview, self.cuadros_preview, self.lock_camara
+        )
+
     def build(self):
         '''Crea la aplicación'''
         Window.maximize()
@@ -683,6 +1775,10 @@ class CamApp(App):
         # Imagen principal
         left_layout.add_widget(self.img1)
 
+        # Cuadrícula de alineación como capa vectorial sobre la imagen
+        self.cuadricula = CuadriculaAlineacion(self.img1, self.motor_preview)
+        self.cuadricula.mostrar(self.mostrar_cuadricula)
+
         self.asignar_camaras()
 
         # Botones de acción abajo, centrados
@@ -1000,6 +2096,7 @@ class CamApp(App):
 
             camera.init()
             self.camera = camera
+            self.indice_camara.invalidar()
 
             self.logger.info("Cámara reiniciada correctamente")
 
@@ -1008,80 +2105,21 @@ class CamApp(App):
 
 
     def asignar_camaras(self):
-        """Asignar las cámaras disponibles basadas en los seriales."""
-        asignacion_ok = True
+        """Conecta la cámara del número de serie configurado (reusa la sesión si sigue abierta)"""
         self.logger.debug("Comenzando asignación de cámaras")
-
+        inicio = time.monotonic()
         try:
-            # Liberar cualquier cámara previamente asignada
-            if hasattr(self, 'camera') and self.camera:
-                self.camera = None
-            if hasattr(self, 'camara') and self.camara:
-                self.camara = None
-
-            autodetected = gp.Camera.autodetect()
-            camera_list = [
-                (autodetected.get_name(i), autodetected.get_value(i))
-                for i in range(autodetected.count())
-            ]
-            self.logger.debug("Cámaras autodetectadas: %s", camera_list)
-            camera_list.sort(key=lambda x: x[0]) # Ordena las cámaras por nombre (o dirección)
-
-            port_info_list = gp.PortInfoList() # pylint: disable=no-member
-            port_info_list.load() # Carga la lista de puertos disponibles
-
-            for name, addr in camera_list:
-                self.logger.debug("Asignando cámara: %s en %s", name, addr)                
-                self.camara = gp.Camera()  # Inicializa la cámara que se va a asignar
-                idx = port_info_list.lookup_path(addr)  # Busca la cámara en la lista de puertos
-                self.camara.set_port_info(port_info_list[idx])  # Asigna puerto a la cámara
-
-                try:
-                    self.logger.debug("Inicializando cámara...")
-                    self.camara.exit()
-                    self.camara.init()
-
-                    # Configurar capturetarget para guardar en SD card
-                    try:
-                        config = self.camara.get_config()
-                        ok, capture_target_widget = gp.gp_widget_get_child_by_name(config, 'capturetarget')
-                        if ok >= gp.GP_OK:
-                            count = gp.gp_widget_count_choices(capture_target_widget)
-                            for i in range(count):
-                                choice = gp.gp_widget_get_choice(capture_target_widget, i)
-                                self.logger.debug(f"Opción capturetarget[{i}]: {choice}")
-                            gp.gp_widget_set_value(capture_target_widget, 'Memory card')
-                            self.camara.set_config(config)
-                            self.logger.info("✅ Cámara configurada para guardar en la tarjeta SD.")
-                        else:
-                            self.logger.warning("No se encontró el parámetro 'capturetarget'")
-                    except Exception as e:
-                        self.logger.warning("Error configurando 'capturetarget': %s", e)
-                    
-                    # Obtener número de serie para verificar si es la cámara esperada
-                    config_camara = self.camara.get_config()
-                    self.logger.debug("config_camara: %s", config_camara)
-                    name = 'serialnumber'
-                    gp_ok, serialnumber_config = gp.gp_widget_get_child_by_name(config_camara, name)
-
-                    self.logger.debug("gp_ok: %s", gp_ok)
-                    self.logger.debug("gp.GP_OK: %s", gp.GP_OK)                    
-                    self.logger.debug("p_ok >= gp.GP_OK: %s", gp_ok >= gp.GP_OK)
-
-                    if gp_ok >= gp.GP_OK: # pylint: disable=no-member
-                        raw_value = serialnumber_config.get_value()
-                        self.logger.debug("Raw Value: %s", raw_value)
-
-                        if raw_value == CAMARA:
-                            self.camera = self.camara
-                        else:
-                            self.logger.warning("No se asignó la cámara con serial %s.", raw_value)
-                            asignacion_ok = False
-                except gp.GPhoto2Error as e:
-                    self.logger.error("Error al inicializar cámara %s: %s", name, e)
-
-            if asignacion_ok:
-                self.logger.info("Cámaras asignadas correctamente.")
+            with self.lock_camara:
+                anterior = self.camera
+                self.camera = self.camara = self.sesion_camara.conectar()
+            if self.camera is None:
+                self.logger.warning("No se encontró la cámara con serial %s.", CAMARA)
+                return
+            if self.camera is not anterior:
+                # Sesión nueva: la tarjeta pudo cambiar mientras la cámara estaba cerrada
+                self.indice_camara.invalidar()
+            self.logger.info("Cámaras asignadas correctamente en %.0f ms (%s)",
+                             (time.monotonic() - inicio) * 1000, self.sesion_camara.conexiones)
         except gp.GPhoto2Error as e:
             self.logger.error("Error de GPhoto2: %s", e)
         except ValueError as e:        
@@ -1117,6 +2155,10 @@ class CamApp(App):
             self.btn_exit_callback()
         elif args[3] == self.tecla_descargar_raw:
             self.descargar_archivos_raw()
+        elif args[3] == self.tecla_grabar_sesion:
+            self.toggle_grabar_sesion()
+        elif args[3] == self.tecla_un_frame:
+            self.capturar_un_frame()
         elif args[3] == '¡':
             self.debug_camptura()
         return True
@@ -1127,6 +2169,14 @@ class CamApp(App):
         Window.bind(on_request_close=self.btn_exit_callback)
 
         self.configurar_logger_en_directorio()
+        self.productor_preview.start()
+        self.bomba_eventos.start()
+        self.canalizacion.start()
+        self.trabajador_captura.start()
+        self.drenaje_raw.start()
+        # CR3 que quedaron pendientes si la sesión anterior se cortó: no esperan al próximo rollo
+        self.recuperar_descargas_raw()
+        Clock.schedule_interval(self.procesar_eventos_captura, 0.1)
         print("Abre popup formatos")
         self.mostrar_popup_formato()
 
@@ -1300,17 +2350,16 @@ class CamApp(App):
 
     def guardar_ultimo_cr3_pendiente(self):
         try:
-            folder = "/"
-            camera_list = self.camera.folder_list_files(folder)
-            file_names = [camera_list.get_name(i) for i in range(camera_list.count())]
-            self.logger.debug("Archivos pendientes en cámara: %s", file_names)
-            cr3_files = sorted([f for f in file_names if f.lower().endswith(".cr3")])
+            if not self.indice_camara.construido:
+                self.indice_camara.construir(self.camera)
+            cr3_files = self.indice_camara.archivos(".cr3")
+            self.logger.debug("Archivos pendientes en cámara: %s", self.indice_camara.archivos())
             if not cr3_files:
                 self.logger.debug("No hay CR3 pendientes por guardar.")
             else:
                 count_anterior = self.count - 1
                 # Guardar todos los CR3 pendientes de atrás hacia adelante
-                for last_cr3 in reversed(cr3_files):
+                for folder, last_cr3 in reversed(cr3_files):
                     if count_anterior < 0:
                         break
                     cr3_path = (self.template % count_anterior).replace(".jpg", ".cr3")
@@ -1318,17 +2367,17 @@ class CamApp(App):
                     self.camera.file_get(folder, last_cr3, gp.GP_FILE_TYPE_NORMAL, cr3_file)
                     cr3_file.save(cr3_path)
                     self.camera.file_delete(folder, last_cr3)
+                    self.indice_camara.quitar(folder, last_cr3)
                     self.logger.info("Guardado CR3 pendiente como: %s", cr3_path)
                     count_anterior -= 1
             
             # Limpieza de archivos residuales
-            camera_list = self.camera.folder_list_files(folder)
-            file_names = [camera_list.get_name(i) for i in range(camera_list.count())]
+            file_names = self.indice_camara.archivos()
             self.logger.debug("Archivos pendientes en cámara: %s", file_names)
-            if file_names:
-                for name in sorted(file_names):
-                    self.camera.file_delete(folder, name)
-                    self.logger.debug("Eliminando pendiente: %s", name)
+            for folder, name in file_names:
+                self.camera.file_delete(folder, name)
+                self.indice_camara.quitar(folder, name)
+                self.logger.debug("Eliminando pendiente: %s", name)
         except Exception as e:
             self.logger.error("Error al guardar CR3 pendientes: %s", e)
 
@@ -1340,6 +2389,7 @@ class CamApp(App):
 
             if numero_de_contador:
                 self.count = int(numero_de_contador)
+                self.ultimo_frame_mostrado = -1
                 self.btn_contador.text = "Frame\n(+)"
                 self.estado_actual.text = f"Directorio: {self.directorio_app} \n Frame: {self.count}"
                 self.logger.debug("Nuevo número de frame asignado: %s", self.count)
@@ -1421,17 +2471,15 @@ class CamApp(App):
             # print(f"Occurió un error al intentar abrir la carpeta: {e}")
             self.logger.error("Error al abrir la carpeta: %s", e)
     
-    def pausar(self, *args):
-        '''Pausa la digitalización y captura de imágenes'''
+    def pausar(self, *args, al_pausar=None):
+        '''
+        Pausa la digitalización y captura de imágenes. No espera en el hilo de Kivy: el
+        trabajador termina el frame en curso y el resto sigue en _pausa_trabajador.
+        al_pausar se llama en el hilo de Kivy con la pausa completa.
+        '''
         self.logger.warning("Pausando digitalización...")
         self.pausar_digitalizacion = True
 
-        try:
-            Clock.unschedule(self.capture_frame_wrapper)
-            self.logger.debug("Clock de captura detenido.")
-        except Exception as e:
-            self.logger.error(f"No se pudo detener Clock: {e}")
-
         # Si justo se disparó una foto antes de pausar, elimínala de la cámara
         '''
         time.sleep(1.0)
@@ -1445,21 +2493,48 @@ class CamApp(App):
         if hasattr(self, 'popup_limpieza') and self.popup_limpieza and self.popup_limpieza.parent:
             self.popup_limpieza.dismiss()
 
-        self.p._raw(b'\x1b@')
+        # El trabajador termina el frame en curso antes de usar la impresora
+        self.trabajador_captura.pausar(lambda: self._pausa_trabajador(al_pausar))
+
+        def verificar_pausa(dt): # pylint: disable=unused-argument
+            if self.trabajador_captura.corriendo:
+                self.logger.error("El trabajador de captura no se detuvo a tiempo")
+        Clock.schedule_once(verificar_pausa, 15.0)
+
+    def _pausa_trabajador(self, al_pausar=None):
+        '''Con el trabajador detenido (en su hilo): reinicia la impresora y vuelve a la interfaz'''
+        self.logger.debug("Trabajador de captura detenido.")
+        try:
+            with self.lock_impresora:
+                self.transporte.reiniciar()
+        except (RuntimeError, OSError) as e:
+            self.logger.error("No se pudo reiniciar la impresora: %s", e)
         time.sleep(2)
         # self.eliminar_archivos_residuales()
         self.logger.info("Digitalización pausada")
 
         # Resetear el flag de digitalización para reanudar live view
         self.digitalizando = False
-        
-        Clock.schedule_once(lambda dt: self._reanudar_previsualizacion(), 0)
+        Clock.schedule_once(lambda dt: self._pausa_completa(al_pausar), 0)
+
+    def _pausa_completa(self, al_pausar=None):
+        '''Parte de la pausa que toca la interfaz (hilo de Kivy)'''
+        self._reanudar_previsualizacion()
         Window.bind(on_key_down=self.key_action)
 
+        # La alineación se viene deteriorando: se aprovecha la pausa para limpiar
+        if self.programador_limpieza.conviene_limpiar():
+            self.logger.warning("Deriva de alineación %.2f: se sugiere limpiar la impresora en esta pausa",
+                                self.programador_limpieza.deriva())
+            self.popup_limpiar_impresora()
+        if al_pausar:
+            al_pausar()
+
     def descargar_archivos_raw(self, *args):
         '''Descarga los archivos RAW de la cámara'''
         self.logger.debug("Iniciando descarga de archivos RAW...")
         self.loading_cursor(True)
+        self.productor_preview.pausar()
         if hasattr(self, 'timer') and self.timer:
             Clock.unschedule(self.update)
             self.timer = None
@@ -1468,14 +2543,18 @@ class CamApp(App):
 
         def tarea_descarga():
             error_ocurrido = False
+            self.drenaje_raw.suspender()
             try:
                 if not hasattr(self, 'descargar_raw') or not self.descargar_raw:
                     self.logger.info("No hay archivos RAW para descargar.")
                     Clock.schedule_once(lambda dt: self._cerrar_popup_descargando_raw(), 0)
                     return
 
-                total_raws = len(self.descargar_raw)
-                for index, raw_image in enumerate(self.descargar_raw, 1):
+                # La captura y la recuperación pueden agregar entradas mientras tanto
+                lote = list(self.descargar_raw)
+                procesados = []
+                total_raws = len(lote)
+                for index, raw_image in enumerate(lote, 1):
                     raw_name = raw_image[0]
                     raw_download_name = raw_image[1].replace('.jpg', '.cr3')
                     
@@ -1485,15 +2564,20 @@ class CamApp(App):
                     Clock.schedule_once(lambda dt, text=progress_text, value=progress_value: self._actualizar_progreso_descarga(text, value), 0)
                     
                     self.logger.debug(f"Descargando RAW: {raw_name} como {raw_download_name}")
-                    folder, raw_file = self.buscar_imagen_en_camara(self.camera, nombre=raw_name, raw=True)
+                    folder, raw_file = self.ubicar_raw(raw_image)
                     if raw_file:
                         raw_path = os.path.join(self.directorio_app, raw_download_name)
                         try:
-                            camera_file = gp.CameraFile()
-                            self.camera.file_get(folder, raw_file, gp.GP_FILE_TYPE_NORMAL, camera_file)
-                            camera_file.save(raw_path)
-                            self.logger.info(f"Descargado RAW: {raw_path}")
-                            self.camera.file_delete(folder, raw_file)
+                            # libgphoto2 no es seguro entre hilos: la bomba de eventos también usa la cámara
+                            with self.lock_camara:
+                                camera_file = gp.CameraFile()
+                                self.camera.file_get(folder, raw_file, gp.GP_FILE_TYPE_NORMAL, camera_file)
+                                camera_file.save(raw_path)
+                                self.logger.info(f"Descargado RAW: {raw_path}")
+                                self.camera.file_delete(folder, raw_file)
+                                self.indice_camara.quitar(folder, raw_file)
+                            self.diario_raw.registrar(raw_name, raw_image[1], DiarioRaw.DESCARGADO)
+                            procesados.append(raw_image)
                             self.logger.info(f"Eliminado RAW de la cámara: {folder}/{raw_file}")
                         except Exception as e:
                             self.logger.error(f"Error al descargar/eliminar RAW {raw_file}: {e}")
@@ -1501,14 +2585,22 @@ class CamApp(App):
                             break
                     else:
                         self.logger.info(f"No se encontró RAW {folder}/{raw_name} en la cámara.")
+                        self.diario_raw.registrar(raw_name, raw_image[1], DiarioRaw.PERDIDO)
+                        procesados.append(raw_image)
+                self.indice_camara.reportar()
 
-                if not error_ocurrido:
-                    self.descargar_raw.clear()
-                    Clock.schedule_once(lambda dt: self.actualizar_color_boton_descargar_raw(), 0)
+                for raw_image in procesados:
+                    try:
+                        self.descargar_raw.remove(raw_image)
+                    except ValueError:
+                        pass
+
+                Clock.schedule_once(lambda dt: self.actualizar_color_boton_descargar_raw(), 0)
             except Exception as e:
                 self.logger.error(f"Error al descargar archivos RAW: {e}")
                 error_ocurrido = True
             finally:
+                self.drenaje_raw.reanudar()
                 # Programar finalización en el hilo principal
                 Clock.schedule_once(lambda dt: self._cerrar_popup_descargando_raw(), 0)
                 Clock.schedule_once(lambda dt: self._reanudar_previsualizacion(), 0)
@@ -1552,26 +2644,18 @@ class CamApp(App):
             
         self.logger.info("Eliminando archivos residuales de la cámara...")
         self.logger.debug("Archivos a eliminar: %s", self.eliminar_foto)
-        # Busca en todas las carpetas posibles
-        def eliminar_en_carpeta(camera, folder, nombres):
-            camera_list = camera.folder_list_files(folder)
-            files_names = [camera_list.get_name(i) for i in range(camera_list.count())]
-            for nombre in nombres:
-                if nombre in files_names:
-                    try:
-                        camera.file_delete(folder, nombre)
-                        self.logger.info(f"Eliminado: {folder}/{nombre}")
-                    except Exception as e:
-                        self.logger.error(f"Error al eliminar {folder}/{nombre}: {e}")
-
-        def buscar_y_eliminar(camera, folder, nombres):
-            eliminar_en_carpeta(camera, folder, nombres)
-            folders = camera.folder_list_folders(folder)
-            for i in range(folders.count()):
-                subfolder = os.path.join(folder, folders.get_name(i))
-                buscar_y_eliminar(camera, subfolder, nombres)
-
-        buscar_y_eliminar(self.camera, "/", self.eliminar_foto)
+        if not self.indice_camara.construido:
+            self.indice_camara.construir(self.camera)
+        for nombre in self.eliminar_foto:
+            folder, encontrado = self.indice_camara.ubicar(nombre)
+            if not encontrado:
+                continue
+            try:
+                self.camera.file_delete(folder, encontrado)
+                self.indice_camara.quitar(folder, encontrado)
+                self.logger.info(f"Eliminado: {folder}/{encontrado}")
+            except Exception as e:
+                self.logger.error(f"Error al eliminar {folder}/{encontrado}: {e}")
         self.eliminar_foto.clear()
 
     def cambiar_directorio(self, *args): # pylint: disable=unused-argument
@@ -1628,17 +2712,20 @@ class CamApp(App):
     def arranca_callback(self):
         '''Callback'''
         if self.lview:
+            self.productor_preview.pausar()
             self.timer = Clock.unschedule(self.update, 1)
 
         try:
             self.p = self.detectar_ubicacion_impresora()
             self.p._raw(b'\x1b@')
             self.p.profile.media['width']['pixels'] = 35
+            self.transporte.abrir(self.p.devfile)
         except Exception as e:
             self.logger.error("Error al detectar la impresora: %s", e)
             self.show_error_dialog("Verifique si la impresora está encendida y conectada.", True)
             try:
                 self.p = self.detectar_ubicacion_impresora()
+                self.transporte.abrir(self.p.devfile)
                 self.logger.info("Impresora detectada correctamente.")
             except Exception as reconectar_error:
                 self.logger.error("No se pudo reconectar la impresora: %s", reconectar_error)
@@ -1646,7 +2733,9 @@ class CamApp(App):
         self.lview = True
         self.title = NOMBRE_ARCHIVO
         if self.camera:
-            self.timer = Clock.schedule_interval(self.update, 1.0/24.0)
+            self.motor_preview.reiniciar_medicion()
+            self.productor_preview.reanudar()
+            self.timer = Clock.schedule_interval(self.update, INTERVALO_PREVISUALIZACION)
         else:
             self.logger.error("No hay cámara asignada. No se puede iniciar la digitalización.")
             self.show_error_dialog("No hay cámara asignada. No se puede iniciar la digitalización.", True)
@@ -1666,8 +2755,13 @@ class CamApp(App):
         # self.guardar_ultimo_cr3_pendiente()
         self.loading_cursor(True)
         self.pausar_digitalizacion = True
-        self.pausar()
-        
+        # La salida sigue cuando el trabajador terminó el frame en curso
+        self.pausar(al_pausar=self._continuar_salida)
+        # La ventana se cierra desde _finalizar_salida
+        return True
+
+    def _continuar_salida(self):
+        '''Salida con la captura ya pausada'''
         # Verificar si hay RAWs pendientes
         if hasattr(self, 'descargar_raw') and self.descargar_raw:
             # Mostrar diálogo de confirmación
@@ -1713,6 +2807,8 @@ class CamApp(App):
             Window.bind(on_key_down=self.key_action)  # Restaurar teclado
             # Limpiar la lista de RAWs pendientes
             if hasattr(self, 'descargar_raw'):
+                for raw_image in self.descargar_raw:
+                    self.diario_raw.registrar(raw_image[0], raw_image[1], DiarioRaw.DESCARTADO)
                 self.descargar_raw.clear()
             self._finalizar_salida()
         
@@ -1761,6 +2857,15 @@ class CamApp(App):
 
     def _finalizar_salida(self):
         '''Finaliza la salida de la aplicación'''
+        self.productor_preview.detener()
+        self.trabajador_captura.detener()
+        self.drenaje_raw.detener()
+        self.bomba_eventos.detener()
+        self.canalizacion.detener()
+        self.grabador.detener()
+        self.depuracion.detener()
+        self.diario_raw.cerrar()
+        self.transporte.cerrar()
         self.kill_printer_processes()
         App.get_running_app().stop()
 
@@ -1769,6 +2874,7 @@ class CamApp(App):
         self.logger.debug("Iniciando descarga de archivos RAW antes de salir...")
 
         # Pausar la previsualización si está activa
+        self.productor_preview.pausar()
         if hasattr(self, 'timer') and self.timer:
             Clock.unschedule(self.update)
             self.timer = None
@@ -1778,14 +2884,18 @@ class CamApp(App):
 
         def tarea_descarga():
             error_ocurrido = False
+            self.drenaje_raw.suspender()
             try:
                 if not hasattr(self, 'descargar_raw') or not self.descargar_raw:
                     self.logger.info("No hay archivos RAW para descargar.")
                     Clock.schedule_once(lambda dt: self._finalizar_descarga_y_salida(), 0)
                     return
 
-                total_raws = len(self.descargar_raw)
-                for index, raw_image in enumerate(self.descargar_raw, 1):
+                # La captura y la recuperación pueden agregar entradas mientras tanto
+                lote = list(self.descargar_raw)
+                procesados = []
+                total_raws = len(lote)
+                for index, raw_image in enumerate(lote, 1):
                     raw_name = raw_image[0]
                     raw_download_name = raw_image[1].replace('.jpg', '.cr3')
                     
@@ -1795,15 +2905,20 @@ class CamApp(App):
                     Clock.schedule_once(lambda dt, text=progress_text, value=progress_value: self._actualizar_progreso_descarga(text, value), 0)
                     
                     self.logger.debug(f"Descargando RAW: {raw_name} como {raw_download_name}")
-                    folder, raw_file = self.buscar_imagen_en_camara(self.camera, nombre=raw_name, raw=True)
+                    folder, raw_file = self.ubicar_raw(raw_image)
                     if raw_file:
                         raw_path = os.path.join(self.directorio_app, raw_download_name)
                         try:
-                            camera_file = gp.CameraFile()
-                            self.camera.file_get(folder, raw_file, gp.GP_FILE_TYPE_NORMAL, camera_file)
-                            camera_file.save(raw_path)
-                            self.logger.info(f"Descargado RAW: {raw_path}")
-                            self.camera.file_delete(folder, raw_file)
+                            # libgphoto2 no es seguro entre hilos: la bomba de eventos también usa la cámara
+                            with self.lock_camara:
+                                camera_file = gp.CameraFile()
+                                self.camera.file_get(folder, raw_file, gp.GP_FILE_TYPE_NORMAL, camera_file)
+                                camera_file.save(raw_path)
+                                self.logger.info(f"Descargado RAW: {raw_path}")
+                                self.camera.file_delete(folder, raw_file)
+                                self.indice_camara.quitar(folder, raw_file)
+                            self.diario_raw.registrar(raw_name, raw_image[1], DiarioRaw.DESCARGADO)
+                            procesados.append(raw_image)
                             self.logger.info(f"Eliminado RAW de la cámara: {folder}/{raw_file}")
                         except Exception as e:
                             self.logger.error(f"Error al descargar/eliminar RAW {raw_file}: {e}")
@@ -1811,9 +2926,17 @@ class CamApp(App):
                             break
                     else:
                         self.logger.info(f"No se encontró RAW {folder}/{raw_name} en la cámara.")
+                        self.diario_raw.registrar(raw_name, raw_image[1], DiarioRaw.PERDIDO)
+                        procesados.append(raw_image)
+                self.indice_camara.reportar()
+
+                for raw_image in procesados:
+                    try:
+                        self.descargar_raw.remove(raw_image)
+                    except ValueError:
+                        pass
 
                 if not error_ocurrido:
-                    self.descargar_raw.clear()
                     self.logger.info("Descarga de RAWs completada antes de salir.")
             except Exception as e:
                 self.logger.error(f"Error al descargar archivos RAW: %e")
@@ -1824,6 +2947,7 @@ class CamApp(App):
                     Clock.schedule_once(lambda dt: self._finalizar_descarga_y_salida(), 0)
                 else:
                     # Mostrar popup de error y NO cerrar
+                    self.drenaje_raw.reanudar()
                     if hasattr(self, 'popup_descargando_raw') and self.popup_descargando_raw:
                         self.popup_descargando_raw.dismiss()
                     Clock.schedule_once(lambda dt: self._show_error_popup("Ocurrió un error al guardar los archivos RAW."), 0)
@@ -1844,6 +2968,15 @@ class CamApp(App):
 
     def _finalizar_salida(self):
         '''Finaliza la salida de la aplicación'''
+        self.productor_preview.detener()
+        self.trabajador_captura.detener()
+        self.drenaje_raw.detener()
+        self.bomba_eventos.detener()
+        self.canalizacion.detener()
+        self.grabador.detener()
+        self.depuracion.detener()
+        self.diario_raw.cerrar()
+        self.transporte.cerrar()
         self.kill_printer_processes()
         App.get_running_app().stop()
 
@@ -1872,13 +3005,19 @@ class CamApp(App):
         except Exception as e:
             self.logger.error("Error al intentar matar los procesos: %s", e)
 
-    def empty_event_queue(self, camera):
-        while True:
-            type_, data = camera.wait_for_event(10)
-            if type_ == gp.GP_EVENT_TIMEOUT:
-                return
-            # if type_ == gp.GP_EVENT_FILE_ADDED:
-                # self.logger.debug("Unexpected new file %s", data.folder + data.name)
+    def ubicar_raw(self, raw_image, recorrer=True):
+        '''
+        Carpeta y nombre del CR3 de una entrada de descargar_raw. Si el evento del
+        CR3 ya llegó no hace falta recorrer las carpetas de la cámara.
+        recorrer=False: solo el índice, sin recorrer la tarjeta si no está.
+        '''
+        raw_name = raw_image[0]
+        futuro = raw_image[2] if len(raw_image) > 2 else None
+        if futuro is not None and futuro.done() and not futuro.cancelled():
+            carpeta, nombre = futuro.result()
+            if nombre.lower() == raw_name.lower():
+                return carpeta, nombre
+        return self.buscar_imagen_en_camara(self.camera, nombre=raw_name, raw=True, recorrer=recorrer)
 
     def selecciona_directorio(self, seleccion):
         '''Selecciona directorio'''
@@ -1897,7 +3036,7 @@ class CamApp(App):
             
             # Guardar el directorio seleccionado en config.json
             try:
-                guardar_configuracion("DIRECTORIO", selected_path)
+                guardar_configuracion("DIRECTORIO", selected_path, self.logger)
                 self.logger.info("Directorio guardado en configuración: %s", selected_path)
             except Exception as e:
                 self.logger.error("Error al guardar directorio en configuración: %s", e)
@@ -1996,44 +3135,23 @@ class CamApp(App):
         if hasattr(self, 'digitalizando') and self.digitalizando:
             return
             
-        capture = None
-        capture = self.capture_preview_from_camara(self.camera)
-        # print(f"Capture en update: {capture}")
-
-        if capture:
-            # Procesamiento de la imagen
-            filedata = capture.get_data_and_size()
-            image = Imge.open(io.BytesIO(filedata))
-            image_array = np.asarray(image)
-
-            # Convertir la imagen a formato OpenCV y rotar la imagen
-            # se agrega k=3 para rotar 90 en el sentido inverso
-            rotated_image = np.rot90(np.swapaxes(image_array, 0, 1), k=1)
-            #rotated_image = image_array
-
-            preview_array = rotated_image
-            if self.mostrar_cuadricula:
-                preview_array = self.aplicar_cuadricula(preview_array)
-
-            # Crear una textura con la imagen para Kivy
-            video_texture = Texture.create(
-                size=(preview_array.shape[1], preview_array.shape[0]),
-                colorfmt='rgb'
-            )
-            video_texture.blit_buffer(
-                preview_array.tobytes(),
-                colorfmt='rgb',
-                bufferfmt='ubyte'
-            )
-
-            # Asignar la textura a la iagen de Kivy
-            self.img1.texture = video_texture
-            self.img1.size = video_texture.size
-            self.img1.size_hint = (1, 1)
-            self.img1.fit_mode = 'contain'
-        else:
-            # print("No se pudo capturar la vista previa.")
-            self.logger.error("No se pudo capturar la vista previa.")
+        # Solo se consume el cuadro más nuevo que dejó el productor
+        cuadro = self.cuadros_preview.ultimo()
+
+        if cuadro:
+            # Blit del cuadro ya decodificado sobre la textura de la sesión
+            # (la cuadrícula es una capa vectorial aparte y no toca el buffer)
+            video_texture = self.motor_preview.mostrar_cuadro(cuadro)
+
+            # Asignar la textura a la imagen de Kivy solo si cambió
+            # (por ejemplo, después de mostrar una captura)
+            if self.img1.texture is not video_texture:
+                self.img1.texture = video_texture
+                self.img1.size = video_texture.size
+                self.img1.size_hint = (1, 1)
+                self.img1.fit_mode = 'contain'
+            else:
+                self.img1.canvas.ask_update()
 
     @mainthread
     def update_image_texture(self, image_bgr):
@@ -2073,29 +3191,107 @@ class CamApp(App):
             import traceback
             self.logger.error(f"Traceback: {traceback.format_exc()}")
 
+    def recuperar_descargas_raw(self):
+        '''
+        Vuelve a encolar los CR3 que el diario tiene pendientes (después de un corte),
+        ubicándolos en el índice de la cámara; el drenaje los descarga enseguida.
+        Corre al iniciar la aplicación con la cámara conectada y al empezar cada rollo.
+        '''
+        en_cola = {(raw_image[0].lower(), raw_image[1]) for raw_image in self.descargar_raw}
+        nombres_en_cola = {raw for raw, _ in en_cola}
+        pendientes = [r for r in self.diario_raw.pendientes() if (r["raw"].lower(), r["jpg"]) not in en_cola]
+        if not pendientes or not self.camera:
+            return
+        recorrida = False
+        with self.lock_camara:
+            if not self.indice_camara.construido:
+                self.indice_camara.construir(self.camera)
+                recorrida = True
+        recuperados = 0
+        for registro in pendientes:
+            if registro["raw"].lower() in nombres_en_cola:
+                # La cámara reusó el nombre para un frame de esta sesión: no es el CR3 del diario
+                self.logger.warning("El nombre %s del diario es de otro frame en la cola", registro["raw"])
+                continue
+            folder, nombre = self.indice_camara.ubicar(registro["raw"])
+            if not nombre and not recorrida:
+                # El índice pudo perder el archivo: se recorre la tarjeta una vez antes de darlo por perdido
+                with self.lock_camara:
+                    self.indice_camara.construir(self.camera)
+                recorrida = True
+                folder, nombre = self.indice_camara.ubicar(registro["raw"])
+            if not nombre:
+                self.logger.warning("El CR3 %s del diario ya no está en la cámara", registro["raw"])
+                self.diario_raw.registrar(registro["raw"], registro["jpg"], DiarioRaw.PERDIDO)
+                continue
+            ubicacion = Future()
+            ubicacion.set_result((folder, nombre))
+            self.descargar_raw.append([nombre, registro["jpg"], ubicacion])
+            recuperados += 1
+        if recuperados:
+            self.logger.warning("Se recuperaron %d descargas de RAW pendientes del diario", recuperados)
+            Clock.schedule_once(lambda dt: self.actualizar_color_boton_descargar_raw(), 0)
+
+    def avisar_archivos_parciales(self):
+        '''Avisa si una sesión anterior se cortó con JPG sin confirmar en la carpeta'''
+        parciales = buscar_temporales(self.directorio_app)
+        if parciales:
+            self.logger.warning(
+                "Hay %d archivos parciales de una sesión interrumpida (por ejemplo %s)",
+                len(parciales), parciales[0]
+            )
+
+    def verificar_residuos(self):
+        '''Avisa si quedaron JPG sin descargar en la cámara (trabajo de la canalización)'''
+        try:
+            residuos = [nombre for _, nombre in self.indice_camara.archivos(".jpg")]
+            if residuos:
+                self.logger.warning("Archivos residuales en cámara: %s", residuos)
+        except Exception as e:
+            self.logger.debug("Error verificando residuos: %s", e)  # Debug level
+
+    def guardar_y_mostrar_captura(self, frame_number, jpg_path, datos_jpg):
+        '''Guarda el JPG tal como viene de la cámara y lo muestra (hilo de la canalización)'''
+        self.escritor_frames.escribir(jpg_path, datos_jpg)
+
+        # Con varios hilos un frame puede terminar después del siguiente: no mostrarlo
+        with self.lock_frame_mostrado:
+            if frame_number < self.ultimo_frame_mostrado:
+                return
+            self.ultimo_frame_mostrado = frame_number
+
+        # Para la interfaz alcanza con una decodificación reducida (escalado DCT):
+        # la imagen completa nunca se decodifica. La transposición, las rotaciones
+        # y el espejado que se aplicaban antes se anulaban entre sí, así que la
+        # orientación es la del JPG tal como viene.
+        imagen = Imge.open(io.BytesIO(datos_jpg))
+        imagen.draft('RGB', TAMANIO_CAPTURA_INTERFAZ)
+        image_rgb = np.asarray(imagen.convert('RGB'))
+        self._imagen_actual_verificada = image_rgb
+        self.logger.debug("JPG guardado sin modificaciones. Imagen para UI decodificada a %sx%s", *imagen.size)
+
+        self._mostrar_imagen_capturada_seguro(image_rgb, frame_number)
+        self._actualizar_contador_post_captura()
+
     @mainthread
-    def _mostrar_imagen_capturada_seguro(self, image_bgr, frame_number):
+    def _mostrar_imagen_capturada_seguro(self, image_rgb, frame_number):
         """Método seguro para mostrar imagen capturada en el hilo principal de Kivy"""
         try:
             self.logger.info(f"🎯 EJECUTANDO mostrar imagen capturada - Frame: {frame_number}")
             
-            if image_bgr is None:
-                self.logger.error(f"❌ Imagen BGR es None en _mostrar_imagen_capturada_seguro - Frame: {frame_number}")
-                self.logger.error(f"❌ Tipo de image_bgr: {type(image_bgr)}")
+            if image_rgb is None:
+                self.logger.error(f"❌ Imagen RGB es None en _mostrar_imagen_capturada_seguro - Frame: {frame_number}")
                 return
             
             # Crear textura directamente (más confiable que update_image_texture)
-            self.logger.debug(f"Creando textura para imagen {image_bgr.shape}")
+            self.logger.debug(f"Creando textura para imagen {image_rgb.shape}")
             
             texture = Texture.create(
-                size=(image_bgr.shape[1], image_bgr.shape[0]),
+                size=(image_rgb.shape[1], image_rgb.shape[0]),
                 colorfmt='rgb'
             )
             texture.flip_vertical()
             
-            # Convertir BGR a RGB
-            image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
-            
             # Actualizar textura
             texture.blit_buffer(
                 image_rgb.tobytes(),
@@ -2119,7 +3315,7 @@ class CamApp(App):
             # FALLBACK: Intentar con método original
             try:
                 self.logger.info("🔄 Intentando fallback con update_image_texture")
-                self.update_image_texture(image_bgr)
+                self.update_image_texture(cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR))
             except Exception as e2:
                 self.logger.error(f"❌ Fallback también falló: {e2}")
 
@@ -2140,6 +3336,13 @@ class CamApp(App):
             self.cuadricula_x2 = 240
             self.cuadricula_y1 = 560
             self.cuadricula_y2 = 490
+        else:
+            return
+
+        self.cuadricula.configurar(
+            (self.cuadricula_linea_x1, self.cuadricula_linea_x2, self.cuadricula_linea_x3),
+            (self.cuadricula_x1, self.cuadricula_y1, self.cuadricula_x2, self.cuadricula_y2)
+        )
             
 
     def digitalizar(self):
@@ -2155,7 +3358,6 @@ class CamApp(App):
         ''' Función para digitralizar films 35mm '''
         self.logger.warning("COMIENZO DIGITALIZACIÓN 35mm")
 
-        self.cantidad_perforaciones = 3
         self.zona_xi = self.zona_x_inicio_35mm
         self.zona_xf = self.zona_x_fin_35mm
         self.zona_yi = self.zona_y_inicio_35mm
@@ -2168,8 +3370,7 @@ class CamApp(App):
         # 🔧 CRÍTICO: Resetear flag de digitalización para permitir primera captura
         self.digitalizando = False
 
-        self.primer_foto = True
-
+        self.productor_preview.pausar()
         if hasattr(self, 'timer') and self.timer:
             Clock.unschedule(self.timer)
             self.timer = None
@@ -2182,25 +3383,37 @@ class CamApp(App):
         #if not os.path.exists(WORK_DIR):
         #    os.makedirs(WORK_DIR)
         self.template = os.path.join(self.directorio_app, f'{NOMBRE_ARCHIVO}-%05d.jpg')
+        self.avisar_archivos_parciales()
+        self.recuperar_descargas_raw()
         self.next_shot = time.time() + INTERVAL
         self.print_size = 0
         self.printer_pattern = self.printer_pattern_35mm
+        self.canalizacion.reiniciar_medicion()
         self.umbral_px_blancos = self.umbral_px_blancos_35mm
+        self.analizador.configurar(
+            (self.zona_xi, self.zona_xf, self.zona_yi, self.zona_yf),
+            self.umbral_grey,
+            self.umbral_px_blancos
+        )
+        # Al reanudar se vuelven a contar las perforaciones; el film pudo moverse a mano durante la pausa
+        self.alineador.configurar(
+            3,
+            self.controladores.setdefault("35mm", ControladorAvance(self.printer_pattern, logger=self.logger)),
+            self.controladores.setdefault(
+                "35mm-cuadro", ControladorAvance(self.printer_pattern, logger=self.logger)
+            ),
+            predictor=self.predictores.setdefault(self.formato_digitalizar, PredictorAvance(logger=self.logger))
+        )
+        self.programador_limpieza = self.programadores_limpieza.setdefault(
+            self.formato_digitalizar, ProgramadorLimpieza(logger=self.logger)
+        )
 
-        try:
-            self.camera.exit()
-            self.camera.init()
-            # self.liberar_usb_camara()
-            # self.reiniciar_camara_seguro()
-        except gp.GPhoto2Error as e:
-            #print("Reinicialización de cámara falló:", e)
-            self.logger.error("Reinicialización de cámara falló: %s", e)
+        if not self.reconectar_y_limpiar_camara():
             return 0
    
         try:
-            self.eliminar_archivos_residuales()
             # Clock.schedule_interval(self.capture_frame, INTERVAL)
-            Clock.schedule_once(self.capture_frame_wrapper, 0)
+            self.trabajador_captura.enviar(TrabajadorCaptura.INICIAR)
         except Exception as e:
             # print(f"Error no esperado en digitalizar_35mm: {e}")
             self.logger.error(f"Error no esperado en digitalizar_35mm: %e")
@@ -2210,7 +3423,6 @@ class CamApp(App):
         ''' Función para digitralizar films 16mm '''
         self.logger.warning("COMIENZO DIGITALIZACIÓN 16mm")
 
-        self.cantidad_perforaciones = 1        
         self.zona_xi = self.zona_x_inicio_16mm
         self.zona_xf = self.zona_x_fin_16mm
         self.zona_yi = self.zona_y_inicio_16mm
@@ -2223,6 +3435,7 @@ class CamApp(App):
         # 🔧 CRÍTICO: Resetear flag de digitalización para permitir primera captura
         self.digitalizando = False
 
+        self.productor_preview.pausar()
         if hasattr(self, 'timer') and self.timer:
             Clock.unschedule(self.timer)
             self.timer = None
@@ -2235,61 +3448,128 @@ class CamApp(App):
         #if not os.path.exists(WORK_DIR):
         #    os.makedirs(WORK_DIR)
         self.template = os.path.join(self.directorio_app, f'{NOMBRE_ARCHIVO}-%05d.jpg')
+        self.avisar_archivos_parciales()
+        self.recuperar_descargas_raw()
         self.next_shot = time.time() + INTERVAL
         self.print_size = 0
         self.printer_pattern = self.printer_pattern_16mm
+        self.canalizacion.reiniciar_medicion()
         self.umbral_px_blancos = self.umbral_px_blancos_16mm
+        self.analizador.configurar(
+            (self.zona_xi, self.zona_xf, self.zona_yi, self.zona_yf),
+            self.umbral_grey,
+            self.umbral_px_blancos
+        )
+        # Al reanudar se vuelven a contar las perforaciones; el film pudo moverse a mano durante la pausa
+        self.alineador.configurar(
+            1,
+            self.controladores.setdefault("16mm", ControladorAvance(self.printer_pattern, logger=self.logger)),
+            None,
+            predictor=self.predictores.setdefault(self.formato_digitalizar, PredictorAvance(logger=self.logger))
+        )
+        self.programador_limpieza = self.programadores_limpieza.setdefault(
+            self.formato_digitalizar, ProgramadorLimpieza(logger=self.logger)
+        )
 
-        try:
-            self.camera.exit()
-            self.camera.init()
-            # self.liberar_usb_camara()
-            # self.reiniciar_camara_seguro()
-        except gp.GPhoto2Error as e:
-            #print("Reinicialización de cámara falló:", e)
-            self.logger.error("Reinicialización de cámara falló: %s", e)
+        if not self.reconectar_y_limpiar_camara():
             return 0
    
         try:
-            self.eliminar_archivos_residuales()
             # Clock.schedule_interval(self.capture_frame, INTERVAL)
-            Clock.schedule_once(self.capture_frame_wrapper, 0)
+            self.trabajador_captura.enviar(TrabajadorCaptura.INICIAR)
         except Exception as e:
             # print(f"Error no esperado en digitalizar_16mm: {e}")
             self.logger.error(f"Error no esperado en digitalizar_16mm: %e")
             return 0
 
-    def capture_frame_wrapper(self, dt=None):
-        ''' Función que envuelve la captura de frame para manejar excepciones y pausas '''
-        if self.pausar_digitalizacion or self.limpiar_impresora:
-            self.logger.info("Digitalización pausada, no se capturará el frame.")
-            if self.pausar_digitalizacion:
-                self.pausar()
-            return
+    def reconectar_y_limpiar_camara(self):
+        '''
+        Reinicia la sesión de la cámara y borra los archivos residuales antes de digitalizar.
+        libgphoto2 no es seguro entre hilos: todo pasa con el lock de la cámara y con el
+        drenaje de RAW suspendido. Devuelve False si algo falló y no hay que digitalizar.
+        '''
+        self.drenaje_raw.suspender()
+        try:
+            with self.lock_camara:
+                try:
+                    self.camera.exit()
+                    self.camera.init()
+                    # self.liberar_usb_camara()
+                    # self.reiniciar_camara_seguro()
+                except gp.GPhoto2Error as e:
+                    #print("Reinicialización de cámara falló:", e)
+                    self.logger.error("Reinicialización de cámara falló: %s", e)
+                    return False
+                try:
+                    self.eliminar_archivos_residuales()
+                except Exception as e: # pylint: disable=W0718
+                    self.logger.error("Error al eliminar archivos residuales: %s", e)
+                    return False
+        finally:
+            self.drenaje_raw.reanudar()
+        return True
 
-        start = time.time()
+    def procesar_eventos_captura(self, dt=None):
+        '''Atiende en el hilo de Kivy los eventos del trabajador de captura'''
+        while True:
+            try:
+                tipo, dato = self.trabajador_captura.eventos.get_nowait()
+            except queue.Empty:
+                return
+            if tipo == "pausada":
+                self.pausar()
+            elif tipo == "limpiar_impresora":
+                self.popup_limpiar_impresora()
+            elif tipo == "frame":
+                self.logger.debug("Trabajador de captura: frame %s", dato)
 
-        try:
-            self.capture_frame(0)
-        except Exception as e:
-            self.logger.error("Error en capture_frame_wrapper: %s", e)
+    def capturar_un_frame(self):
+        '''Con la digitalización en pausa, alinea y captura un solo frame (tecla f)'''
+        if not self.template or not self.pausar_digitalizacion or self.trabajador_captura.corriendo:
+            self.logger.warning("Un frame solo se puede capturar con la digitalización en pausa")
             return
+        # El film pudo moverse a mano durante la pausa
+        self.alineador.invalidar()
+        self.trabajador_captura.enviar(TrabajadorCaptura.PASO)
 
-        elapsed = time.time() - start
-
-        intervalo_siguiente = max(elapsed + 0.01, INTERVAL)  # 0.1 s de margen
-        self.logger.info(f"Proxima captura en {intervalo_siguiente:.2f} s")
-        # Only schedule next capture if not paused or cleaning
-        if not self.pausar_digitalizacion and not self.limpiar_impresora:
-            Clock.schedule_once(self.capture_frame_wrapper, intervalo_siguiente)
+    def capturar_preview_fresca(self):
+        '''
+        Captura vistas previas hasta que una refleje el último movimiento del film.
+        Devuelve la imagen RGB como arreglo, o None si la cámara no responde.
+        '''
+        # Los avances agrupados tienen que llegar a la impresora antes de mirar el film
+        with self.lock_impresora:
+            if self.transporte.vaciar():
+                self.frescura.registrar_movimiento()
+        espera = self.frescura.espera_restante()
+        if espera > 0:
+            # Mientras el film se asienta se descarga un poco de RAW
+            espera -= self.drenaje_raw.aprovechar(espera)
+        if espera > 0:
+            time.sleep(espera)
 
-    def capture_frame(self, dt):
-        ''' Función que realiza la captura y analiza la ubicación de la perforación'''
+        while True:
+            preview_file = self.capture_preview_from_camara(self.camera)
+            if not preview_file:
+                return None
+            filedata = preview_file.get_data_and_size()
+            image_array = np.asarray(Imge.open(io.BytesIO(filedata)))
+            firma = self.analizador.perfil_franja(image_array)
+            fresca = self.frescura.es_fresca(firma, zlib.crc32(filedata))
+            self.grabador.preview(filedata, fresca)
+            if fresca:
+                return image_array
+
+    def capture_frame(self, dt, forzar=False):
+        '''
+        Función que realiza la captura y analiza la ubicación de la perforación.
+        Corre en el trabajador de captura; forzar captura un frame aunque esté en pausa.
+        '''
         self.start = time.time()
         self.logger.info(f"🎬 INICIANDO capture_frame - Frame: {self.count}")
         
         # Verificar si se debe pausar la digitalización
-        if self.pausar_digitalizacion or self.limpiar_impresora:
+        if (self.pausar_digitalizacion or self.limpiar_impresora) and not forzar:
             self.logger.info("⏸️ Captura pausada - pausar_digitalizacion o limpiar_impresora")
             return
         if self.digitalizando:
@@ -2298,7 +3578,8 @@ class CamApp(App):
             return
 
         self.digitalizando = True
-        print_size = self.printer_pattern[self.count % len(self.printer_pattern)]
+        # Disparo cuyos archivos todavía no se entregaron a la descarga de RAW
+        disparo = None
 
         try:
             if time.time() < self.next_shot:
@@ -2309,148 +3590,70 @@ class CamApp(App):
                 self.logger.error("La cámara no está inicializada.")
                 raise RuntimeError("La cámara no está inicializada.")
             
-            # folder = "/"
-            max_intentos = 100
-            intentos = 0
-            alineado = False
-            contador_perforaciones = 0 # TODO: 16mm
-
-            while intentos < max_intentos:
-                # 1. Captura la vista previa (live view) - optimizado
-                preview_file = None
-                for _ in range(5):
-                    preview_file = self.capture_preview_from_camara(self.camera)
-                    time.sleep(0.05)
-                
-                if not preview_file:
-                    self.logger.error("No se pudo capturar la vista previa.")
-                    intentos += 1
-                    continue
-
-                filedata = preview_file.get_data_and_size()
-                image = Imge.open(io.BytesIO(filedata))
-                image_array = np.asarray(image)
-
-                # 2. Analiza la alineación
-                if self.alinear_perforacion(image_array):
-                    self.logger.info("Perforación alineada correctamente.")
-                    if contador_perforaciones == self.cantidad_perforaciones or self.primer_foto:
-                        alineado = True
-                        if self.formato_digitalizar == "35mm":
-                            self.primer_foto = False
-                        
-                        # SOLUCIÓN CRÍTICA: Guardar la imagen verificada para usar en UI
-                        # Convertir a formato OpenCV para update_image_texture
-                        # La imagen está en RGB, hay que rotar y convertir a BGR
-                        rotated_image = np.rot90(np.swapaxes(image_array, 0, 1), k=1)
-                        image_bgr = cv2.cvtColor(rotated_image, cv2.COLOR_RGB2BGR)
-                        self._imagen_actual_verificada = image_bgr
-                        self.logger.debug("Imagen verificada guardada en memoria para UI")
-                        
-                        break
-                    else:
-                        contador_perforaciones += 1
-                        self.logger.error(f"Perforación {contador_perforaciones}/{self.cantidad_perforaciones} alineada, avanzando film...")
-                        self.mover_x_px(print_size)
-    
-                # Solo log cada 10 intentos para no saturar
-                if intentos % 10 == 0:
-                    self.logger.debug("Perforación no alineada, moviendo film...")
-                intentos += 1
-
+            # 1 y 2. Vistas previas posteriores a cada movimiento hasta alinear la perforación
+            alineado, intentos = self.alineador.alinear_cuadro(self.capturar_preview_fresca)
             if not alineado:
-                self.logger.warning("No se logró alinear la perforación.")
+                self.programador_limpieza.registrar_cuadro(
+                    intentos, self.alineador.puntos_correccion, alineado=False
+                )
+                self.programar_limpieza()
                 return 0
+            self.programador_limpieza.registrar_cuadro(intentos, self.alineador.puntos_correccion)
 
-            # 3. Si está alineado, dispara la cámara y guarda la foto
-            self.empty_event_queue(self.camera)
+            # 3. Si está alineado, dispara la cámara
+            disparo = self.bomba_eventos.nuevo_disparo()
             
-            # Pre-calcular path para evitar cálculos repetidos
+            # Capturar la ruta y el número antes de incrementar el contador
             jpg_path = self.template % self.count
+            current_frame_number = self.count
             
-            # IMPORTANTE: Capturar la ruta INMEDIATAMENTE después de definirla para evitar problemas de timing
-            captured_jpg_path = jpg_path  # Preservar la ruta correcta del archivo antes de cualquier incremento
-            
-            # Disparar cámara con gestión optimizada de eventos
-            self.camera.capture(gp.GP_CAPTURE_IMAGE)
+            with self.lock_impresora:
+                self.transporte.vaciar()
+            ruta = self.camera.capture(gp.GP_CAPTURE_IMAGE)
+            instante_disparo = time.monotonic()
+            self.bomba_eventos.confirmar_captura(disparo, ruta.folder, ruta.name)
+            self.next_shot += INTERVAL
+            self.grabador.captura(current_frame_number)
+
+            # 4. Con la exposición terminada el film avanza mientras el JPG sale de la cámara
+            self.mover_x_px(self.alineador.avance_siguiente(fin_de_cuadro=True))
+            # Sin esperar la ventana de agrupado: el avance se solapa con la transferencia
+            with self.lock_impresora:
+                self.transporte.vaciar()
+            avance = time.monotonic() - instante_disparo + self.frescura.asentamiento_minimo
+            self.count += 1
 
-            # Espera optimizada usando eventos de gphoto2
-            start_wait = time.time()
-            folder, last_jpg = None, None
-            
-            # Búsqueda optimizada con polling más inteligente
-            poll_interval = 0.05  # Empezar con polling rápido
-            max_poll_interval = 0.2  # Máximo intervalo de polling
-            
-            while True:
-                # Verificar eventos primero (más eficiente que buscar archivos)
-                try:
-                    event_type, event_data = self.camera.wait_for_event(50)  # 50ms timeout
-                    if event_type == gp.GP_EVENT_FILE_ADDED:
-                        # Nuevo archivo detectado por evento
-                        folder = event_data.folder
-                        last_jpg = event_data.name
-                        if last_jpg.lower().endswith('.jpg'):
-                            break
-                except:
-                    pass  # Timeout o error, continuar con búsqueda manual
-                
-                # Fallback: búsqueda manual si eventos no funcionan
-                time.sleep(poll_interval)
-                folder, last_jpg = self.buscar_imagen_en_camara(self.camera)
-                if last_jpg:
-                    break
-                    
-                # Incrementar intervalo de polling gradualmente para reducir CPU
-                poll_interval = min(poll_interval * 1.2, max_poll_interval)
-                
-                if time.time() - start_wait > 8:  # Reducido aún más el timeout
-                    self.logger.error("Timeout esperando nueva imagen JPG...")
-                    return 0
+            # 5. Transferencia: el JPG llega con GP_EVENT_FILE_ADDED
+            inicio_transferencia = time.monotonic()
+            archivo_jpg = self.bomba_eventos.esperar(disparo.jpg, TIEMPO_MAXIMO_DISPARO)
+            if archivo_jpg is None:
+                # Último recurso si la cámara no avisó: recorrer las carpetas
+                archivo_jpg = self.buscar_imagen_en_camara(self.camera, refrescar=True)
+                if archivo_jpg[1] and disparo.tallo is None:
+                    # El CR3 de este disparo tiene el mismo nombre que el JPG encontrado
+                    self.bomba_eventos.confirmar_captura(disparo, *archivo_jpg)
+            folder, last_jpg = archivo_jpg
+            if not last_jpg:
+                # El film ya avanzó: la foto queda en la tarjeta de la cámara
+                self.logger.error("Timeout esperando el JPG del frame %s; queda en la cámara", current_frame_number)
+                return 0
 
-            # Procesar archivo de manera ultra-optimizada
             jpg_file = gp.CameraFile()
             self.camera.file_get(folder, last_jpg, gp.GP_FILE_TYPE_NORMAL, jpg_file)
-            
-            # Guardar JPG tal como viene de la cámara (SIN modificaciones)
-            jpg_file.save(jpg_path)
-            
-            # CRÍTICO: Preparar imagen para mostrar en UI (CON transformaciones)
-            # Obtener los datos de la imagen JPG real para procesar solo para visualización
-            filedata = jpg_file.get_data_and_size()
-            image_real = Imge.open(io.BytesIO(filedata))
-            image_real_array = np.asarray(image_real)
-            
-            # Aplicar transformaciones SOLO para la visualización en UI
-            # Convertir a formato OpenCV para update_image_texture
-            rotated_real_image = np.rot90(np.swapaxes(image_real_array, 0, 1), k=1)
-            
-            # NUEVO: Rotar 180 grados para que coincida con el live preview (SOLO PARA UI)
-            rotated_real_image_180 = np.rot90(rotated_real_image, k=2)
-            
-            # NUEVO: Invertir horizontalmente después de la rotación 180° (SOLO PARA UI)
-            flipped_real_image = np.fliplr(rotated_real_image_180)
-            
-            real_image_bgr = cv2.cvtColor(flipped_real_image, cv2.COLOR_RGB2BGR)
-            self._imagen_actual_verificada = real_image_bgr
-            self.logger.debug("JPG guardado sin modificaciones. Imagen para UI procesada (rotada 180° y flippeada horizontalmente)")
-            
-            # Actualización crítica del contador - HACER ANTES DE MOSTRAR IMAGEN
-            current_frame_number = self.count  # Capturar el número antes de incrementar
-            
-            # 🎯 MOSTRAR IMAGEN INMEDIATAMENTE - Llamada directa con @mainthread
-            self.logger.info(f"🖼️ PROGRAMANDO mostrar imagen capturada - Frame: {current_frame_number}")
+            datos_jpg = bytes(jpg_file.get_data_and_size())
             try:
-                # Validación antes de llamar al método
-                if real_image_bgr is not None:
-                    self.logger.debug(f"✅ real_image_bgr válida, shape: {real_image_bgr.shape}")
-                    # Llamada directa al método decorado con @mainthread
-                    self._mostrar_imagen_capturada_seguro(real_image_bgr, current_frame_number)
-                    self.logger.debug("✅ Programación de imagen exitosa")
-                else:
-                    self.logger.error(f"❌ real_image_bgr es None en capture_frame - Frame: {current_frame_number}")
-            except Exception as e:
-                self.logger.error(f"❌ Error programando mostrar imagen: {e}")
+                self.camera.file_delete(folder, last_jpg)
+                self.indice_camara.quitar(folder, last_jpg)
+            except:
+                pass  # No fallar si no se puede eliminar
+            finally:
+                del jpg_file  # Forzar liberación de memoria
+            transferencia = time.monotonic() - inicio_transferencia
+
+            # 6. Guardar y mostrar en otro hilo; la captura sigue con el próximo cuadro
+            self.logger.info(f"🖼️ PROGRAMANDO mostrar imagen capturada - Frame: {current_frame_number}")
+            self.canalizacion.encolar(current_frame_number, jpg_path, datos_jpg)
+            self.canalizacion.registrar_cuadro(instante_disparo, avance, transferencia)
             
             # Preparar datos RAW inmediatamente (sin operaciones de string costosas)
             if last_jpg.upper().endswith('.JPG'):
@@ -2458,98 +3661,19 @@ class CamApp(App):
             else:
                 raw_name = last_jpg.rsplit('.', 1)[0] + '.CR3'
             
-            self.descargar_raw.append([raw_name, jpg_path])
-            
-            # Limpiar archivo de cámara y liberar memoria inmediatamente
-            try:
-                self.camera.file_delete(folder, last_jpg)
-            except:
-                pass  # No fallar si no se puede eliminar
-            finally:
-                del jpg_file  # Forzar liberación de memoria
+            self.descargar_raw.append([raw_name, jpg_path, disparo.raw])
+            disparo = None # el CR3 queda a cargo de la descarga
+            self.diario_raw.registrar(raw_name, jpg_path, DiarioRaw.PENDIENTE)
             
             # Actualizar UI de manera completamente asíncrona
             Clock.schedule_once(lambda dt: self.actualizar_color_boton_descargar_raw(), 0)
-            
-            # Continuar con operaciones críticas en hilo principal
-            self.next_shot += INTERVAL
-
-            # Imprimir y avanzar film - operación crítica que debe ser síncrona
-            self.mover_x_px(print_size)
-            
-            # Incrementar contador después de mostrar imagen
-            self.count += 1
-            
-            # Hacer una copia de la imagen verificada para el hilo asíncrono
-            imagen_verificada_copia = self._imagen_actual_verificada.copy() if self._imagen_actual_verificada is not None else None
-            
-            # Preparar y ejecutar todas las operaciones post-captura de manera asíncrona
-            def operaciones_post_captura_async():
-                try:
-                    # 🎯 PRIORIDAD: Mostrar imagen capturada inmediatamente
-                    if imagen_verificada_copia is not None:
-                        self.logger.info(f"🖼️ Usando imagen desde memoria - Frame: {current_frame_number}")
-                        self.logger.debug(f"✅ imagen_verificada_copia válida, shape: {imagen_verificada_copia.shape}")
-                        # Usar método decorado con @mainthread directamente
-                        self._mostrar_imagen_capturada_seguro(imagen_verificada_copia, current_frame_number)
-                    else:
-                        self.logger.warning(f"❌ imagen_verificada_copia es None en hilo asíncrono - Frame: {current_frame_number}")
-                        # FALLBACK: Cargar desde disco
-                        self.logger.info(f"🖼️ Cargando imagen desde disco - Frame: {current_frame_number}")
-                        time.sleep(0.1)  # Pequeña espera
-                        
-                        captured_jpg_path = self.template % current_frame_number
-                        image = cv2.imread(captured_jpg_path)
-                        if image is not None:
-                            # Aplicar transformaciones SOLO para visualización en UI
-                            # El JPG en disco se mantiene sin modificaciones
-                            
-                            # NUEVO: Rotar 180 grados para que coincida con el live preview (SOLO PARA UI)
-                            image_rotated_180 = cv2.rotate(image, cv2.ROTATE_180)
-                            
-                            # NUEVO: Invertir horizontalmente después de la rotación 180° (SOLO PARA UI)
-                            image_flipped = cv2.flip(image_rotated_180, 1)  # 1 = flip horizontal
-                            
-                            # Usar método decorado con @mainthread directamente
-                            self._mostrar_imagen_capturada_seguro(image_flipped, current_frame_number)
-                            self.logger.debug(f"JPG sin modificaciones en disco. Imagen para UI procesada (rotada 180° y flippeada): {captured_jpg_path}")
-                        else:
-                            self.logger.warning(f"❌ No se pudo cargar imagen desde: {captured_jpg_path}")
-                        
-                    # Actualizar contador en UI thread usando @mainthread
-                    self._actualizar_contador_post_captura()
-                        
-                except Exception as e:
-                    self.logger.error(f"❌ Error en operaciones post-captura: {e}")
-                    import traceback
-                    self.logger.error(f"Traceback: {traceback.format_exc()}")
-            
-            # Ejecutar operaciones pesadas en hilo separado
-            threading.Thread(target=operaciones_post_captura_async, daemon=True).start()
 
             # Solo verificar archivos residuales cada 25 capturas (menos frecuente)
             if self.count % 25 == 0:
-                def verificar_residuos_async():
-                    try:
-                        camera_list = self.camera.folder_list_files("/")
-                        residuos = [
-                            camera_list.get_name(i)
-                            for i in range(camera_list.count())
-                            if camera_list.get_name(i).lower().endswith((".jpg"))
-                        ]
-                        if residuos:
-                            self.logger.warning("Archivos residuales en cámara: %s", residuos)
-                    except Exception as e:
-                        self.logger.debug("Error verificando residuos: %s", e)  # Debug level
-                
-                threading.Thread(target=verificar_residuos_async, daemon=True).start()
+                self.canalizacion.enviar("residuos")
 
-            # Verificación de limpieza cada 500 capturas
-            if self.count % 500 == 0 and self.count > 0:
-                self.logger.warning("Se ha alcanzado el límite de 500 capturas, programando limpieza de impresora.")
-                Clock.unschedule(self.capture_frame_wrapper)
-                self.limpiar_impresora = True
-                self.popup_limpiar_impresora()
+            # Limpieza de la impresora si la alineación se viene deteriorando
+            self.programar_limpieza()
 
             # Log menos frecuente para no saturar
             if self.count % 5 == 0:  # Solo cada 5 capturas
@@ -2564,6 +3688,8 @@ class CamApp(App):
                 self.camera.exit()
                 time.sleep(0.2)
                 self.camera.init()
+                # Los eventos de archivo de este disparo pudieron perderse
+                self.indice_camara.invalidar()
                 self.logger.info("Cámara reinicializada.")
                 return 0
             except Exception as e:            
@@ -2576,129 +3702,70 @@ class CamApp(App):
             if hasattr(self, '_imagen_actual_verificada'):
                 self._imagen_actual_verificada = None
         finally:
+            if disparo is not None:
+                # Disparo fallido: sus archivos no pueden quedar esperando a los siguientes
+                self.bomba_eventos.cancelar(disparo)
             self.digitalizando = False
 
         return 0
 
-    def buscar_imagen_en_camara(self, camera, nombre=None, raw=False, folder="/"):
-        # Optimización: buscar primero en la última carpeta encontrada, luego en raíz
+    def buscar_imagen_en_camara(self, camera, nombre=None, raw=False, folder="/", refrescar=False, recorrer=True):
+        '''
+        Ubica una foto en la cámara por nombre, o la más reciente de su tipo, en el índice
+        de archivos (la tarjeta se recorre una sola vez). refrescar: volver a recorrerla
+        antes, por ejemplo si la cámara no avisó un archivo nuevo.
+        Si el nombre no está en el índice se recorre la tarjeta una vez más antes de darlo
+        por perdido (un evento perdido con la bomba detenida); recorrer=False no lo hace.
+        '''
         extension = ".jpg"
         if raw:
             extension = ".cr3"
-            
-        def buscar_en_carpeta(carpeta_path):
-            try:
-                camera_list = camera.folder_list_files(carpeta_path)
-                files_names = [camera_list.get_name(j) for j in range(camera_list.count())]
-                image_files = [f for f in files_names if f.lower().endswith(extension)]
-                
-                if nombre:
-                    for f in image_files:
-                        if f.lower() == nombre.lower():
-                            self.last_found_folder = carpeta_path  # Actualizar caché
-                            return carpeta_path, f
-                elif image_files:
-                    self.last_found_folder = carpeta_path  # Actualizar caché
-                    return carpeta_path, sorted(image_files)[-1]  # El más reciente
-            except Exception:
-                pass  # Ignorar errores en carpetas inaccesibles
-            return None, None
-        
-        # 1. Buscar primero en la última carpeta donde se encontró algo
-        if hasattr(self, 'last_found_folder') and self.last_found_folder != folder:
-            result = buscar_en_carpeta(self.last_found_folder)
-            if result[1]:
-                return result
-        
-        # 2. Buscar en la carpeta raíz
-        result = buscar_en_carpeta(folder)
-        if result[1]:
-            return result
-            
-        # 3. Si no se encuentra, buscar en subcarpetas
-        try:
-            folders = camera.folder_list_folders(folder)
-            for i in range(folders.count()):
-                subfolder = folders.get_name(i)
-                full_subfolder = os.path.join(folder, subfolder)
-                result = buscar_en_carpeta(full_subfolder)
-                if result[1]:
-                    return result
-                    
-                # Búsqueda recursiva solo si es necesario
-                result = self.buscar_imagen_en_camara(camera, nombre, raw, full_subfolder)
-                if result[1]:
-                    return result
-        except Exception:
-            pass  # Ignorar errores de acceso a carpetas
-            
-        return None, None
-
-    def alinear_perforacion(self, image_rgb):
-        '''
-        Detecta si la perforación está alineada.
-        Si no lo está, llama a mover_x_px() hasta que la imagen lo esté.
-        '''
-        
-        # Convertir a escala de grises y recortar zona
-        gray = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2GRAY)
-
-        zona_1 = gray[self.zona_yi:self.zona_yf, self.zona_xi:self.zona_xf]        
-
-        _, thresh = cv2.threshold(zona_1, self.umbral_grey, 255, cv2.THRESH_BINARY) # 252, 255
-        cantidad_blanco = cv2.countNonZero(thresh)
 
-        self.logger.info("Píxeles blancos detectados en zona: %s", cantidad_blanco)
-        mover_mas = False
+        recorrida = False
+        if refrescar or not self.indice_camara.construido:
+            with self.lock_camara:
+                self.indice_camara.construir(camera, folder)
+            recorrida = True
+        if not nombre:
+            return self.indice_camara.ultimo(extension)
+        carpeta, encontrado = self.indice_camara.ubicar(nombre)
+        if encontrado or recorrida or not recorrer:
+            return carpeta, encontrado
+        self.logger.info("%s no está en el índice de la cámara, se vuelve a recorrer la tarjeta", nombre)
+        with self.lock_camara:
+            self.indice_camara.construir(camera, folder)
+        return self.indice_camara.ubicar(nombre)
+
+    def decision_alineacion(self, image_rgb, cantidad_blanco, perforaciones, alineada, puntos):
+        '''Depuración y grabación de cada decisión del alineador'''
         if self.mostrar_debug:
-            debug_img = image_rgb.copy()
-            debug_img_bgr = cv2.cvtColor(debug_img, cv2.COLOR_RGB2BGR)
-
-            if debug_img_bgr is not None and debug_img_bgr.size > 0:
-                cv2.rectangle(debug_img_bgr, (self.zona_xi, self.zona_yi), (self.zona_xf, self.zona_yf), (255, 0, 0), 2) # azul
-                cv2.putText(
-                    debug_img_bgr,
-                    f'px blancos z1: {cantidad_blanco}',
-                    (30, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    1,
-                    (0, 255, 0),
-                    2
-                )
-                cv2.imshow("debug_img_bgr", debug_img_bgr)
-            else:
-                self.logger.error("debug_img_bgr está vacío, no se puede mostrar.")
-
-            if thresh is not None and thresh.size > 0:
-                cv2.imshow("debug_zona_thresh.jpg", thresh)
-            else:
-                self.logger.error("thresh está vacío, no se puede mostrar.")
-
-            key = 0
-            while True:
-                key = cv2.waitKey(0) & 0xFF
-                if key == ord('e'):
-                    # cv2.destroyAllWindows()
-                    break
-                elif key == ord('q'):
-                    cv2.destroyAllWindows()
-                    self.pausa()
-                    break
-                elif key == ord('r'):
-                    self.mostrar_debug = False
-                    cv2.destroyAllWindows()
-                    break
-
-        if cantidad_blanco > self.umbral_px_blancos:
-            self.logger.info("Perforación alineada.")
-            return True
-        else:
-            if mover_mas:
-                self.mover_x_px(self.printer_pattern[self.count % len(self.printer_pattern)])
-            else:
-                self.mover_x_px()
+            # Se escribe a disco desde otro hilo, la captura no se detiene
+            self.depuracion.enviar(
+                image_rgb, self.analizador.binaria, (self.zona_xi, self.zona_xf, self.zona_yi, self.zona_yf),
+                cantidad_blanco, perforaciones, alineada, puntos
+            )
+        self.grabador.alineacion(alineada, cantidad_blanco, puntos)
+
+    def guardar_patron_impresora(self):
+        '''Guarda el patrón aprendido para que el próximo rollo empiece ajustado'''
+        if self.alineador.controlador is self.alineador.controlador_cuadro:
+            return # el avance del cuadro completo se mide en la imagen al empezar
+        patron = list(self.alineador.controlador.patron)
+        self.printer_pattern = patron
+        if self.formato_digitalizar == "16mm":
+            self.printer_pattern_16mm = patron
+        elif self.formato_digitalizar == "35mm":
+            self.printer_pattern_35mm = patron
+        self.canalizacion.enviar("configuracion", f"PATRON_IMPRESORA_{self.formato_digitalizar}", patron)
 
-        return False
+    def programar_limpieza(self):
+        '''Pausa para limpiar la impresora si la deriva de la alineación lo pide'''
+        motivo = self.programador_limpieza.necesita_limpieza()
+        if motivo is None:
+            return
+        self.logger.warning("Programando limpieza de impresora: %s", motivo)
+        self.limpiar_impresora = True
+        self.trabajador_captura.emitir("limpiar_impresora")
 
     def popup_limpiar_impresora(self):
         '''Popup para pedir el número de contador'''
@@ -2752,6 +3819,10 @@ class CamApp(App):
         
         Window.bind(on_key_down=self.key_action)
         self.limpiar_impresora = False
+        for programador in self.programadores_limpieza.values():
+            programador.limpiada()
+        self.alineador.controlador.invalidar()
+        self.canalizacion.reiniciar_medicion()
         
         # Cerrar popup de manera segura
         try:
@@ -2763,16 +3834,11 @@ class CamApp(App):
             self.logger.error(f"Error cerrando popup de limpieza: {e}")
         
         # Pausar live view para reanudar digitalización
+        self.productor_preview.pausar()
         if hasattr(self, 'timer') and self.timer:
             Clock.unschedule(self.update)
             self.timer = None
         
-        # Limpiar cualquier scheduling pendiente
-        try:
-            Clock.unschedule(self.capture_frame_wrapper)
-        except:
-            pass
-        
         # Ensure digitalizando flag is reset
         self.digitalizando = False
         self.pausar_digitalizacion = False
@@ -2784,7 +3850,7 @@ class CamApp(App):
                 return
             
             self.logger.info("Iniciando reanudación de digitalización...")
-            Clock.schedule_once(self.capture_frame_wrapper, 0.1)
+            self.trabajador_captura.enviar(TrabajadorCaptura.REANUDAR)
         
         Clock.schedule_once(iniciar_reanudacion, 0.5)
     
@@ -2795,61 +3861,45 @@ class CamApp(App):
 
     def mover_x_px(self, x=1):
         ''' Función para ajustar la posición del film'''
-        img = Imge.new("1",(35, x), 1)
-        self.p.image(img)
+        with self.lock_impresora:
+            self.transporte.avanzar(x)
         self.logger.info(f"Ajuste impresora: {x}")
-        self.p._raw(b'\n')
+        self.alineador.predictor.registrar_movimiento(x)
+        self.frescura.registrar_movimiento()
+        self.grabador.movimiento(x)
 
     def retroceder_1_px(self):
         '''Función para retroceder la posición del film'''
-        self.p._raw(b'\x1B\x4A\xFF')
+        with self.lock_impresora:
+            self.transporte.retroceder()
         self.logger.info(f"Ajuste impresora: -1")
-        self.p._raw(b'\n')
-
-    def aplicar_cuadricula(self, image_array, color=(255, 0, 0), thickness=1):
-        '''Dibuja dos líneas verticales: una a 400px desde la izquierda y otra desde la derecha'''
-        result = image_array.copy()
-        h, w, _ = result.shape
-
-        # Línea a 150 px desde la izquierda
-        cv2.line(
-            result,
-            (self.cuadricula_linea_x1, 0),
-            (self.cuadricula_linea_x1, h),
-            color,
-            thickness
-        )  # pylint: disable=E1101
-        # Línea a 290 px desde la izquierda
-        cv2.line(
-            result,
-            (self.cuadricula_linea_x2, 0),
-            (self.cuadricula_linea_x2, h),
-            color,
-            thickness
-        )  # pylint: disable=E1101
-        # Línea a 810 px desde la izquierda
-        cv2.line(
-            result,
-            (self.cuadricula_linea_x3, 0),
-            (self.cuadricula_linea_x3, h),
-            color,
-            thickness
-        )  # pylint: disable=E1101
-
-        # Rectángulo de verificación de perforación
-        cv2.rectangle(
-            result,
-            (self.cuadricula_x1, self.cuadricula_y1),
-            (self.cuadricula_x2, self.cuadricula_y2),
-            (0, 0, 255),
-            2
-        )
-
-        return result
+        self.alineador.predictor.invalidar()
+        self.frescura.registrar_movimiento()
+        self.grabador.retroceso()
+
+    def toggle_grabar_sesion(self):
+        '''Empieza o termina la grabación de la sesión de alineación'''
+        if self.grabador.activo:
+            self.grabador.detener()
+            return
+        try:
+            self.grabador.iniciar(
+                formato=self.formato_digitalizar,
+                zona=[self.analizador.zona_xi, self.analizador.zona_xf,
+                      self.analizador.zona_yi, self.analizador.zona_yf],
+                umbral_grey=self.analizador.umbral_grey,
+                umbral_px_blancos=self.analizador.umbral_px_blancos,
+                cantidad_perforaciones=self.alineador.cantidad_perforaciones,
+                patron=list(self.alineador.controlador_perforacion.patron),
+                frame=self.count
+            )
+        except OSError as e:
+            self.logger.error("No se pudo iniciar la grabación de la sesión: %s", e)
 
     def toggle_cuadricula(self):
         '''Mostrar cuadricula en preview'''
         self.mostrar_cuadricula = not self.mostrar_cuadricula
+        self.cuadricula.mostrar(self.mostrar_cuadricula)
         # print(f"Cuadrícula {'activada' if self.mostrar_cuadricula else 'desactivada'}")
 
     def abrir_entangle(self, *args): # pylint: disable=W0613
@@ -2857,14 +3907,23 @@ class CamApp(App):
         # print("Abriendo Entangle...")
 
         # Detener la previsualización
+        self.productor_preview.pausar()
         if hasattr(self, 'timer') and self.timer:
             Clock.unschedule(self.update)
             self.timer = None
             # print("Previsualización detenida")
 
         if hasattr(self, 'camera') and self.camera:
+            # Entangle puede crear o borrar archivos en la tarjeta
+            self.indice_camara.invalidar()
+            # Sin cámara: libgphoto2 la reabriría en la próxima llamada del drenaje o la bomba
+            self.drenaje_raw.suspender()
+            self.bomba_eventos.suspender()
+            self._camara_cedida = True
             try:
-                self.camera.exit()
+                with self.lock_camara:
+                    self.camera = self.camara = None
+                    self.sesion_camara.liberar()
                 # print("Cámara 2 cerrada")
             except Exception as e: # pylint: disable=W0718
                 # print(f"Error al cerrar cámara 2: {e}")
@@ -2885,10 +3944,12 @@ class CamApp(App):
                 Clock.schedule_once(lambda dt: self._show_error_popup(
                     "No se encontró el programa Entangle. Asegúrese de que esté instalado."
                 ))
+                # La cámara quedó liberada: recuperarla aunque Entangle no haya abierto
+                Clock.schedule_once(lambda dt: self._reanudar_previsualizacion(), 0)
             except Exception as e: # pylint: disable=W0718
-                Clock.schedule_once(lambda dt:
-                    self._show_error_popup(f"Error al ejecutar Entangle:\n{e}")
-                )
+                mensaje = f"Error al ejecutar Entangle:\n{e}"
+                Clock.schedule_once(lambda dt: self._show_error_popup(mensaje))
+                Clock.schedule_once(lambda dt: self._reanudar_previsualizacion(), 0)
 
         # Ejecutar en un hilo para no bloquear la interfaz
         threading.Thread(target=ejecutar_entangle, daemon=True).start()
@@ -2897,12 +3958,20 @@ class CamApp(App):
         # print("Reconectando cámaras...")
         self.logger.info("Reconectando cámaras...")
 
+        if self._camara_cedida:
+            # Entangle terminó: el drenaje y la bomba esperan la cámara que se asigna ahora
+            self._camara_cedida = False
+            self.bomba_eventos.reanudar()
+            self.drenaje_raw.reanudar()
+
         try:
             self.asignar_camaras()
             # print("Cámaras asignadas correctamente")
             self.logger.info("Cámaras asignadas correctamente")
 
-            self.timer = Clock.schedule_interval(self.update, 1.0 / 24.0)
+            self.motor_preview.reiniciar_medicion()
+            self.productor_preview.reanudar()
+            self.timer = Clock.schedule_interval(self.update, INTERVALO_PREVISUALIZACION)
             # print("Previsualización reactivada")
             self.logger.info("Previsualización reactivada")
             Clock.schedule_once(self._despues_de_esperar, TIEMPO_ESPERA)
@@ -2964,7 +4033,13 @@ class CamApp(App):
             self.logger.error("Error buscando dispositivo USB por serial: %s", e)
 
     def debug_camptura(self):
+        '''Activa o desactiva las imágenes de depuración de la alineación'''
         self.mostrar_debug = False if self.mostrar_debug else True
+        if self.mostrar_debug:
+            self.depuracion.iniciar()
+        else:
+            self.logger.info("Depuración: %s imágenes escritas, %s descartadas",
+                             self.depuracion.escritos, self.depuracion.descartados)
 
     def crear_video():
         print('Crear video')
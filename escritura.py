@@ -0,0 +1,252 @@
+# Este archivo es parte de digitalizadora-films
+#
+# Este software está licenciado bajo la Licencia Pública General GNU v3.0 o superior.
+# Una copia de la licencia se incluye en el archivo `LICENSE` de este directorio.
+# También está disponible en línea en: <https://www.gnu.org/licenses/gpl-3.0.html>.
+
+'''
+Escritura durable de los frames capturados.
+
+Cada archivo se escribe con un nombre temporal y recién toma su nombre definitivo
+cuando sus datos están en disco (fsync + os.replace). Si el programa se corta, en la
+carpeta pueden quedar archivos temporales, pero nunca un JPG truncado con nombre válido.
+El fsync se hace por lotes: mientras la captura va más rápido que el disco los
+archivos se acumulan y se confirman juntos.
+
+DiarioRaw guarda en disco qué CR3 de la cámara corresponde a cada frame mientras
+está pendiente de descarga.
+'''
+
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque
+
+SUFIJO_TEMPORAL = ".parcial"
+
+
+def buscar_temporales(directorio):
+    '''Archivos temporales que quedaron de una sesión interrumpida'''
+    return sorted(glob.glob(os.path.join(directorio, "*" + SUFIJO_TEMPORAL)))
+
+
+class EscritorAtomico:
+    '''
+    Escribe archivos con nombre temporal y los renombra al definitivo en lotes.
+    escribir() deja el archivo pendiente; confirmar() hace fsync de los pendientes,
+    los renombra y sincroniza las carpetas. Con lote pendientes se confirma solo.
+    al_confirmar se llama después de cada lote (por ejemplo, el fsync del diario de RAW).
+    '''
+    def __init__(self, lote=8, logger=None, ventana=100, al_confirmar=None):
+        self.lote = lote
+        self.logger = logger
+        self.al_confirmar = al_confirmar
+        self._lock = threading.Lock()
+        # (descriptor, ruta temporal, ruta definitiva)
+        self._pendientes = []
+        self._escrituras = deque(maxlen=ventana)
+        self._confirmaciones = deque(maxlen=ventana)
+        self.archivos = 0
+        self.bytes = 0
+        self.lotes = 0
+        self.fallidos = 0
+
+    @property
+    def pendientes(self):
+        return len(self._pendientes)
+
+    def escribir(self, ruta, datos):
+        '''Escribe datos con nombre temporal; la ruta definitiva aparece al confirmar'''
+        inicio = time.monotonic()
+        temporal = ruta + SUFIJO_TEMPORAL
+        descriptor = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            vista = memoryview(datos)
+            while vista:
+                escritos = os.write(descriptor, vista)
+                vista = vista[escritos:]
+        except OSError:
+            os.close(descriptor)
+            os.unlink(temporal)
+            raise
+        with self._lock:
+            self._pendientes.append((descriptor, temporal, ruta))
+            self._escrituras.append(time.monotonic() - inicio)
+            self.archivos += 1
+            self.bytes += len(datos)
+            completo = len(self._pendientes) >= self.lote
+        if completo:
+            self.confirmar()
+
+    def confirmar(self):
+        '''fsync de los archivos pendientes y renombre atómico a su ruta definitiva'''
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, []
+        if not pendientes:
+            return
+        inicio = time.monotonic()
+        carpetas = set()
+        # Cada archivo por separado: un error no deja abiertos ni sin renombrar a los demás
+        for descriptor, temporal, ruta in pendientes:
+            try:
+                try:
+                    os.fsync(descriptor)
+                finally:
+                    os.close(descriptor)
+                os.replace(temporal, ruta)
+            except OSError as e:
+                # El temporal queda en disco y se avisa como parcial al volver a digitalizar
+                self.fallidos += 1
+                if self.logger:
+                    self.logger.error("No se pudo confirmar %s: %s", ruta, e)
+                continue
+            carpetas.add(os.path.dirname(ruta) or ".")
+        # El renombre es durable recién cuando la carpeta llega al disco
+        for carpeta in carpetas:
+            try:
+                descriptor = os.open(carpeta, os.O_RDONLY)
+                try:
+                    os.fsync(descriptor)
+                finally:
+                    os.close(descriptor)
+            except OSError as e:
+                if self.logger:
+                    self.logger.error("No se pudo sincronizar la carpeta %s: %s", carpeta, e)
+        if self.al_confirmar:
+            self.al_confirmar()
+        with self._lock:
+            self._confirmaciones.append((len(pendientes), time.monotonic() - inicio))
+            self.lotes += 1
+
+    def estadisticas(self):
+        '''Latencia media de escritura y de confirmación por lote (segundos)'''
+        with self._lock:
+            escritura = sum(self._escrituras) / len(self._escrituras) if self._escrituras else 0.0
+            if self._confirmaciones:
+                archivos = sum(n for n, _ in self._confirmaciones) / len(self._confirmaciones)
+                confirmacion = sum(t for _, t in self._confirmaciones) / len(self._confirmaciones)
+            else:
+                archivos = confirmacion = 0.0
+        return {
+            "archivos": self.archivos,
+            "megabytes": self.bytes / 1e6,
+            "lotes": self.lotes,
+            "fallidos": self.fallidos,
+            "pendientes": self.pendientes,
+            "escritura": escritura,
+            "confirmacion": confirmacion,
+            "archivos_por_lote": archivos,
+        }
+
+
+class DiarioRaw:
+    '''
+    Diario en disco de los CR3 por descargar: una línea JSON por cambio de estado con
+    el nombre en la cámara, el JPG del frame, el destino del CR3 y el estado.
+    Solo se agregan líneas; al abrirlo se compacta y quedan solo los pendientes, así
+    después de un corte la descarga sigue sin adivinar qué CR3 corresponde a qué frame.
+    Los nombres de la cámara se repiten entre tarjetas y rollos (IMG_9999 vuelve a
+    IMG_0001): cada entrada es el par (nombre en la cámara, JPG) y al abrir se descartan
+    las de JPG que ya no existen.
+    registrar() no espera al disco; sincronizar() hace el fsync, junto con la
+    confirmación de los JPG, así el diario no frena la captura.
+    '''
+    PENDIENTE = "pendiente"
+    DESCARGADO = "descargado"
+    PERDIDO = "perdido"
+    DESCARTADO = "descartado"
+
+    def __init__(self, ruta, logger=None):
+        self.ruta = ruta
+        self.logger = logger
+        self._lock = threading.Lock()
+        # (nombre en la cámara en minúsculas, jpg) -> registro, en orden de disparo
+        self._pendientes = {}
+        self._archivo = None
+        self._sin_sincronizar = False
+
+    @staticmethod
+    def _clave(raw, jpg):
+        return raw.lower(), jpg
+
+    def abrir(self):
+        '''Lee el diario, lo reescribe con los pendientes y lo deja abierto para agregar'''
+        with self._lock:
+            if self._archivo is not None:
+                return
+            pendientes = {}
+            if os.path.exists(self.ruta):
+                with open(self.ruta, encoding="utf-8") as archivo:
+                    for linea in archivo:
+                        try:
+                            registro = json.loads(linea)
+                        except ValueError:
+                            continue # última línea cortada por el corte
+                        clave = self._clave(registro["raw"], registro["jpg"])
+                        if registro["estado"] == self.PENDIENTE:
+                            pendientes[clave] = registro
+                        else:
+                            pendientes.pop(clave, None)
+            # Sin el JPG no hay frame al que pertenezca el CR3 (carpeta borrada, otro rollo)
+            huerfanos = [
+                clave for clave, registro in pendientes.items()
+                if not os.path.exists(registro["jpg"]) and not os.path.exists(registro["jpg"] + SUFIJO_TEMPORAL)
+            ]
+            for clave in huerfanos:
+                del pendientes[clave]
+            temporal = self.ruta + SUFIJO_TEMPORAL
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                for registro in pendientes.values():
+                    archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                archivo.flush()
+                os.fsync(archivo.fileno())
+            os.replace(temporal, self.ruta)
+            self._pendientes = pendientes
+            self._archivo = open(self.ruta, "a", encoding="utf-8")
+        if huerfanos and self.logger:
+            self.logger.warning("Diario de RAW: %d entradas descartadas porque su JPG ya no existe", len(huerfanos))
+        if pendientes and self.logger:
+            self.logger.warning("Diario de RAW: %d descargas pendientes de la sesión anterior", len(pendientes))
+
+    def registrar(self, raw, jpg, estado):
+        '''Agrega el cambio de estado de un CR3 (llega al disco con sincronizar)'''
+        registro = {
+            "raw": raw,
+            "jpg": jpg,
+            "destino": jpg.replace(".jpg", ".cr3"),
+            "estado": estado,
+            "instante": time.time(),
+        }
+        clave = self._clave(raw, jpg)
+        with self._lock:
+            if self._archivo is None:
+                return
+            if estado == self.PENDIENTE:
+                self._pendientes[clave] = registro
+            else:
+                self._pendientes.pop(clave, None)
+            self._archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            self._archivo.flush()
+            self._sin_sincronizar = True
+
+    def sincronizar(self):
+        '''fsync de las líneas agregadas desde la última vez'''
+        with self._lock:
+            if self._archivo is None or not self._sin_sincronizar:
+                return
+            os.fsync(self._archivo.fileno())
+            self._sin_sincronizar = False
+
+    def pendientes(self):
+        '''Registros pendientes en orden de disparo'''
+        with self._lock:
+            return list(self._pendientes.values())
+
+    def cerrar(self):
+        self.sincronizar()
+        with self._lock:
+            if self._archivo is not None:
+                self._archivo.close()
+                self._archivo = None
@@ -0,0 +1,328 @@
+# Este archivo es parte de digitalizadora-films
+#
+# Este software está licenciado bajo la Licencia Pública General GNU v3.0 o superior.
+# Una copia de la licencia se incluye en el archivo `LICENSE` de este directorio.
+# También está disponible en línea en: <https://www.gnu.org/licenses/gpl-3.0.html>.
+
+'''
+Grabación y reproducción de sesiones de alineación.
+
+Durante la digitalización se guardan las vistas previas (JPEG tal cual vienen de la
+cámara), los movimientos de la impresora y los tiempos en una carpeta de sesión:
+
+    sesion-AAAAMMDD-HHMMSS/
+        eventos.jsonl       un evento por línea
+        previews/000001.jpg
+
+La reproducción vuelve a pasar las vistas previas por la alineación en el mismo
+orden, sin cámara ni impresora, y mide el tiempo de decisión y los intentos.
+
+EscritorDepuracion guarda, desde un hilo aparte, lo que vio el detector en cada
+vista previa (zona, umbral y perforaciones) como una secuencia de imágenes rotativa.
+
+Uso:
+    python3 grabacion.py CARPETA_SESION [--sin-predictor]
+'''
+
+import argparse
+import io
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from perforacion import AlineadorPerforacion, AnalizadorPerforacion, PredictorAvance
+
+ARCHIVO_EVENTOS = "eventos.jsonl"
+CARPETA_PREVIEWS = "previews"
+
+
+class GrabadorSesion:
+    '''
+    Escribe los eventos del lazo de alineación en una carpeta de sesión.
+    La tecla g inicia y detiene la grabación desde la interfaz mientras la captura
+    escribe desde su hilo: todo pasa por un lock y un error de disco solo se registra,
+    nunca llega a la captura.
+    '''
+    def __init__(self, directorio_base, logger=None):
+        self.directorio_base = directorio_base
+        self.logger = logger
+        self.directorio = None
+        self._eventos = None
+        self._inicio = 0.0
+        self._previews = 0
+        self._lock = threading.RLock()
+
+    @property
+    def activo(self):
+        return self._eventos is not None
+
+    def iniciar(self, **metadatos):
+        '''Crea la carpeta de la sesión; metadatos: formato, zona, umbrales, etc.'''
+        with self._lock:
+            if self.activo:
+                self.detener()
+            nombre = datetime.now().strftime("sesion-%Y%m%d-%H%M%S")
+            self.directorio = os.path.join(self.directorio_base, nombre)
+            os.makedirs(os.path.join(self.directorio, CARPETA_PREVIEWS), exist_ok=True)
+            self._eventos = open(os.path.join(self.directorio, ARCHIVO_EVENTOS), "w", encoding="utf-8")
+            self._inicio = time.monotonic()
+            self._previews = 0
+            self._escribir("sesion", **metadatos)
+        if self.logger:
+            self.logger.info("Grabando sesión de alineación en %s", self.directorio)
+        return self.directorio
+
+    def detener(self):
+        with self._lock:
+            if not self.activo:
+                return
+            self._escribir("fin")
+            try:
+                self._eventos.close()
+            except OSError as e:
+                if self.logger:
+                    self.logger.error("Error al cerrar la sesión grabada: %s", e)
+            self._eventos = None
+        if self.logger:
+            self.logger.info("Sesión grabada: %s (%s vistas previas)", self.directorio, self._previews)
+
+    def preview(self, datos_jpeg, fresca=True):
+        '''Guarda la vista previa; fresca=False si se descartó por ser anterior al movimiento'''
+        with self._lock:
+            if not self.activo:
+                return
+            self._previews += 1
+            archivo = os.path.join(CARPETA_PREVIEWS, f"{self._previews:06d}.jpg")
+            try:
+                with open(os.path.join(self.directorio, archivo), "wb") as f:
+                    f.write(datos_jpeg)
+            except OSError as e:
+                if self.logger:
+                    self.logger.error("Error al grabar la vista previa: %s", e)
+                return
+            self._escribir("preview", archivo=archivo, fresca=fresca)
+
+    def movimiento(self, puntos):
+        self._escribir("mover", puntos=puntos)
+
+    def retroceso(self):
+        self._escribir("retroceder")
+
+    def alineacion(self, alineada, cantidad_blanco, puntos=0):
+        '''Resultado de AlineadorPerforacion.alinear para la última vista previa fresca'''
+        self._escribir("alineacion", alineada=bool(alineada), blancos=int(cantidad_blanco), puntos=int(puntos))
+
+    def captura(self, frame):
+        self._escribir("captura", frame=frame)
+
+    def _escribir(self, tipo, **datos):
+        with self._lock:
+            if not self.activo:
+                return
+            evento = {"t": round(time.monotonic() - self._inicio, 4), "tipo": tipo}
+            evento.update(datos)
+            try:
+                self._eventos.write(json.dumps(evento) + "\n")
+                self._eventos.flush()
+            except (OSError, ValueError, TypeError) as e:
+                if self.logger:
+                    self.logger.error("Error al grabar el evento %s de la sesión: %s", tipo, e)
+
+
+class EscritorDepuracion(threading.Thread):
+    '''
+    Escribe las vistas previas anotadas en disco sin frenar la captura.
+    La cola es corta: si el disco no da abasto se descartan cuadros. Los archivos
+    rotan sobre maximo_archivos nombres, así la carpeta no crece sin límite.
+    '''
+    def __init__(self, directorio, maximo_archivos=500, capacidad_cola=8, calidad=85, logger=None):
+        super().__init__(name="EscritorDepuracion", daemon=True)
+        self.directorio = directorio
+        self.maximo_archivos = maximo_archivos
+        self.calidad = calidad
+        self.logger = logger
+        self._cola = queue.Queue(maxsize=capacidad_cola)
+        self._secuencia = 0
+        self.descartados = 0
+        self.escritos = 0
+
+    def iniciar(self):
+        if not self.is_alive():
+            os.makedirs(self.directorio, exist_ok=True)
+            self.start()
+            if self.logger:
+                self.logger.info("Depuración de alineación en %s", self.directorio)
+
+    def enviar(self, image_rgb, binaria, zona, cantidad_blanco, perforaciones, alineada, puntos):
+        '''
+        Encola una vista previa para anotar. image_rgb no se copia (no se reutiliza);
+        binaria sí, porque el analizador la sobrescribe en la próxima vista previa.
+        '''
+        self._secuencia += 1
+        try:
+            self._cola.put_nowait((
+                self._secuencia, time.time(), image_rgb, binaria.copy(), zona,
+                cantidad_blanco, list(perforaciones), alineada, puntos
+            ))
+        except queue.Full:
+            self.descartados += 1
+
+    def detener(self):
+        if self.is_alive():
+            self._cola.put(None)
+            self.join(timeout=2.0)
+
+    def run(self):
+        while True:
+            elemento = self._cola.get()
+            if elemento is None:
+                break
+            try:
+                self._escribir(*elemento)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error("Error escribiendo imagen de depuración: %s", e)
+
+    def _escribir(self, secuencia, instante, image_rgb, binaria, zona, cantidad_blanco,
+                  perforaciones, alineada, puntos):
+        xi, xf, yi, yf = zona
+        imagen = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR)
+
+        # Perforaciones detectadas en la franja (amarillo) y zona de análisis
+        for perforacion in perforaciones:
+            cv2.rectangle(imagen, (xi, perforacion.inicio), (xf, perforacion.fin - 1), (0, 255, 255), 1)
+        color_zona = (0, 255, 0) if alineada else (255, 0, 0)
+        cv2.rectangle(imagen, (xi, yi), (xf, yf), color_zona, 2)
+
+        # El umbral de la zona, ampliado, en la esquina superior derecha
+        if binaria.size:
+            umbral = cv2.cvtColor(cv2.resize(binaria, None, fx=2, fy=2, interpolation=cv2.INTER_NEAREST),
+                                  cv2.COLOR_GRAY2BGR)
+            alto = min(umbral.shape[0], imagen.shape[0])
+            ancho = min(umbral.shape[1], imagen.shape[1])
+            imagen[:alto, imagen.shape[1] - ancho:] = umbral[:alto, :ancho]
+
+        estado = "alineada" if alineada else f"avanzar {puntos}"
+        hora = datetime.fromtimestamp(instante).strftime("%H:%M:%S.%f")[:-3]
+        cv2.putText(imagen, f"#{secuencia} {hora}", (30, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        cv2.putText(imagen, f"px blancos z1: {cantidad_blanco} - {estado}", (30, 60),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, color_zona, 2)
+
+        archivo = os.path.join(self.directorio, f"depuracion-{secuencia % self.maximo_archivos:05d}.jpg")
+        cv2.imwrite(archivo, imagen, [cv2.IMWRITE_JPEG_QUALITY, self.calidad])
+        self.escritos += 1
+
+
+def cargar_sesion(directorio):
+    '''Devuelve (metadatos, eventos) de una sesión grabada'''
+    metadatos = {}
+    eventos = []
+    with open(os.path.join(directorio, ARCHIVO_EVENTOS), encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            evento = json.loads(linea)
+            if evento["tipo"] == "sesion":
+                metadatos = evento
+            else:
+                eventos.append(evento)
+    return metadatos, eventos
+
+
+class ReproductorSesion:
+    '''
+    Pasa las vistas previas frescas de una sesión por la alineación, en orden.
+    Los movimientos que se aplican son los grabados, así la reproducción es
+    determinista aunque la decisión nueva sea distinta a la grabada.
+    '''
+    def __init__(self, directorio, predictivo=True):
+        self.directorio = directorio
+        self.metadatos, self.eventos = cargar_sesion(directorio)
+        self.analizador = AnalizadorPerforacion(
+            self.metadatos["zona"], self.metadatos["umbral_grey"], self.metadatos["umbral_px_blancos"]
+        )
+        self.predictor = PredictorAvance() if predictivo else None
+        # Los movimientos los aplica la sesión grabada, el alineador no mueve nada
+        self.alineador = AlineadorPerforacion(self.analizador, lambda puntos: None, self.predictor)
+        self.alineador.configurar(self.metadatos.get("cantidad_perforaciones", 1))
+        self.alineador.tiempos_decision = []
+
+    def imagen(self, archivo):
+        with open(os.path.join(self.directorio, archivo), "rb") as f:
+            return np.asarray(Image.open(io.BytesIO(f.read())))
+
+    def decidir(self, imagen):
+        '''Decisión del alineador de la aplicación: (alineada, puntos, cantidad_blanco)'''
+        self.alineador.alinear(imagen)
+        return self.alineador.ultima_decision
+
+    def reproducir(self):
+        '''Recorre la sesión y devuelve las métricas de la reproducción'''
+        tiempos_decision = self.alineador.tiempos_decision
+        coincidencias = 0
+        comparadas = 0
+        intentos_por_frame = []
+        segundos_por_frame = []
+        intentos = 0
+        inicio_frame = 0.0
+        decision = None
+
+        for evento in self.eventos:
+            tipo = evento["tipo"]
+            if tipo == "mover" and self.predictor:
+                self.predictor.registrar_movimiento(evento["puntos"])
+            elif tipo == "retroceder" and self.predictor:
+                self.predictor.invalidar()
+            elif tipo == "preview" and evento.get("fresca", True):
+                decision = self.decidir(self.imagen(evento["archivo"]))
+                intentos += 1
+            elif tipo == "alineacion" and decision is not None:
+                comparadas += 1
+                coincidencias += decision[0] == evento["alineada"]
+                decision = None
+            elif tipo == "captura":
+                intentos_por_frame.append(intentos)
+                segundos_por_frame.append(evento["t"] - inicio_frame)
+                inicio_frame = evento["t"]
+                intentos = 0
+
+        return {
+            "previews": len(tiempos_decision),
+            "frames": len(intentos_por_frame),
+            "intentos_por_frame": float(np.mean(intentos_por_frame)) if intentos_por_frame else 0.0,
+            "intentos_max": max(intentos_por_frame, default=0),
+            "segundos_por_frame": float(np.mean(segundos_por_frame)) if segundos_por_frame else 0.0,
+            "decision_ms": float(np.mean(tiempos_decision)) * 1000 if tiempos_decision else 0.0,
+            "decision_p99_ms": float(np.percentile(tiempos_decision, 99)) * 1000 if tiempos_decision else 0.0,
+            "coincidencias": coincidencias,
+            "comparadas": comparadas,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce una sesión de alineación grabada")
+    parser.add_argument("sesion", help="carpeta de la sesión (contiene eventos.jsonl)")
+    parser.add_argument("--sin-predictor", action="store_true", help="decidir de a un punto, como antes")
+    args = parser.parse_args()
+
+    reproductor = ReproductorSesion(args.sesion, predictivo=not args.sin_predictor)
+    resultado = reproductor.reproducir()
+    print(f"Sesión {args.sesion} ({reproductor.metadatos.get('formato', '?')})")
+    print(f"  vistas previas: {resultado['previews']}, frames: {resultado['frames']}")
+    print(f"  intentos por frame (grabados): {resultado['intentos_por_frame']:.1f} promedio, "
+          f"{resultado['intentos_max']} máximo")
+    print(f"  segundos por frame (grabados): {resultado['segundos_por_frame']:.2f}")
+    print(f"  decisión: {resultado['decision_ms']:.2f} ms promedio, {resultado['decision_p99_ms']:.2f} ms p99")
+    print(f"  alineación igual a la grabada: {resultado['coincidencias']}/{resultado['comparadas']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# Este archivo es parte de digitalizadora-films
+#
+# Este software está licenciado bajo la Licencia Pública General GNU v3.0 o superior.
+# Una copia de la licencia se incluye en el archivo `LICENSE` de este directorio.
+# También está disponible en línea en: <https://www.gnu.org/licenses/gpl-3.0.html>.
+
+'''
+Transporte del film con la impresora térmica.
+
+Un transporte mueve el film de a puntos de impresora: avanzar(puntos), retroceder()
+y reiniciar(). Hay dos formas de hacerlo con la impresora:
+
+    raster        "imprime" una imagen en blanco de 35 píxeles de ancho y tantas filas
+                  como puntos (GS v 0, los mismos bytes que arma python-escpos con
+                  p.image); es el método con el que están calibrados los patrones.
+    avance_papel  avanza el papel con ESC J n, sin imagen. n está en unidades de
+                  movimiento de la impresora: unidades_por_punto las convierte.
+
+Los comandos dependen solo de la cantidad de puntos, así que se arman una vez por
+tamaño y se escriben directo en el dispositivo (/dev/usb/lp*).
+TransporteAgrupado junta los avances seguidos en un solo comando.
+simulacion.TransporteSimulado cumple la misma interfaz sin impresora.
+'''
+
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+GS = b'\x1d'
+ESC = b'\x1b'
+ANCHO_PX = 35 # ancho de la imagen en blanco (profile.media.width.pixels)
+ALTO_FRAGMENTO = 960 # python-escpos parte las imágenes más altas en fragmentos
+REINICIO = ESC + b'@'
+RETROCESO = ESC + b'J\xff\n'
+
+
+def comando_avance(puntos, ancho_px=ANCHO_PX, alto_fragmento=ALTO_FRAGMENTO):
+    '''
+    Bytes de p.image(Image.new("1", (ancho_px, puntos), 1)) seguido de p._raw(b'\\n'):
+    una imagen de raster en blanco (GS v 0, densidad alta) por fragmento y un salto de línea.
+    '''
+    ancho_bytes = (ancho_px + 7) // 8
+    partes = []
+    restantes = puntos
+    while restantes > 0:
+        alto = min(restantes, alto_fragmento)
+        partes.append(GS + b'v0\x00' + struct.pack('<HH', ancho_bytes, alto) + bytes(ancho_bytes * alto))
+        restantes -= alto
+    partes.append(b'\n')
+    return b''.join(partes)
+
+
+def comando_avance_papel(unidades):
+    '''ESC J n por cada tramo de hasta 255 unidades de movimiento'''
+    partes = []
+    while unidades > 0:
+        tramo = min(unidades, 255)
+        partes.append(ESC + b'J' + bytes((tramo,)))
+        unidades -= tramo
+    return b''.join(partes)
+
+
+class Transporte:
+    '''Interfaz de los transportes del film'''
+    nombre = ""
+
+    @property
+    def abierto(self):
+        return True
+
+    def abrir(self, ruta):
+        pass
+
+    def cerrar(self):
+        pass
+
+    def avanzar(self, puntos):
+        raise NotImplementedError
+
+    def retroceder(self):
+        raise NotImplementedError
+
+    def reiniciar(self):
+        pass
+
+    def vaciar(self):
+        '''Envía los movimientos que estén esperando; True si había alguno'''
+        return False
+
+
+class TransporteDispositivo(Transporte):
+    '''
+    Escribe los comandos en el dispositivo de la impresora con un solo write por
+    movimiento. Los comandos de avance quedan en caché por cantidad de puntos.
+    Mide la latencia de cada movimiento (hasta que el driver aceptó los bytes).
+    '''
+    def __init__(self, logger=None, ventana=500, periodo_reporte=500):
+        self.logger = logger
+        self.periodo_reporte = periodo_reporte
+        self.ruta = None
+        self._descriptor = None
+        self._lock = threading.Lock()
+        self._comandos = {}
+        self._latencias = deque(maxlen=ventana)
+        self.movimientos = 0
+        self.bytes = 0
+
+    @property
+    def abierto(self):
+        return self._descriptor is not None
+
+    def abrir(self, ruta):
+        '''Abre el dispositivo de la impresora para escritura directa'''
+        with self._lock:
+            if self._descriptor is not None:
+                os.close(self._descriptor)
+            self._descriptor = os.open(ruta, os.O_WRONLY)
+            self.ruta = ruta
+        if self.logger:
+            self.logger.info("Transporte del film %s por escritura directa en %s", self.nombre, ruta)
+
+    def cerrar(self):
+        with self._lock:
+            if self._descriptor is not None:
+                os.close(self._descriptor)
+                self._descriptor = None
+        if self.movimientos and self.logger:
+            self._reportar()
+
+    def armar_comando(self, puntos):
+        raise NotImplementedError
+
+    def comando(self, puntos):
+        '''Comando de avance de la caché (se arma la primera vez que se usa el tamaño)'''
+        datos = self._comandos.get(puntos)
+        if datos is None:
+            datos = self._comandos[puntos] = self.armar_comando(puntos)
+        return datos
+
+    def avanzar(self, puntos):
+        '''Avanza el film puntos de impresora'''
+        self.escribir(self.comando(puntos))
+
+    def retroceder(self):
+        self.escribir(RETROCESO)
+
+    def reiniciar(self):
+        self.escribir(REINICIO)
+
+    def escribir(self, datos):
+        '''Escribe un comando completo en el dispositivo y registra la latencia'''
+        with self._lock:
+            if self._descriptor is None:
+                raise RuntimeError("La impresora no está abierta")
+            inicio = time.perf_counter()
+            vista = memoryview(datos)
+            while vista:
+                escritos = os.write(self._descriptor, vista)
+                vista = vista[escritos:]
+            self._latencias.append(time.perf_counter() - inicio)
+            self.movimientos += 1
+            self.bytes += len(datos)
+            reportar = self.movimientos % self.periodo_reporte == 0
+        if reportar and self.logger:
+            self._reportar()
+
+    def estadisticas(self):
+        '''Latencias por movimiento (segundos) de la ventana reciente'''
+        with self._lock:
+            latencias = np.array(self._latencias)
+        if not len(latencias):
+            return None
+        return {
+            "movimientos": self.movimientos,
+            "p50": float(np.percentile(latencias, 50)),
+            "p99": float(np.percentile(latencias, 99)),
+            "maxima": float(latencias.max()),
+            "comandos": len(self._comandos),
+        }
+
+    def _reportar(self):
+        datos = self.estadisticas()
+        if datos:
+            self.logger.info(
+                "Impresora (%s): %d movimientos, latencia p50 %.2f ms, p99 %.2f ms, máxima %.2f ms, "
+                "%d comandos en caché",
+                self.nombre, datos["movimientos"], datos["p50"] * 1000, datos["p99"] * 1000,
+                datos["maxima"] * 1000, datos["comandos"]
+            )
+
+
+class TransporteRaster(TransporteDispositivo):
+    '''Avanza imprimiendo una imagen en blanco (el método original)'''
+    nombre = "raster"
+
+    def armar_comando(self, puntos):
+        return comando_avance(puntos)
+
+
+class TransporteAvancePapel(TransporteDispositivo):
+    '''Avanza con ESC J n (avance de papel nativo), sin imagen'''
+    nombre = "avance_papel"
+
+    def __init__(self, unidades_por_punto=1, **kwargs):
+        super().__init__(**kwargs)
+        self.unidades_por_punto = unidades_por_punto
+
+    def armar_comando(self, puntos):
+        return comando_avance_papel(round(puntos * self.unidades_por_punto))
+
+
+class TransporteAgrupado(Transporte):
+    '''
+    Envuelve otro transporte y junta los avances que llegan dentro de una ventana corta
+    en un solo comando de la suma de puntos: menos transferencias USB y menos arranques
+    y frenadas del motor. Quien va a mirar el film (vista previa, disparo) llama a vaciar()
+    antes; si nadie lo hace, un temporizador envía lo pendiente al cerrar la ventana.
+    '''
+    def __init__(self, interno, ventana=0.015, logger=None, periodo_reporte=500):
+        self.interno = interno
+        self.nombre = interno.nombre
+        self.ventana = ventana
+        self.logger = logger
+        self.periodo_reporte = periodo_reporte
+        self._lock = threading.RLock()
+        self._pendientes = 0
+        self._temporizador = None
+        self.pedidos = 0 # avances pedidos
+        self.enviados = 0 # comandos de avance enviados
+
+    @property
+    def abierto(self):
+        return self.interno.abierto
+
+    def abrir(self, ruta):
+        self.interno.abrir(ruta)
+
+    def cerrar(self):
+        self.vaciar()
+        self.interno.cerrar()
+        if self.pedidos and self.logger:
+            self._reportar()
+
+    def avanzar(self, puntos):
+        with self._lock:
+            if not self.interno.abierto:
+                raise RuntimeError("La impresora no está abierta")
+            self._pendientes += puntos
+            self.pedidos += 1
+            if self._temporizador is None:
+                self._temporizador = threading.Timer(self.ventana, self._vaciar_temporizador)
+                self._temporizador.daemon = True
+                self._temporizador.start()
+
+    def vaciar(self):
+        '''Envía los avances pendientes en un solo comando. Devuelve True si envió algo'''
+        with self._lock:
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+                self._temporizador = None
+            puntos, self._pendientes = self._pendientes, 0
+            if puntos <= 0:
+                return False
+            self.interno.avanzar(puntos)
+            self.enviados += 1
+            reportar = self.enviados % self.periodo_reporte == 0
+        if reportar and self.logger:
+            self._reportar()
+        return True
+
+    def _vaciar_temporizador(self):
+        try:
+            self.vaciar()
+        except (RuntimeError, OSError) as e:
+            if self.logger:
+                self.logger.error("No se pudo enviar el avance agrupado: %s", e)
+
+    def retroceder(self):
+        with self._lock:
+            self.vaciar()
+            self.interno.retroceder()
+
+    def reiniciar(self):
+        with self._lock:
+            self.vaciar()
+            self.interno.reiniciar()
+
+    def estadisticas(self):
+        return self.interno.estadisticas()
+
+    def _reportar(self):
+        self.logger.info(
+            "Transporte agrupado: %d avances pedidos en %d comandos (%.1f por comando)",
+            self.pedidos, self.enviados, self.pedidos / max(self.enviados, 1)
+        )
+
+
+TRANSPORTES = {
+    TransporteRaster.nombre: TransporteRaster,
+    TransporteAvancePapel.nombre: TransporteAvancePapel,
+}
+
+
+def crear_transporte(nombre, logger=None, **opciones):
+    '''Transporte por nombre ("raster" o "avance_papel")'''
+    try:
+        clase = TRANSPORTES[nombre]
+    except KeyError:
+        raise ValueError(f"Transporte desconocido: {nombre} (opciones: {', '.join(TRANSPORTES)})") from None
+    return clase(logger=logger, **opciones)
@@ -0,0 +1,751 @@
+# Este archivo es parte de digitalizadora-films
+#
+# Este software está licenciado bajo la Licencia Pública General GNU v3.0 o superior.
+# Una copia de la licencia se incluye en el archivo `LICENSE` de este directorio.
+# También está disponible en línea en: <https://www.gnu.org/licenses/gpl-3.0.html>.
+
+'''
+Análisis de la perforación del film sobre la vista previa de la cámara.
+
+No depende de Kivy ni de gphoto2, así lo pueden usar tanto la aplicación
+como los benchmarks.
+'''
+
+import math
+import time
+from collections import deque, namedtuple
+
+import cv2
+import numpy as np
+
+# Perforación visible en la franja de la zona: filas [inicio, fin) y píxeles blancos por fila
+Perforacion = namedtuple("Perforacion", ["inicio", "fin", "blancos_por_fila"])
+
+
+class AnalizadorPerforacion:
+    '''
+    Cuenta los píxeles blancos de la zona de la perforación.
+    Recorta primero la zona de análisis y calcula la luminancia solo sobre esos
+    píxeles; el gris y el umbral se escriben en buffers preasignados.
+    '''
+    def __init__(self, zona=(0, 0, 0, 0), umbral_grey=245, umbral_px_blancos=0):
+        self.zona_xi = self.zona_xf = self.zona_yi = self.zona_yf = 0
+        self.umbral_grey = umbral_grey
+        self.umbral_px_blancos = umbral_px_blancos
+        self.gris = None
+        self.binaria = None # último umbral calculado (para depuración)
+        self.alto_preview = 0
+        self.perforaciones = [] # las de la última vista previa analizada
+        self._gris_franja = None
+        self._binaria_franja = None
+        self._perfil = None
+        self.configurar(zona, umbral_grey, umbral_px_blancos)
+
+    def configurar(self, zona, umbral_grey, umbral_px_blancos):
+        '''Define la zona (xi, xf, yi, yf) y los umbrales; reserva los buffers'''
+        self.zona_xi, self.zona_xf, self.zona_yi, self.zona_yf = (int(v) for v in zona)
+        self.umbral_grey = umbral_grey
+        self.umbral_px_blancos = umbral_px_blancos
+
+        alto = max(self.zona_yf - self.zona_yi, 0)
+        ancho = max(self.zona_xf - self.zona_xi, 0)
+        self.gris = np.empty((alto, ancho), dtype=np.uint8)
+        self.binaria = np.empty((alto, ancho), dtype=np.uint8)
+
+    def contar_blancos(self, image_rgb):
+        '''Cantidad de píxeles de la zona por encima de umbral_grey'''
+        zona = image_rgb[self.zona_yi:self.zona_yf, self.zona_xi:self.zona_xf]
+        if zona.size == 0:
+            return 0
+
+        # Si la vista previa es más chica que la zona, OpenCV reserva otro buffer
+        gris = cv2.cvtColor(zona, cv2.COLOR_RGB2GRAY, dst=self.gris)
+        _, binaria = cv2.threshold(gris, self.umbral_grey, 255, cv2.THRESH_BINARY, dst=self.binaria)
+        self.binaria = binaria
+        return cv2.countNonZero(binaria)
+
+    def esta_alineada(self, cantidad_blanco):
+        '''La perforación está alineada si supera el umbral de píxeles blancos'''
+        return cantidad_blanco > self.umbral_px_blancos
+
+    def perfil_franja(self, image_rgb):
+        '''
+        Píxeles blancos por fila en la franja de la zona (las columnas de la zona a lo
+        largo de toda la vista previa, que es el eje por el que se mueve el film).
+        '''
+        franja = image_rgb[:, self.zona_xi:self.zona_xf]
+        alto, ancho = franja.shape[:2]
+        if self._perfil is None or self._gris_franja.shape != (alto, ancho):
+            self._gris_franja = np.empty((alto, ancho), dtype=np.uint8)
+            self._binaria_franja = np.empty((alto, ancho), dtype=np.uint8)
+            self._perfil = np.empty((alto, 1), dtype=np.int32)
+        self.alto_preview = alto
+
+        cv2.cvtColor(franja, cv2.COLOR_RGB2GRAY, dst=self._gris_franja)
+        cv2.threshold(self._gris_franja, self.umbral_grey, 1, cv2.THRESH_BINARY, dst=self._binaria_franja)
+        cv2.reduce(self._binaria_franja, 1, cv2.REDUCE_SUM, dst=self._perfil, dtype=cv2.CV_32S)
+        return self._perfil[:, 0]
+
+    def localizar_perforaciones(self, image_rgb, fraccion_fila=0.5, filas_minimas=3):
+        '''
+        Devuelve las perforaciones visibles en la franja, de arriba hacia abajo.
+        Una fila es de perforación si al menos fraccion_fila de su ancho es blanco.
+        '''
+        perfil = self.perfil_franja(image_rgb)
+        ancho = self.zona_xf - self.zona_xi
+        if ancho <= 0 or perfil.size == 0:
+            return []
+
+        es_perforacion = np.concatenate(([False], perfil >= fraccion_fila * ancho, [False]))
+        cambios = np.flatnonzero(np.diff(es_perforacion.astype(np.int8)))
+        perforaciones = []
+        for inicio, fin in zip(cambios[::2], cambios[1::2]):
+            if fin - inicio >= filas_minimas:
+                blancos = float(np.median(perfil[inicio:fin]))
+                perforaciones.append(Perforacion(int(inicio), int(fin), blancos))
+        self.perforaciones = perforaciones
+        return perforaciones
+
+    def paso_perforaciones(self, perforaciones=None):
+        '''Distancia en píxeles entre perforaciones completas consecutivas, o None si hay menos de dos'''
+        if perforaciones is None:
+            perforaciones = self.perforaciones
+        centros = sorted(
+            (p.inicio + p.fin) / 2.0 for p in perforaciones if p.inicio > 0 and p.fin < self.alto_preview
+        )
+        if len(centros) < 2:
+            return None
+        return float(np.median(np.diff(centros)))
+
+    def filas_necesarias(self, perforacion):
+        '''Filas de la perforación que deben entrar en la zona para superar el umbral'''
+        if perforacion.blancos_por_fila <= 0:
+            return self.zona_yf - self.zona_yi
+        filas = math.ceil((self.umbral_px_blancos + 1) / perforacion.blancos_por_fila)
+        return min(filas, self.zona_yf - self.zona_yi)
+
+
+class PredictorAvance:
+    '''
+    Estima cuántos puntos de impresora hay que avanzar para que el borde de la
+    perforación entre en la zona de análisis, en lugar de avanzar de a un punto.
+
+    Aprende cuántos píxeles se desplaza la imagen por punto comparando la posición
+    de las perforaciones antes y después de cada movimiento. Mientras no está
+    calibrado devuelve 1 punto, igual que el ajuste fino.
+
+    Si la próxima perforación todavía no entró en la vista previa, estima el avance
+    con los puntos que hubo entre los últimos bloqueos (el paso entre perforaciones).
+    '''
+    def __init__(self, px_por_punto=None, minimo_calibracion=5, margen=0.1,
+                 maximo_puntos=120, ventana=40, logger=None):
+        self.px_por_punto = px_por_punto
+        self.minimo_calibracion = minimo_calibracion # puntos medidos antes de confiar
+        self.margen = margen # fracción que se deja para el ajuste fino
+        self.maximo_puntos = maximo_puntos
+        self.logger = logger
+
+        self._mediciones = deque(maxlen=ventana) # (desplazamiento_px, puntos)
+        self._centros_previos = None
+        self._puntos_pendientes = 0
+
+        # Paso entre perforaciones en puntos, medido entre bloqueos consecutivos
+        self.paso_puntos = None
+        self._pasos = deque(maxlen=9)
+        self._puntos_desde_bloqueo = None # None hasta el primer bloqueo
+
+    @property
+    def calibrado(self):
+        return self.px_por_punto is not None and abs(self.px_por_punto) > 1e-3
+
+    def registrar_movimiento(self, puntos):
+        '''Avisa que el film avanzó (cualquier avance: ajuste, frame o manual)'''
+        self._puntos_pendientes += puntos
+        if self._puntos_desde_bloqueo is not None:
+            self._puntos_desde_bloqueo += puntos
+
+    def registrar_bloqueo(self, perforaciones=1):
+        '''
+        Avisa que una perforación quedó alineada. perforaciones: cuántas pasaron desde el
+        bloqueo anterior (más de una si se avanzó un cuadro completo); el paso se guarda
+        por perforación para no mezclarlo con el de un cuadro.
+        '''
+        if self._puntos_desde_bloqueo:
+            self._pasos.append(self._puntos_desde_bloqueo / perforaciones)
+            if len(self._pasos) >= 3:
+                self.paso_puntos = float(np.median(self._pasos))
+        self._puntos_desde_bloqueo = 0
+
+    def invalidar(self):
+        '''Olvida la última observación (por ejemplo, después de retroceder)'''
+        self._centros_previos = None
+        self._puntos_pendientes = 0
+        self._puntos_desde_bloqueo = None
+
+    def observar(self, perforaciones, alto_preview):
+        '''Mide el desplazamiento desde la observación anterior y actualiza la calibración'''
+        # Solo las perforaciones completas tienen un centro confiable
+        centros = [(p.inicio + p.fin) / 2.0 for p in perforaciones if p.inicio > 0 and p.fin < alto_preview]
+
+        puntos = self._puntos_pendientes
+        if self._centros_previos and centros and puntos > 0:
+            desplazamiento = self._desplazamiento(self._centros_previos, centros, puntos)
+            if desplazamiento is not None:
+                self._mediciones.append((desplazamiento, puntos))
+                total_puntos = sum(n for _, n in self._mediciones)
+                if total_puntos >= self.minimo_calibracion:
+                    anterior = self.px_por_punto
+                    self.px_por_punto = sum(d for d, _ in self._mediciones) / total_puntos
+                    if anterior is None and self.logger:
+                        self.logger.info("Predictor calibrado: %.2f px por punto", self.px_por_punto)
+
+        self._centros_previos = centros
+        self._puntos_pendientes = 0
+
+    def _desplazamiento(self, previos, actuales, puntos):
+        '''Desplazamiento en píxeles de la misma perforación entre dos observaciones'''
+        if self.calibrado:
+            esperado = puntos * self.px_por_punto
+            tolerancia = max(4.0, 0.25 * abs(esperado))
+        elif puntos <= 3:
+            # Sin calibrar solo se confía en movimientos chicos (la más cercana es la misma)
+            esperado = 0.0
+            tolerancia = None
+        else:
+            return None
+
+        mejor = None
+        for previo in previos:
+            for actual in actuales:
+                residuo = abs(actual - previo - esperado)
+                if mejor is None or residuo < mejor[0]:
+                    mejor = (residuo, actual - previo)
+        if mejor is None or (tolerancia is not None and mejor[0] > tolerancia):
+            return None
+        return mejor[1]
+
+    def puntos_a_avanzar(self, perforaciones, analizador):
+        '''Puntos a avanzar en un solo movimiento; el resto lo completa el ajuste fino'''
+        if not self.calibrado:
+            return self._por_paso()
+
+        px_por_punto = self.px_por_punto
+        alto = analizador.alto_preview
+        candidatos = []
+        for perforacion in perforaciones:
+            filas = analizador.filas_necesarias(perforacion)
+            if px_por_punto > 0:
+                # La imagen baja: entra por arriba y el borde que avanza es el inferior
+                if perforacion.fin >= alto:
+                    continue
+                distancia = analizador.zona_yi + filas - perforacion.fin
+            else:
+                if perforacion.inicio <= 0:
+                    continue
+                distancia = analizador.zona_yf - filas - perforacion.inicio
+            puntos = distancia / px_por_punto
+            if puntos > 0:
+                candidatos.append(puntos)
+
+        if not candidatos:
+            return self._por_paso()
+        return self._acotar(min(candidatos))
+
+    def puntos_por_cuadro(self, analizador, perforaciones_por_cuadro):
+        '''
+        Puntos para avanzar un cuadro completo medidos en una sola vista previa:
+        el paso entre las perforaciones visibles por la cantidad de perforaciones del
+        cuadro. Devuelve (puntos_cuadro, puntos_perforacion) o None si no se puede medir.
+        '''
+        if not self.calibrado:
+            return None
+        paso_px = analizador.paso_perforaciones()
+        if paso_px is None:
+            return None
+        puntos_perforacion = paso_px / abs(self.px_por_punto)
+        return perforaciones_por_cuadro * puntos_perforacion, puntos_perforacion
+
+    def _por_paso(self):
+        '''Estimación a ciegas con el paso entre perforaciones (1 punto si no se conoce)'''
+        if self.paso_puntos is None or self._puntos_desde_bloqueo is None:
+            return 1
+        return self._acotar(self.paso_puntos - self._puntos_desde_bloqueo)
+
+    def _acotar(self, puntos):
+        # Quedarse corto: el film no retrocede, el ajuste fino termina de a un punto
+        puntos = int(math.floor(puntos - max(1.0, math.ceil(puntos * self.margen))))
+        return min(max(puntos, 1), self.maximo_puntos)
+
+
+class VerificadorFrescura:
+    '''
+    Decide si una vista previa ya refleja el último movimiento del film.
+
+    La cámara puede entregar vistas previas tomadas antes de que el film termine de
+    moverse. Después de cada movimiento se espera al menos asentamiento_minimo y se
+    acepta la primera vista previa cuya firma (perfil de la franja) cambió respecto a
+    la anterior al movimiento. Si la firma no cambia (no hay perforación a la vista)
+    se acepta al cumplirse el límite, que se ajusta con los tiempos medidos.
+    '''
+    def __init__(self, asentamiento_minimo=0.05, asentamiento_maximo=0.25, tolerancia_px=4,
+                 filas_cambio=2, ventana=50, periodo_reporte=100, reloj=time.monotonic, logger=None):
+        self.asentamiento_minimo = asentamiento_minimo
+        self.asentamiento_maximo = asentamiento_maximo
+        self.tolerancia_px = tolerancia_px # diferencia por fila atribuible a ruido
+        self.filas_cambio = filas_cambio # filas distintas para considerar que el film se movió
+        self.periodo_reporte = periodo_reporte
+        self.logger = logger
+        self._reloj = reloj
+
+        self._firma = None
+        self._huella = None
+        self._firma_previa = None
+        self._huella_previa = None
+        self._instante_movimiento = None
+        self._capturas = 0
+
+        # (segundos, capturas, detectado_por_cambio) de cada paso
+        self.mediciones = deque(maxlen=ventana)
+        self.pasos = 0
+
+    def registrar_movimiento(self):
+        '''Avisa que el film se movió: la próxima vista previa válida debe ser posterior'''
+        self._firma_previa = self._firma
+        self._huella_previa = self._huella
+        self._instante_movimiento = self._reloj()
+        self._capturas = 0
+
+    def espera_restante(self):
+        '''Segundos que faltan para el asentamiento mínimo del último movimiento'''
+        if self._instante_movimiento is None:
+            return 0.0
+        return max(0.0, self.asentamiento_minimo - (self._reloj() - self._instante_movimiento))
+
+    def limite_espera(self):
+        '''Espera máxima por paso: 1.5 veces el p90 medido, dentro del rango configurado'''
+        tiempos = [t for t, _, por_cambio in self.mediciones if por_cambio]
+        if len(tiempos) < 5:
+            return self.asentamiento_maximo
+        medido = 1.5 * float(np.percentile(tiempos, 90))
+        return min(max(medido, self.asentamiento_minimo), self.asentamiento_maximo)
+
+    def es_fresca(self, firma, huella=None):
+        '''
+        firma: perfil de la franja de la vista previa; huella: hash de los bytes del JPEG.
+        True si la vista previa se puede usar para analizar la alineación.
+        '''
+        self._firma = None if firma is None else np.array(firma, dtype=np.int32)
+        self._huella = huella
+        if self._instante_movimiento is None:
+            return True
+
+        self._capturas += 1
+        transcurrido = self._reloj() - self._instante_movimiento
+        if transcurrido < self.asentamiento_minimo:
+            return False
+
+        cambio = self._cambio_firma(huella)
+        if not cambio and transcurrido < self.limite_espera():
+            return False
+
+        self._instante_movimiento = None
+        self._registrar(transcurrido, cambio)
+        return True
+
+    def _cambio_firma(self, huella):
+        if huella is not None and huella == self._huella_previa:
+            return False # la cámara devolvió el mismo cuadro
+        if self._firma is None or self._firma_previa is None or self._firma.shape != self._firma_previa.shape:
+            return False
+        distintas = np.count_nonzero(np.abs(self._firma - self._firma_previa) > self.tolerancia_px)
+        return bool(distintas >= self.filas_cambio)
+
+    def _registrar(self, segundos, por_cambio):
+        self.mediciones.append((segundos, self._capturas, por_cambio))
+        self.pasos += 1
+        if self.logger and self.pasos % self.periodo_reporte == 0:
+            tiempos = [t for t, _, _ in self.mediciones]
+            capturas = [c for _, c, _ in self.mediciones]
+            self.logger.info(
+                "Asentamiento vista previa: %.0f ms promedio, p90 %.0f ms, %.1f capturas por paso, límite %.0f ms",
+                np.mean(tiempos) * 1000, np.percentile(tiempos, 90) * 1000,
+                np.mean(capturas), self.limite_espera() * 1000
+            )
+
+
+class ControladorAvance:
+    '''
+    Ajusta el avance en bloque que se hace después de cada perforación alineada
+    (printer_pattern) con las correcciones que necesitó la perforación siguiente.
+
+    El paso real entre perforaciones se mide de bloqueo a bloqueo solo cuando hubo
+    correcciones: si no las hubo, el film pudo quedar más adentro de la zona. Cuando
+    la perforación se alinea con la primera vista previa el avance baja un poco, así
+    la posición de bloqueo no se va corriendo hacia el final de la zona.
+    El avance fraccionario se reparte en puntos enteros acumulando el resto.
+    '''
+    def __init__(self, patron, descenso=0.05, ventana=15, tolerancia=0.25,
+                 largo_patron=10, bloqueos_entre_guardados=25, logger=None):
+        self.patron = [int(p) for p in patron] or [1]
+        self.avance = float(np.mean(self.patron))
+        self.descenso = descenso
+        self.tolerancia = tolerancia # diferencia relativa con la mediana para descartar un paso
+        self.largo_patron = largo_patron
+        self.bloqueos_entre_guardados = bloqueos_entre_guardados
+        self.logger = logger
+
+        self._pasos = deque(maxlen=ventana)
+        self._rechazos = 0
+        self._resto = 0.0
+        self._ultimo_avance = None # None si el próximo bloqueo no se puede medir
+        self._correcciones = 0
+        self._patron_guardado = list(self.patron)
+        self._bloqueos_sin_guardar = 0
+
+        self.bloqueos = 0
+        self.al_primer_intento = 0
+
+    def sugerir(self, avance, tolerancia_puntos, margen=0.05):
+        '''
+        Avance estimado por otro medio (por ejemplo, el paso medido en la imagen).
+        Se usa, quedándose corto, si todavía no hay pasos medidos o si lo aprendido
+        difiere en más de tolerancia_puntos.
+        '''
+        if self._pasos and abs(self.avance - avance) <= tolerancia_puntos:
+            return
+        if self._pasos and self.logger:
+            self.logger.warning("Avance aprendido %.1f lejos del medido %.1f, se reinicia", self.avance, avance)
+        self._pasos.clear()
+        self._resto = 0.0
+        self.avance = max(1.0, avance * (1.0 - margen))
+
+    def invalidar(self):
+        '''El próximo bloqueo no se mide (inicio, pausa o movimiento manual)'''
+        self._ultimo_avance = None
+        self._correcciones = 0
+
+    def proximo_avance(self):
+        '''Puntos del próximo avance en bloque'''
+        self._resto += self.avance
+        puntos = max(int(math.floor(self._resto)), 1)
+        self._resto -= puntos
+        self._ultimo_avance = puntos
+        self._correcciones = 0
+        return puntos
+
+    def registrar_correccion(self, puntos):
+        '''Puntos de ajuste fino que se movieron antes de alinear'''
+        self._correcciones += puntos
+
+    def registrar_bloqueo(self):
+        '''Actualiza el avance; devuelve True si hay un patrón nuevo para guardar'''
+        if self._ultimo_avance is None:
+            return False
+        avance, correcciones = self._ultimo_avance, self._correcciones
+        self._ultimo_avance = None
+        self.bloqueos += 1
+        self._bloqueos_sin_guardar += 1
+
+        if correcciones == 0:
+            self.al_primer_intento += 1
+            self.avance = max(1.0, self.avance - self.descenso)
+        else:
+            paso = avance + correcciones
+            if self._pasos:
+                mediana = float(np.median(self._pasos))
+                if abs(paso - mediana) > self.tolerancia * mediana:
+                    # Probablemente se pasó una perforación; tras varios seguidos se reaprende
+                    self._rechazos += 1
+                    if self.logger:
+                        self.logger.warning("Paso descartado: %s puntos (mediana %.1f)", paso, mediana)
+                    if self._rechazos < 3:
+                        return False
+                    self._pasos.clear()
+            self._rechazos = 0
+            self._pasos.append(paso)
+            self.avance = float(np.mean(self._pasos))
+
+        self.patron = self.calcular_patron()
+        if self.patron != self._patron_guardado and self._bloqueos_sin_guardar >= self.bloqueos_entre_guardados:
+            self._patron_guardado = list(self.patron)
+            self._bloqueos_sin_guardar = 0
+            if self.logger:
+                self.logger.info("Patrón de avance aprendido: %s (%.2f puntos, %d/%d al primer intento)",
+                                 self.patron, self.avance, self.al_primer_intento, self.bloqueos)
+            return True
+        return False
+
+    def calcular_patron(self):
+        '''El avance actual repartido en largo_patron avances enteros'''
+        return [
+            int(math.floor((i + 1) * self.avance)) - int(math.floor(i * self.avance))
+            for i in range(self.largo_patron)
+        ]
+
+
+class AlineadorPerforacion:
+    '''
+    Lazo de alineación de la perforación. Lo usan CamApp, la simulación y la
+    reproducción de sesiones, así los benchmarks miden el mismo código que digitaliza.
+
+    alinear() decide con una vista previa si la perforación está alineada y, si no,
+    mueve el film lo que estima el predictor (de a un punto sin predictor).
+    alinear_cuadro() repite hasta alinear la perforación del cuadro, contando las
+    perforaciones en los formatos con varias por cuadro, y avance_siguiente() da el
+    avance en bloque: de una perforación o, después de la foto, del cuadro completo.
+
+    mover(puntos) mueve el film (impresora o transporte simulado) y avisa al predictor.
+    al_decidir(imagen, cantidad_blanco, perforaciones, alineada, puntos) y
+    al_aprender_patron() son opcionales (depuración, grabación, guardar el patrón).
+    '''
+    def __init__(self, analizador, mover, predictor=None, max_intentos=100, avance_fijo=1, logger=None):
+        self.analizador = analizador
+        self.mover = mover
+        self.max_intentos = max_intentos
+        self.avance_fijo = avance_fijo # avance en bloque si no hay controlador
+        self.logger = logger
+        self.al_decidir = None
+        self.al_aprender_patron = None
+        self.tiempos_decision = None # lista para medir el CPU de cada decisión (segundos)
+
+        self.predictor = predictor
+        self.controlador_perforacion = None
+        # Avance de un cuadro completo medido en la vista previa (None: contar perforaciones)
+        self.controlador_cuadro = None
+        self.controlador = None
+        self.cantidad_perforaciones = 1
+        self.primer_foto = True
+        self.avance_por_cuadro = False
+        # Perforaciones que avanza el film hasta el próximo bloqueo (para el predictor)
+        self.perforaciones_desde_bloqueo = 1
+        # Puntos de ajuste fino del cuadro en curso
+        self.puntos_correccion = 0
+        # Última decisión: (alineada, puntos, cantidad_blanco)
+        self.ultima_decision = None
+
+    def configurar(self, cantidad_perforaciones, controlador_perforacion=None, controlador_cuadro=None,
+                   predictor=None):
+        '''Formato a digitalizar: perforaciones por cuadro, controladores y predictor'''
+        self.cantidad_perforaciones = cantidad_perforaciones
+        self.controlador_perforacion = controlador_perforacion
+        self.controlador_cuadro = controlador_cuadro
+        if predictor is not None:
+            self.predictor = predictor
+        self.primer_foto = True
+        self.invalidar()
+
+    def invalidar(self):
+        '''El film pudo moverse a mano (inicio o pausa): el próximo bloqueo no se mide'''
+        self.avance_por_cuadro = False
+        self.controlador = self.controlador_perforacion
+        self.perforaciones_desde_bloqueo = 1
+        for controlador in (self.controlador_perforacion, self.controlador_cuadro):
+            if controlador:
+                controlador.invalidar()
+        if self.predictor:
+            self.predictor.invalidar()
+
+    def alinear(self, image_rgb):
+        '''
+        Detecta si la perforación está alineada.
+        Si no lo está, estima dónde está el borde de la perforación y avanza en un
+        solo movimiento lo necesario; el último tramo se ajusta de a un punto.
+        '''
+        inicio = time.process_time()
+        cantidad_blanco = self.analizador.contar_blancos(image_rgb)
+
+        # Perforaciones visibles en la franja de la zona (calibran el predictor)
+        perforaciones = []
+        if self.predictor:
+            perforaciones = self.analizador.localizar_perforaciones(image_rgb)
+            self.predictor.observar(perforaciones, self.analizador.alto_preview)
+
+        alineada = self.analizador.esta_alineada(cantidad_blanco)
+        if alineada:
+            puntos = 0
+        elif self.predictor:
+            puntos = self.predictor.puntos_a_avanzar(perforaciones, self.analizador)
+        else:
+            puntos = 1
+        self.ultima_decision = (alineada, puntos, cantidad_blanco)
+        if self.tiempos_decision is not None:
+            self.tiempos_decision.append(time.process_time() - inicio)
+
+        if self.logger:
+            self.logger.info("Píxeles blancos detectados en zona: %s", cantidad_blanco)
+        if self.al_decidir:
+            self.al_decidir(image_rgb, cantidad_blanco, perforaciones, alineada, puntos)
+
+        if alineada:
+            if self.logger:
+                self.logger.info("Perforación alineada.")
+            if self.predictor:
+                self.predictor.registrar_bloqueo(self.perforaciones_desde_bloqueo)
+            self.perforaciones_desde_bloqueo = 1
+            if self.controlador and self.controlador.registrar_bloqueo() and self.al_aprender_patron:
+                self.al_aprender_patron()
+            return True
+
+        if puntos > 1 and self.logger:
+            self.logger.info("Avance predictivo: %s puntos", puntos)
+        self.mover(puntos)
+        if self.controlador:
+            self.controlador.registrar_correccion(puntos)
+        self.puntos_correccion += puntos
+        return False
+
+    def avance_siguiente(self, fin_de_cuadro=False):
+        '''
+        Puntos del avance en bloque después de una perforación alineada.
+        En 35mm, después de la foto, si la vista previa muestra al menos dos
+        perforaciones completas se avanza el cuadro entero en un solo movimiento
+        (paso medido por perforaciones del cuadro) en lugar de contarlas una a una.
+        '''
+        self.avance_por_cuadro = False
+        self.controlador = self.controlador_perforacion
+        if fin_de_cuadro and self.controlador_cuadro and self.predictor and self.cantidad_perforaciones > 1:
+            medido = self.predictor.puntos_por_cuadro(self.analizador, self.cantidad_perforaciones + 1)
+            if medido:
+                puntos_cuadro, puntos_perforacion = medido
+                self.controlador_cuadro.sugerir(puntos_cuadro, 0.5 * puntos_perforacion)
+                self.controlador = self.controlador_cuadro
+                self.avance_por_cuadro = True
+                if self.logger:
+                    self.logger.info("Avance de cuadro completo: %.1f puntos", puntos_cuadro)
+        self.perforaciones_desde_bloqueo = self.cantidad_perforaciones + 1 if self.avance_por_cuadro else 1
+        if not self.controlador:
+            return self.avance_fijo
+        return self.controlador.proximo_avance()
+
+    def alinear_cuadro(self, capturar):
+        '''
+        Alinea la perforación del próximo cuadro. capturar() devuelve la vista previa
+        posterior al último movimiento, o None si la cámara no respondió.
+        Devuelve (alineado, vistas previas pedidas).
+        '''
+        intentos = 0
+        # Si el último avance fue de un cuadro completo no hace falta contar perforaciones
+        contador_perforaciones = self.cantidad_perforaciones if self.avance_por_cuadro else 0
+        self.puntos_correccion = 0
+
+        while intentos < self.max_intentos:
+            imagen = capturar()
+            if imagen is None:
+                if self.logger:
+                    self.logger.error("No se pudo capturar la vista previa.")
+                intentos += 1
+                continue
+
+            if self.alinear(imagen):
+                if contador_perforaciones == self.cantidad_perforaciones or self.primer_foto:
+                    # Con una perforación por cuadro cada bloqueo es un cuadro
+                    if self.cantidad_perforaciones > 1:
+                        self.primer_foto = False
+                    return True, intentos + 1
+                contador_perforaciones += 1
+                if self.logger:
+                    self.logger.info("Perforación %s/%s alineada, avanzando film...",
+                                     contador_perforaciones, self.cantidad_perforaciones)
+                self.mover(self.avance_siguiente())
+
+            # Solo log cada 10 intentos para no saturar
+            if intentos % 10 == 0 and self.logger:
+                self.logger.debug("Perforación no alineada, moviendo film...")
+            intentos += 1
+
+        if self.logger:
+            self.logger.warning("No se logró alinear la perforación.")
+        return False, intentos
+
+
+class ProgramadorLimpieza:
+    '''
+    Decide cuándo limpiar la impresora según cómo se viene alineando el film, en
+    lugar de cada cantidad fija de cuadros.
+
+    Los primeros cuadros después de una limpieza dan la referencia: intentos hasta
+    alinear y puntos de corrección por cuadro. Después se compara la ventana reciente
+    con esa referencia. Si la deriva supera umbral_urgente o fallan fallos_urgentes
+    bloqueos en la ventana hay que limpiar ya; si supera umbral_conveniente se
+    aprovecha la próxima pausa. maximo_cuadros es el tope si la deriva es lenta.
+    '''
+    def __init__(self, cuadros_referencia=50, ventana=50, minimo_ventana=20, umbral_conveniente=1.3,
+                 umbral_urgente=1.8, fallos_urgentes=3, maximo_cuadros=2000, piso=1.0,
+                 periodo_reporte=100, logger=None):
+        self.cuadros_referencia = cuadros_referencia
+        self.minimo_ventana = minimo_ventana
+        self.umbral_conveniente = umbral_conveniente
+        self.umbral_urgente = umbral_urgente
+        self.fallos_urgentes = fallos_urgentes
+        self.maximo_cuadros = maximo_cuadros
+        self.piso = piso # evita que una referencia sin correcciones vuelva enorme la deriva
+        self.periodo_reporte = periodo_reporte
+        self.logger = logger
+
+        self._referencia = [] # (intentos, correcciones) de los primeros cuadros
+        self._recientes = deque(maxlen=ventana) # (intentos, correcciones, alineado)
+        self.cuadros = 0 # desde la última limpieza
+        self.avisado = False
+
+    def limpiada(self):
+        '''La impresora se limpió: se vuelve a tomar la referencia'''
+        self._referencia = []
+        self._recientes.clear()
+        self.cuadros = 0
+        self.avisado = False
+
+    def registrar_cuadro(self, intentos, correcciones, alineado=True):
+        '''Resultado de alinear un cuadro: vistas previas analizadas y puntos de ajuste fino'''
+        self.cuadros += 1
+        if alineado and len(self._referencia) < self.cuadros_referencia:
+            self._referencia.append((intentos, correcciones))
+        else:
+            self._recientes.append((intentos, correcciones, alineado))
+        if self.logger and self.cuadros % self.periodo_reporte == 0:
+            self.reportar()
+
+    def referencia_lista(self):
+        return len(self._referencia) >= self.cuadros_referencia
+
+    def fallos(self):
+        return sum(1 for _, _, alineado in self._recientes if not alineado)
+
+    def deriva(self):
+        '''
+        Cociente entre la ventana reciente y la referencia (la peor de intentos y
+        correcciones), o None si todavía no hay datos suficientes.
+        '''
+        alineados = [(i, c) for i, c, alineado in self._recientes if alineado]
+        if not self.referencia_lista() or len(alineados) < self.minimo_ventana:
+            return None
+        referencia = np.mean(self._referencia, axis=0)
+        recientes = np.mean(alineados, axis=0)
+        return float(np.max((recientes + self.piso) / (referencia + self.piso)))
+
+    def necesita_limpieza(self):
+        '''Motivo por el que hay que limpiar ya, o None'''
+        if self.fallos() >= self.fallos_urgentes:
+            return f"{self.fallos()} bloqueos fallidos en los últimos {len(self._recientes)} cuadros"
+        deriva = self.deriva()
+        if deriva is not None and deriva >= self.umbral_urgente:
+            return f"deriva de alineación {deriva:.2f} veces la referencia"
+        if self.cuadros >= self.maximo_cuadros:
+            return f"{self.cuadros} cuadros desde la última limpieza"
+        return None
+
+    def conviene_limpiar(self):
+        '''True una sola vez cuando la deriva pasó el umbral conveniente (para la próxima pausa)'''
+        if self.avisado:
+            return False
+        deriva = self.deriva()
+        if deriva is None or deriva < self.umbral_conveniente:
+            return False
+        self.avisado = True
+        return True
+
+    def reportar(self):
+        deriva = self.deriva()
+        self.logger.info(
+            "Limpieza de impresora: %d cuadros desde la última, deriva %s, %d bloqueos fallidos recientes",
+            self.cuadros, "sin referencia" if deriva is None else f"{deriva:.2f}", self.fallos()
+        )
@@ -0,0 +1,220 @@
+# Este archivo es parte de digitalizadora-films
+#
+# Este software está licenciado bajo la Licencia Pública General GNU v3.0 o superior.
+# Una copia de la licencia se incluye en el archivo `LICENSE` de este directorio.
+# También está disponible en línea en: <https://www.gnu.org/licenses/gpl-3.0.html>.
+
+'''
+Simulación del film y del transporte para medir la alineación sin cámara ni impresora.
+'''
+
+import numpy as np
+
+from impresora import Transporte
+from perforacion import AlineadorPerforacion, AnalizadorPerforacion, ControladorAvance, PredictorAvance
+
+# Geometría de cada formato en la vista previa (960x640) y en puntos de impresora
+FORMATOS_SIMULADOS = {
+    "16mm": {
+        "preview": (640, 960),
+        "zona": (200, 290, 160, 240),
+        "umbral_grey": 245,
+        "umbral_px_blancos": 2400,
+        "cantidad_perforaciones": 1,
+        "paso_px": 600.0, # distancia entre perforaciones a lo largo del film
+        "alto_perforacion": 83,
+        "columnas_perforacion": (185, 305),
+        "px_por_punto": 12.0,
+        "avance_frame": 10, # printer_pattern_16mm
+    },
+    "35mm": {
+        "preview": (640, 960),
+        "zona": (175, 250, 70, 155),
+        "umbral_grey": 245,
+        "umbral_px_blancos": 1850,
+        "cantidad_perforaciones": 3,
+        "paso_px": 210.0,
+        "alto_perforacion": 60,
+        "columnas_perforacion": (165, 262),
+        "px_por_punto": 9.1,
+        "avance_frame": 22, # printer_pattern_35mm
+    },
+}
+
+# Condiciones del film para el benchmark (opciones de TiraSintetica)
+ESCENARIOS = {
+    "limpio": {"ruido": 0.0},
+    "ruido": {"ruido": 12.0},
+    "deriva": {"ruido": 6.0, "deriva_exposicion": 0.03},
+    "dañadas": {"ruido": 6.0, "danadas": 0.1},
+}
+
+# Modelo de tiempos del equipo para estimar frames por minuto (segundos)
+TIEMPO_PREVIEW = 0.04 # captura y transferencia de una vista previa
+TIEMPO_MOVIMIENTO = 0.03 # comando de la impresora
+TIEMPO_PUNTO = 0.002 # por punto avanzado
+TIEMPO_ASENTAMIENTO = 0.05 # espera antes de la vista previa después de mover
+TIEMPO_DISPARO = 0.25 # capture() hasta que termina la exposición
+TIEMPO_TRANSFERENCIA = 0.25 # evento del JPG, file_get y file_delete
+TIEMPO_ESCRITURA = 0.1 # guardar el JPG y prepararlo para la interfaz
+
+
+class TiraSintetica:
+    '''
+    Genera vistas previas de una tira de film con perforaciones blancas sobre fondo oscuro.
+    deriva_exposicion: amplitud relativa de la variación de brillo a lo largo del film.
+    danadas: fracción de perforaciones dañadas (solo se ve blanca una parte del alto).
+    '''
+    def __init__(self, preview, paso_px, alto_perforacion, columnas_perforacion, ruido=6.0, semilla=0,
+                 deriva_exposicion=0.0, periodo_deriva=4000.0, danadas=0.0, alto_danada=0.55):
+        self.alto, self.ancho = preview
+        self.paso_px = paso_px
+        self.alto_perforacion = alto_perforacion
+        self.columnas_perforacion = columnas_perforacion
+        self.ruido = ruido
+        self.deriva_exposicion = deriva_exposicion
+        self.periodo_deriva = periodo_deriva
+        self.danadas = danadas
+        self.alto_danada = alto_danada
+        self.semilla = semilla
+        self._generador = np.random.default_rng(semilla)
+        # Fondo fijo (imagen del fotograma) para no regenerarlo en cada vista previa
+        self._fondo = self._generador.integers(40, 170, size=(self.alto, self.ancho, 3)).astype(np.int16)
+        self._filas = np.arange(self.alto)
+        # Unas pocas capas de ruido de sensor que se alternan (generarlo cada vez es lento)
+        self._ruidos = [
+            self._generador.normal(0, ruido, size=self._fondo.shape).astype(np.int16)
+            for _ in range(4)
+        ] if ruido else []
+        self._indice_ruido = 0
+
+    def filas_perforacion(self, posicion_px):
+        '''Máscara de las filas cubiertas por perforación para una posición del film'''
+        desplazadas = self._filas - posicion_px
+        fase = np.mod(desplazadas, self.paso_px)
+        filas = fase < self.alto_perforacion
+        if self.danadas:
+            # Número de perforación de cada fila; el daño es fijo para cada perforación
+            indice = np.floor_divide(desplazadas, self.paso_px).astype(np.int64)
+            azar = ((indice * 2654435761 + self.semilla * 97) % 1000) / 1000.0
+            danada = azar < self.danadas
+            filas &= ~danada | (fase < self.alto_perforacion * self.alto_danada)
+        return filas
+
+    def renderizar(self, posicion_px):
+        '''Vista previa RGB para la posición del film (en píxeles de imagen)'''
+        imagen = self._fondo.copy()
+        if self._ruidos:
+            self._indice_ruido = (self._indice_ruido + 1) % len(self._ruidos)
+            imagen += self._ruidos[self._indice_ruido]
+        xi, xf = self.columnas_perforacion
+        filas = self.filas_perforacion(posicion_px)
+        imagen[filas, xi:xf] = 255
+        if self.deriva_exposicion:
+            ganancia = 1.0 + self.deriva_exposicion * np.sin(2 * np.pi * posicion_px / self.periodo_deriva)
+            imagen = imagen * ganancia
+        return np.clip(imagen, 0, 255).astype(np.uint8)
+
+
+class TransporteSimulado(Transporte):
+    '''
+    Transporte sin impresora (misma interfaz que los de impresora.py): modela la
+    posición del film, cada punto de impresora la desplaza px_por_punto píxeles.
+    '''
+    nombre = "simulado"
+
+    def __init__(self, px_por_punto, posicion_px=0.0):
+        self.px_por_punto = px_por_punto
+        self.posicion_px = posicion_px
+        self.movimientos = 0
+        self.puntos = 0
+
+    def avanzar(self, puntos=1):
+        self.posicion_px += puntos * self.px_por_punto
+        self.movimientos += 1
+        self.puntos += puntos
+
+    def retroceder(self):
+        self.posicion_px -= self.px_por_punto
+        self.movimientos += 1
+        self.puntos -= 1
+
+
+class FuenteSintetica:
+    '''Vista previa de la tira en la posición actual del transporte (hace de cámara)'''
+    def __init__(self, tira, transporte):
+        self.tira = tira
+        self.transporte = transporte
+        self.capturas = 0
+
+    def capturar(self):
+        self.capturas += 1
+        return self.tira.renderizar(self.transporte.posicion_px)
+
+
+class AlineacionSimulada:
+    '''
+    Corre el lazo de alineación de capture_frame (AlineadorPerforacion) sobre la tira
+    sintética: avanza de a un punto (o lo que indique el predictor) hasta superar el
+    umbral y, en 35mm, cuenta perforaciones antes de disparar.
+    Con adaptativo el avance en bloque lo aprende un ControladorAvance y, con
+    multiperforacion, el avance de un cuadro completo se mide en una sola vista previa.
+    Con canalizado el film avanza durante la transferencia del JPG y la escritura
+    queda fuera del lazo (solo cambia el tiempo estimado).
+    '''
+    def __init__(self, formato, predictivo=False, adaptativo=False, multiperforacion=False,
+                 canalizado=False, semilla=0, max_intentos=100, paso_px=None, **opciones_tira):
+        datos = FORMATOS_SIMULADOS[formato]
+        self.datos = datos
+        self.formato = formato
+        self.tira = TiraSintetica(
+            datos["preview"], paso_px or datos["paso_px"], datos["alto_perforacion"],
+            datos["columnas_perforacion"], semilla=semilla, **opciones_tira
+        )
+        self.transporte = TransporteSimulado(datos["px_por_punto"], posicion_px=semilla * 37.0)
+        self.fuente = FuenteSintetica(self.tira, self.transporte)
+        self.analizador = AnalizadorPerforacion(datos["zona"], datos["umbral_grey"], datos["umbral_px_blancos"])
+        self.predictor = PredictorAvance() if predictivo else None
+        self.canalizado = canalizado
+        self.segundos = 0.0 # tiempo estimado del equipo con el modelo de tiempos
+
+        self.alineador = AlineadorPerforacion(
+            self.analizador, self.mover, self.predictor, max_intentos=max_intentos,
+            avance_fijo=datos["avance_frame"]
+        )
+        # CPU por llamada a alinear (segundos)
+        self.tiempos_decision = self.alineador.tiempos_decision = []
+        multiperforacion = multiperforacion and predictivo and adaptativo
+        self.alineador.configurar(
+            datos["cantidad_perforaciones"],
+            ControladorAvance([datos["avance_frame"]]) if adaptativo else None,
+            ControladorAvance([datos["avance_frame"]]) if multiperforacion else None
+        )
+
+    def mover(self, puntos):
+        self.transporte.avanzar(puntos)
+        self.segundos += TIEMPO_MOVIMIENTO + puntos * TIEMPO_PUNTO + TIEMPO_ASENTAMIENTO
+        if self.predictor:
+            self.predictor.registrar_movimiento(puntos)
+
+    def _capturar_preview(self):
+        self.segundos += TIEMPO_PREVIEW
+        return self.fuente.capturar()
+
+    def capturar_frame(self):
+        '''Un frame completo: alineación y avance posterior. Devuelve (intentos, alineado)'''
+        alineado, intentos = self.alineador.alinear_cuadro(self._capturar_preview)
+        if not alineado:
+            return intentos, False
+        self.segundos += TIEMPO_DISPARO
+        antes = self.segundos
+        self.mover(self.alineador.avance_siguiente(fin_de_cuadro=True))
+        if self.canalizado:
+            self.segundos = antes + max(self.segundos - antes, TIEMPO_TRANSFERENCIA)
+        else:
+            self.segundos += TIEMPO_TRANSFERENCIA + TIEMPO_ESCRITURA
+        return intentos, True
+
+    def rollo(self, cuadros):
+        '''Simula un rollo y devuelve la lista de intentos por frame'''
+        return [self.capturar_frame()[0] for _ in range(cuadros)]